@@ -1,13 +1,12 @@
 from dateutil.relativedelta import relativedelta, TH
 from datetime import datetime
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from .nse_data import NSEData
-from .plotting import Plots
+from .plotting import Plots, plt, sns
+from .lazy import LazyObject
 
 NSE = NSEData()
-PLT = Plots()
+PLT = LazyObject(Plots)
 
 
 def get_next_expiry_date(expiry_type:str = 'monthly'):
@@ -0,0 +1,212 @@
+'''
+Concurrent NSE client built on asyncio. Requests go through one pooled connection per host (bounded), a token bucket so that NSE is not hit faster
+than it allows, a cookie refresh when NSE answers 401 / 403 and retries with jittered exponential backoff. Parsing is the same as NSEData so the
+results are identical, only many of them can be in flight at once. Example:
+    frames = open_nse_indices(['NIFTY IT', 'NIFTY AUTO'], show_n = 9999)
+or inside a coroutine:
+    async with AsyncNSEData() as nse:
+        df = await nse.open_nse_index('NIFTY 50')
+'''
+import asyncio
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+from .lazy import LazyModule
+from .nse_data import NSEData
+from .rate_limit import TokenBucket
+
+aiohttp = LazyModule('aiohttp') # Optional. Only needed for the concurrent client
+
+
+class AsyncNSEData(NSEData):
+    '''
+    Async version of NSEData. Use it as "async with AsyncNSEData() as nse:" or call "close" once done. The session is opened on the first request.
+    current_indices_status, open_nse_index, fifty_days_data and stocks_at_52W are coroutines here. The rest such as get_live_nse_data and get_VIX
+    are the blocking ones of NSEData and keep working on their own requests session
+    '''
+    def __init__(self, baseurl:str = "https://www.nseindia.com/", max_connections:int = 8, rate:float = 5, burst:int = 10, retries:int = 4,
+                 backoff:float = 0.5, timeout:float = 20, cache_path:str = None):
+        '''
+        args:
+            baseurl: Root of the NSE website. Change it only to point to a local stand in server
+            max_connections: Maximum no of open connections at a time
+            rate: Maximum no of requests per second on average
+            burst: No of requests which can be sent at once before the rate applies
+            retries: No of times a failed request (network error, 401 / 403, 429 or 5xx) is tried again
+            backoff: Seconds to wait before the first retry. It doubles with every retry and is randomized by +/- 50% so that the retries do not come together
+            timeout: Seconds for a single request
+            cache_path: Same as NSEData
+        '''
+        super().__init__(baseurl, cache_path)
+        self.max_connections = max_connections
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._client = None # aiohttp session. "session" stays the requests one of NSEData
+        self._cookie_lock = None
+        self._cookies_at = 0 # monotonic time of the last cookie refresh
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+
+    @property
+    def client(self):
+        if self._client is None:
+            connector = aiohttp.TCPConnector(limit = self.max_connections, limit_per_host = self.max_connections)
+            jar = aiohttp.CookieJar(unsafe = True) # Also keep the cookies of an IP address such as a local stand in server
+            self._client = aiohttp.ClientSession(headers = self.headers, connector = connector, cookie_jar = jar, timeout = aiohttp.ClientTimeout(total = self.timeout))
+            self._cookie_lock = asyncio.Lock()
+        return self._client
+
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client, self._cookies_at = None, 0
+            self.bucket._lock = None # Locks belong to the event loop they were first used in
+
+
+    async def _refresh_cookies(self, seen:float):
+        '''
+        Visit the home page to get fresh cookies. Many requests may find the cookies expired at once but only the first one refreshes them
+        args:
+            seen: Time of the cookies the request was sent with
+        '''
+        session = self.client
+        async with self._cookie_lock:
+            if self._cookies_at > seen:
+                return
+            await self.bucket.acquire()
+            async with session.get(self.baseurl) as response:
+                await response.read()
+            self._cookies_at = monotonic()
+
+
+    async def fetch_json(self, url:str, max_age:float = None):
+        '''
+        Get the JSON of any NSE API. Async counterpart of NSEData.get_live_nse_data. Same url within its time to live is served from the cache
+        args:
+            url: corresponding url
+            max_age: Same as NSEData.get_live_nse_data
+        returns: Parsed JSON
+        '''
+        cached = self.cache.fresh(url, max_age)
+        if cached:
+            return json.loads(cached[1])
+
+        if not self._cookies_at:
+            await self._refresh_cookies(0)
+
+        for attempt in range(self.retries + 1):
+            seen = self._cookies_at
+            await self.bucket.acquire()
+            try:
+                async with self.client.get(url, headers = self.cache.validators(url, max_age)) as response:
+                    if response.status == 304:
+                        return json.loads(self.cache.revalidated(url)[1])
+                    if response.status < 400:
+                        content = await response.read()
+                        self.cache.put(url, response.headers, content, max_age)
+                        return json.loads(content)
+                    error = f"{response.status} {response.reason} for {url}"
+                    if response.status in (401, 403):
+                        await self._refresh_cookies(seen)
+                    elif response.status != 429 and response.status < 500:
+                        raise ValueError(error) # Not going to change by trying again
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__} {e} for {url}"
+
+            if attempt < self.retries:
+                await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+        raise ConnectionError(f"Failed after {self.retries + 1} attempts: {error}")
+
+
+    async def current_indices_status(self,show_n:int=5):
+        '''
+        Same as NSEData.current_indices_status
+        '''
+        return self._indices_frame(await self.fetch_json(f"{self.baseurl}api/allIndices"), show_n)
+
+
+    async def open_nse_index(self,index_name:str,show_n:int=10, drop_index:bool = True, max_age:float = None):
+        '''
+        Same as NSEData.open_nse_index
+        '''
+        return self._index_frame(await self.fetch_json(self._index_url(index_name), max_age), show_n, drop_index)
+
+
+    async def fifty_days_data(self, symbol:str):
+        '''
+        Same as NSEData.fifty_days_data
+        '''
+        return self._fifty_days_frame(await self.fetch_json(self._fifty_days_url(symbol)))
+
+
+    async def stocks_at_52W(self, direction:str = 'high' ):
+        '''
+        Same as NSEData.stocks_at_52W
+        '''
+        return self._52W_frame(await self.fetch_json(f'{self.baseurl}api/live-analysis-52Week?index={direction}'))
+
+
+    async def open_nse_indices(self, index_names:list, show_n:int = 10, drop_index:bool = True, max_age:float = None):
+        '''
+        Open many indices concurrently
+        args:
+            index_names: List of Index names such as NIFTY 50, NIFTY Bank, NIFTY-IT etc
+            show_n, drop_index, max_age: Same as open_nse_index
+        returns: Dictonary of {index name: DataFrame}
+        '''
+        frames = await asyncio.gather(*[self.open_nse_index(name, show_n, drop_index, max_age) for name in index_names])
+        return dict(zip(index_names, frames))
+
+
+    async def fifty_days_data_many(self, symbols:list):
+        '''
+        Past 50 days data of many stocks concurrently
+        args:
+            symbols: List of listed names of the stocks on NSE
+        returns: Dictonary of {symbol: DataFrame}
+        '''
+        frames = await asyncio.gather(*[self.fifty_days_data(name) for name in symbols])
+        return dict(zip(symbols, frames))
+
+
+def run(coroutine):
+    '''
+    Run a coroutine from the normal (blocking) code and return its result. Inside Jupyter, where an event loop is already running, it is run in a separate thread
+    args:
+        coroutine: Coroutine to run
+    '''
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+
+    with ThreadPoolExecutor(1) as pool:
+        return pool.submit(asyncio.run, coroutine).result()
+
+
+def open_nse_indices(index_names:list, show_n:int = 10, drop_index:bool = True, max_age:float = None, cache = None, **kwargs):
+    '''
+    Blocking call to open many indices concurrently. See AsyncNSEData.open_nse_indices
+    args:
+        index_names, show_n, drop_index, max_age: Same as AsyncNSEData.open_nse_indices
+        cache: ResponseCache to share such as the one of a NSEData object. Default is a new one
+        kwargs: Arguments of AsyncNSEData such as max_connections, rate, cache_path
+    '''
+    async def main():
+        async with AsyncNSEData(**kwargs) as nse:
+            nse.cache = cache or nse.cache
+            return await nse.open_nse_indices(index_names, show_n, drop_index, max_age)
+    return run(main())
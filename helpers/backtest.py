@@ -1,9 +1,87 @@
 from datetime import datetime, time
+from itertools import product
+import random
 from .investing import Investing
+from .lazy import LazyObject
+from .executor import ParallelExecutor
 from ta.trend import macd_diff
 import pandas as pd
+import numpy as np
+import warnings
 
-In = Investing()
+In = LazyObject(Investing) # Created on the first use so that importing does not read the data
+
+
+def crossed_above(x, level):
+    '''
+    Boolean array which is True where the series goes from below the level to above it. First value is always False
+    args:
+        x: numpy array (oldest first). 2D arrays (bars x symbols) are checked column wise
+        level: Number or an array of the same length
+    '''
+    cross = np.zeros(x.shape, dtype = bool)
+    cross[1:] = (x[:-1] < level) & (x[1:] > level)
+    return cross
+
+
+def crossed_below(x, level):
+    '''
+    Boolean array which is True where the series goes from above the level to below it. First value is always False
+    '''
+    cross = np.zeros(x.shape, dtype = bool)
+    cross[1:] = (x[:-1] > level) & (x[1:] < level)
+    return cross
+
+
+def latched(on, off):
+    '''
+    State which turns True at "on" and stays till "off" comes (and vice versa). Same as setting a flag inside the loop. "on" wins if both are True
+    args:
+        on: Boolean array of the events which set the state
+        off: Boolean array of the events which reset the state
+    returns: Boolean array of the state after the event of that bar
+    '''
+    rows = np.arange(len(on)).reshape((-1,) + (1,) * (on.ndim - 1)) # Works column wise for 2D arrays
+    last = np.maximum.accumulate(np.where(on | off, rows, -1), axis = 0) # Index of the latest event for every bar
+    return np.where(last >= 0, np.take_along_axis(on, np.maximum(last, 0), axis = 0), False)
+
+
+def alternate(buy, sell, square_off = None):
+    '''
+    Resolve the position from the signals. Enter at the first buy signal when there is no position and exit at the first sell signal after that
+    args:
+        buy: Boolean array of the buy signals
+        sell: Boolean array of the sell signals
+        square_off: Boolean array of the bars (end of every session) where an open position is closed at that bar itself. None for no such bars
+    returns: Three arrays. Bars where the buys and sells happened and whether the sell was a square off. There is one more buy than sells if the last position is still open
+    '''
+    buys = np.flatnonzero(buy)
+    sells = np.flatnonzero(sell)
+    ends = np.flatnonzero(square_off) if square_off is not None else np.array([], dtype = int)
+    entries, exits, squared = [], [], []
+    position = 0
+    while True:
+        i = np.searchsorted(buys, position)
+        if i == len(buys):
+            break
+        entries.append(buys[i])
+
+        start = buys[i] + 1 # Selling is checked from the next bar
+        i, j = np.searchsorted(sells, start), np.searchsorted(ends, start)
+        sell_at = sells[i] if i < len(sells) else None
+        end_at = ends[j] if j < len(ends) else None
+        if (end_at is not None) and ((sell_at is None) or (end_at <= sell_at)): # Sell signal on the last bar would sell in the next session
+            sell_at, is_end = end_at, True
+        elif sell_at is not None:
+            is_end = False
+        else:
+            break
+
+        exits.append(sell_at)
+        squared.append(is_end)
+        position = sell_at + 1
+
+    return np.array(entries, dtype = int), np.array(exits, dtype = int), np.array(squared, dtype = bool)
 
 class Backtest():
     '''
@@ -13,6 +91,11 @@ class Backtest():
         '''
         '''
         self.strategies = {'cci':self.cci, 'macd':self.macd, 'rsi': self.rsi,'ma':self.ma, "stochastic_osc":self.stochastic_osc}
+        self.vector_strategies = {'cci':self.cci_trades, 'macd':self.macd_trades, 'rsi': self.rsi_trades,'ma':self.ma_trades, "stochastic_osc":self.stochastic_osc_trades}
+        self.preparers = {'cci':self._prepare_cci, 'macd':self._prepare_macd, 'rsi':self._prepare_rsi, 'ma':self._prepare_ma, "stochastic_osc":self._prepare_stochastic_osc}
+        self.prepare_args = {'cci':('window', 'cols'), 'macd':('cols', 'window_slow', 'window_fast', 'window_sign'), 'rsi':('cols', 'window'),
+                            'ma':('cols', 'ma_type', 'window'), "stochastic_osc":('cols', 'k_period', 'd_period', 'smooth_k')} # Parameters which change the indicators. Rest only change the signals
+        self.intraday, self.square_off, self.trade_from = False, None, None # Session rules. See backtest and session_masks
 
 
     def history_init(self, name):
@@ -55,11 +138,46 @@ class Backtest():
         self.history[name]['sell_price'].append(price)
 
         self.history[name]['p&l'].append(self.history[name]['sell_price'][-1] - self.history[name]['buy_price'][-1])
-        self.history[name]['hold_period'].append((self.history[name]['sell_date'][-1] - self.history[name]['buy_date'][-1]).days)
+        self.history[name]['hold_period'].append(self.hold_period(self.history[name]['buy_date'][-1], self.history[name]['sell_date'][-1]))
 
         self.sells += 1
         self.can_buy = True
 
+
+    def hold_period(self, buy_date, sell_date):
+        '''
+        Days between buying and selling. Minutes for the intraday data
+        '''
+        if self.intraday:
+            return int((sell_date - buy_date).total_seconds() // 60)
+        return (sell_date - buy_date).days
+
+
+    def record_trades(self, name:str, dates, buy_prices, sell_prices, buy_rows, sell_rows):
+        '''
+        Add all the trades of a stock at once. Same result as calling "buy" and "sell" one by one
+        args:
+            name: SYMBOL of the Stock
+            dates: Array or Series of dates (oldest first)
+            buy_prices, sell_prices: Arrays of the prices of every buy and sell
+            buy_rows, sell_rows: Rows of the "dates" where the buys and sells happened
+        '''
+        history = self.history[name]
+        dates = pd.DatetimeIndex(dates)
+        buy_dates = list(dates[buy_rows])
+        sell_dates = list(dates[sell_rows])
+
+        history['buy_date'].extend(buy_dates)
+        history['buy_price'].extend(buy_prices)
+        history['sell_date'].extend(sell_dates)
+        history['sell_price'].extend(sell_prices)
+        history['p&l'].extend(np.asarray(sell_prices) - np.asarray(buy_prices[:len(sell_prices)]))
+        history['hold_period'].extend(self.hold_period(buy, sell) for buy, sell in zip(buy_dates, sell_dates))
+
+        self.buys += len(buy_rows)
+        self.sells += len(sell_rows)
+        self.can_buy = len(buy_rows) == len(sell_rows)
+
     
     def update_final_history(self, name:str,):
         '''
@@ -98,21 +216,35 @@ class Backtest():
         # return round(result/len(investment), 2)
 
 
-    def backtest(self, strategy:str, min_days:int = 365, top_n:int = 10, stocks:str = 'nifty_50', return_df:bool = True, **kwargs):
+    def backtest(self, strategy:str, min_days:int = None, top_n:int = 10, stocks:str = 'nifty_50', return_df:bool = True, vectorized:bool = True,
+                 kind:str = 'daily', intraday:bool = None, square_off:time = None, sessions:int = 20, warmup:int = 500, **kwargs):
         '''
         Test the strategies based on the given Buy and Sell Criteria
         args:
             strategy: Name of the strategy to backtest. See 'BackTest.strategies' for all available strageies 
-            min_days: Minimum no of days for a stock to be present at the stock market. Stock newer than these many Trading days will be discarded
+            min_days: Minimum no of days for a stock to be present at the stock market. Stock newer than these many Trading days will be discarded. Default is 365 for the daily data and 0 for the minutes data
             top_n: How many top values to return. Number between 1-1886 or 'all'
             stocks: Select from [nifty_50, nifty_200, nifty_500, all] or a list of stocks to choose from such as ["INFY","SBIN"] or ["HDFC"]
             cols: Columns that contains the Open, close, low, high
             window: Look back period to calculate the CCI
             return_df: Whether to return the DataFrame
+            vectorized: Find all the trades of a stock at once using arrays instead of going through the DataFrame row by row. Results are the same
+            kind: "daily" or any of the minutes data [minutes_2, minutes_3, minutes_4, minutes_5, minutes_15, minutes_30, minutes_60]. See DataHandler.open_downloaded_stock
+            intraday: Square off every position at the end of the session so nothing is carried overnight. Default is True for the minutes data. Hold period is in minutes then
+            square_off: Time such as datetime.time(15, 15) after which positions are squared off and no new position is taken. Default is the last bar of the session
+            sessions: Intraday data is read these many sessions at a time so that the memory stays bounded. None reads the whole file at once
+            warmup: No of bars before every piece of "sessions" which are used only to calculate the indicators
 
         returns: A dictonary of top-n stocks which gave highest win%
         '''
-        buy_sell_logic = self.strategies[strategy]
+        self.intraday = (kind != 'daily') if intraday is None else intraday
+        self.square_off, self.trade_from = square_off, None
+        if self.intraday and not vectorized:
+            warnings.warn("Session rules are only in the vectorized engine. Using it")
+            vectorized = True
+
+        buy_sell_logic = self.vector_strategies[strategy] if vectorized else self.strategies[strategy]
+        min_days = min_days if min_days is not None else (365 if kind == 'daily' else 0)
         self.history = {}
 
         if isinstance(stocks,str):
@@ -123,23 +255,48 @@ class Backtest():
 
     
         for name in data:
-            df = In.open_downloaded_stock(name)
-            if df.shape[0] >= min_days: # Most stocks are atleast 407 days old on an average
-                
-                self.history_init(name)
-                self.history[name]['days'] = df.shape[0]
-                self.buys = 0
-                self.sells = 0
-                self.can_buy = True
-                
-                df.sort_index(ascending=False, inplace = True) # Sort the dataframe
-
-                buy_sell_logic(name, df, **kwargs) # Use buy Sell Logic
-                self.update_final_history(name)
+            if kind == 'daily':
+                df = In.open_downloaded_stock(name)
+                if df.shape[0] < min_days: # Most stocks are atleast 407 days old on an average
+                    continue
+                pieces = [(df, None)]
+            elif self.intraday and sessions: # No position is carried from one piece to the next
+                pieces = In.iter_downloaded_stock(name, kind, sessions, warmup)
+            else:
+                pieces = [(In.open_downloaded_stock(name, kind = kind), None)]
+
+            self.history_init(name)
+            self.buys = 0
+            self.sells = 0
+            self.can_buy = True
+            days = 0
+            try:
+                for df, self.trade_from in pieces:
+                    if kind != 'daily':
+                        df = df.dropna(axis = 1, how = 'all') # 52W H and 52W L are empty in the minutes data. Would drop all the rows otherwise
+                        dates = df['DATE'].dt.normalize()
+                        days += dates[dates >= self.trade_from].nunique() if self.trade_from is not None else dates.nunique()
+                    else:
+                        days += df.shape[0]
+
+                    df.sort_index(ascending=False, inplace = True) # Sort the dataframe
+                    buy_sell_logic(name, df, **kwargs) # Use buy Sell Logic
+
+            except (FileNotFoundError, AttributeError): # AttributeError when open_downloaded_stock could not open the file
+                print(f"Unable to Open {kind} data of {name}")
+                days = -1
+
+            if days < min_days:
+                del self.history[name]
+                continue
+            self.history[name]['days'] = days
+            self.update_final_history(name)
 
 
         x = pd.DataFrame(self.history).T
         x = x.loc[x['sells']>0,:] # No need for those where no sell has been made. Won't be able to produce any win%. Division by Zero error
+        if x.empty: # apply() on an empty DataFrame gives a DataFrame instead of a column
+            return x
         # x['Total P&L'] = x['p&l'].apply(lambda x: sum(x))
         x['ROI'] = x.apply(lambda row: self.calculate_ROI(row),axis=1)
         x['wins'] = x['p&l'].apply(lambda x: sum([True if i >0 else False for i in x]))
@@ -151,6 +308,194 @@ class Backtest():
         return x.iloc[:top_n,[-1,-3,-2,-4,4,0,1,2,3,5,7,8,6]] # just shuffling of columns on "first thing first" basis
 
 
+    def _combinations(self, grid:dict, n_iter:int = None, seed:int = 0):
+        '''
+        All the combinations of the grid or "n_iter" of them picked at random
+        '''
+        keys = list(grid)
+        combos = [dict(zip(keys, values)) for values in product(*[grid[key] for key in keys])]
+        if n_iter and n_iter < len(combos):
+            combos = random.Random(seed).sample(combos, n_iter)
+        return combos
+
+
+    def _sweep_table(self, names:list, results:list, by_stock:bool = False):
+        '''
+        Stats of every combination (or every combination and stock) from the results of "_sweep_stock" for a single date range
+        args:
+            names: List of stocks
+            results: List of (list of stats of every combination) for every stock
+            by_stock: Keep a row for every stock
+        returns: DataFrame indexed by the combination no, or with a "combo" column when "by_stock"
+        '''
+        rows = [(i, name, *stats) for name, stock in zip(names, results) for i, stats in enumerate(stock)]
+        x = pd.DataFrame(rows, columns = ['combo', 'SYMBOL', 'buys', 'sells', 'wins', 'p&l', 'investment', 'hold_period'])
+        x = x.loc[x['sells'] > 0, :]
+
+        if not by_stock:
+            x = x.groupby('combo').agg(Stocks = ('SYMBOL', 'count'), buys = ('buys', 'sum'), sells = ('sells', 'sum'), wins = ('wins', 'sum'),
+                                        investment = ('investment', 'sum'), hold_period = ('hold_period', 'sum'), **{'p&l': ('p&l', 'sum')})
+
+        x['ROI'] = round((x['p&l'] / x['investment']) * 100, 2)
+        x['losses'] = x['sells'] - x['wins']
+        x['win%'] = round(x['wins'] / x['sells'], 2)
+        x['Avg Hold'] = round(x['hold_period'] / x['sells'], 1)
+        return x
+
+
+    def sweep(self, strategy:str, grid:dict, stocks = 'nifty_50', n_iter:int = None, seed:int = 0, min_days:int = 365, by_stock:bool = False, workers:int = None, **kwargs):
+        '''
+        Backtest a strategy for many combinations of its parameters. Every stock is loaded once and the indicators are calculated once
+        for all the combinations which only change the thresholds. Stocks are split across the worker processes
+        args:
+            strategy: Name of the strategy. See 'BackTest.strategies'
+            grid: Dictonary of {parameter: list of values} such as {'buying_thresh':[-150, -100], 'selling_thresh':[100, 150], 'window':[14, 20]}
+            stocks: Select from [nifty_50, nifty_200, nifty_500, all] or a list of stocks
+            n_iter: Random search. Test only these many combinations picked at random from the grid. None tests all of them
+            seed: Seed of the random search
+            min_days: Same as in "backtest"
+            by_stock: Return a row for every (combination, stock) instead of a row for every combination
+            workers: No of processes. See ParallelExecutor. Workers read the stocks of the panel loaded with In.get_panel from it
+            kwargs: Fixed parameters of the strategy
+        returns: DataFrame with the parameters, Trades, Wins, Losses, win% and ROI sorted from the best to the worst
+        '''
+        if isinstance(stocks,str):
+            data = In.data['all_stocks'] if stocks == 'all' else In.data[stocks]
+        else: data = stocks
+
+        names = list(data)
+        combos = self._combinations(grid, n_iter, seed)
+        params = [{**kwargs, **combo} for combo in combos]
+
+        self.history, self.intraday = {}, False # Not needed by the workers. Daily data only
+        results = ParallelExecutor(workers, panel = In._panel).map(self, '_sweep_stock', names, strategy, params, min_days)
+        x = self._sweep_table(names, [stock[0] if stock else [] for stock in results], by_stock)
+
+        combo = x.index if not by_stock else x['combo']
+        columns = pd.DataFrame([combos[i] for i in combo], index = x.index)
+        other = ['SYMBOL'] if by_stock else ['Stocks']
+        x = pd.concat([columns, x[other + ['win%', 'ROI', 'wins', 'losses', 'sells', 'buys', 'Avg Hold']]], axis = 1)
+        return x.sort_values(['win%', 'ROI'], ascending = False).reset_index(drop = True)
+
+
+    def walk_forward(self, strategy:str, grid:dict, stocks = 'nifty_50', train_months:int = 6, test_months:int = 3, start = None, end = None,
+                     n_iter:int = None, seed:int = 0, min_trades:int = 10, min_days:int = 365, workers:int = None, **kwargs):
+        '''
+        Walk Forward test. History is split in rolling windows of (train, test). Parameters with the best win% (then ROI) on the train part
+        are tested on the next test part which was not seen while choosing them. Windows move ahead by the length of the test part.
+        Indicators of every stock are calculated once on the full history (they only look back) and shared by all the windows
+        args:
+            strategy: Name of the strategy. See 'BackTest.strategies'
+            grid: Dictonary of {parameter: list of values}. Same as in "sweep"
+            stocks: Select from [nifty_50, nifty_200, nifty_500, all] or a list of stocks
+            train_months: Length of the train part of every window
+            test_months: Length of the test part of every window
+            start: Start date of the first window. Default is the oldest date in the data
+            end: Last date. Default is the latest date in the data
+            n_iter, seed: Random search. Same as in "sweep"
+            min_trades: Combinations with less trades than this in the train part are not chosen
+            min_days: Same as in "backtest"
+            workers: No of processes. See ParallelExecutor. Workers read the stocks of the panel loaded with In.get_panel from it
+            kwargs: Fixed parameters of the strategy
+        returns: Tuple of (DataFrame with the chosen parameters, Train and Test stats of every window, Dictonary of the Test stats of all the windows together)
+        '''
+        if isinstance(stocks,str):
+            data = In.data['all_stocks'] if stocks == 'all' else In.data[stocks]
+        else: data = stocks
+
+        names = list(data)
+        combos = self._combinations(grid, n_iter, seed)
+        params = [{**kwargs, **combo} for combo in combos]
+
+        if start is None: # Oldest date of the data so that the first train part is not empty
+            start = min((date for date in map(In.store.first_date, names) if date is not None), default = pd.Timestamp.today())
+        if end is None: # Latest date of the data so that there is no window without data for testing
+            end = max((date for date in map(In.store.last_date, names) if date is not None), default = pd.Timestamp.today()) + pd.Timedelta(days = 1)
+        end = pd.Timestamp(end)
+        windows = []
+        train_start = pd.Timestamp(start)
+        while train_start + pd.DateOffset(months = train_months) < end:
+            test_start = train_start + pd.DateOffset(months = train_months)
+            windows.append((train_start, test_start, min(test_start + pd.DateOffset(months = test_months), end)))
+            train_start += pd.DateOffset(months = test_months)
+
+        if len(windows) < 2:
+            raise ValueError(f"Only {len(windows)} window(s) of {train_months} + {test_months} months fit between {pd.Timestamp(start).date()} and {end.date()}. "
+                             "Use shorter train_months / test_months or a longer range of data")
+
+        ranges = [(train, test) for train, test, _ in windows] + [(test, test_end) for _, test, test_end in windows]
+        self.history, self.intraday = {}, False # Not needed by the workers. Daily data only
+        results = ParallelExecutor(workers, panel = In._panel).map(self, '_sweep_stock', names, strategy, params, min_days, ranges)
+        table = lambda i: self._sweep_table(names, [stock[i] if stock else [] for stock in results])
+
+        rows, tested = [], []
+        for i, (train_start, test_start, test_end) in enumerate(windows):
+            train = table(i)
+            train = train.loc[train['sells'] >= min_trades].sort_values(['win%', 'ROI'], ascending = False)
+            if train.empty:
+                continue
+
+            best = train.index[0]
+            test = table(len(windows) + i)
+            test = test.loc[best] if best in test.index else None
+            if test is not None:
+                tested.append(test)
+
+            rows.append({'Train Start': train_start, 'Test Start': test_start, 'Test End': test_end, **combos[best],
+                         'Train win%': train.loc[best, 'win%'], 'Train ROI': train.loc[best, 'ROI'], 'Train Trades': train.loc[best, 'sells'],
+                         'Test win%': test['win%'] if test is not None else np.nan, 'Test ROI': test['ROI'] if test is not None else np.nan,
+                         'Test Trades': test['sells'] if test is not None else 0})
+
+        tested = pd.DataFrame(tested)
+        summary = {'Windows': len(rows), 'Trades': int(tested['sells'].sum()) if len(tested) else 0,
+                   'win%': round(tested['wins'].sum() / tested['sells'].sum(), 2) if len(tested) else np.nan,
+                   'ROI': round(tested['p&l'].sum() / tested['investment'].sum() * 100, 2) if len(tested) else np.nan,
+                   'Avg Hold': round(tested['hold_period'].sum() / tested['sells'].sum(), 1) if len(tested) else np.nan}
+        return pd.DataFrame(rows), summary
+
+
+    def _sweep_stock(self, name:str, strategy:str, params:list, min_days:int, ranges:list = None):
+        '''
+        Run all the parameter combinations of "sweep" on a single stock
+        args:
+            ranges: List of (start, end) dates. Trades are found separately inside each of them, using the indicators of the full history. None is the full history
+        returns: For every range, a list of (buys, sells, wins, total p&l, investment, total hold period) for each combination. Empty if the stock is too new
+        '''
+        df = In.open_downloaded_stock(name)
+        if df.shape[0] < min_days:
+            return []
+        df.sort_index(ascending = False, inplace = True)
+
+        prepare, trades = self.preparers[strategy], self.vector_strategies[strategy]
+        prepared = {}
+        stats = [[] for _ in (ranges or [None])]
+        for kwargs in params:
+            prepare_kwargs = {key: kwargs[key] for key in self.prepare_args[strategy] if key in kwargs}
+            key = repr(sorted(prepare_kwargs.items()))
+            if key not in prepared: # Indicators are shared by all the combinations with the same values of these parameters
+                prepared[key] = prepare(df.copy(), **prepare_kwargs)
+            full = prepared[key]
+            dates = full[kwargs.get('cols', ('DATE',))[-1]].values
+
+            for i, date_range in enumerate(ranges or [None]):
+                if date_range is None:
+                    part = full
+                else:
+                    first, last = np.searchsorted(dates, np.datetime64(date_range[0])), np.searchsorted(dates, np.datetime64(date_range[1]))
+                    part = full.iloc[first:last].reset_index(drop = True)
+
+                self.history = {}
+                self.history_init(name)
+                self.buys, self.sells, self.can_buy = 0, 0, True
+                trades(name, part, prepared = True, **kwargs)
+
+                history = self.history[name]
+                pnl = history['p&l']
+                stats[i].append((self.buys, self.sells, sum(value > 0 for value in pnl), float(sum(pnl)), float(sum(history['buy_price'][:self.sells])), sum(history['hold_period'])))
+
+        return stats
+
+
     def cci(self, name, df, buying_thresh:float = -100, selling_thresh:float = 100, window:int = 20, cols = ('OPEN','CLOSE','LOW','HIGH', 'DATE')):
         '''
         Test CCI Stratedy. Buy next day when CCI comes above buying_threshold and sell next day when it goes below sell_threshold
@@ -166,16 +511,7 @@ class Backtest():
         returns: A dictonary of top-n stocks which gave highest returns
         '''
         OPEN, CLOSE, LOW, HIGH, DATE = cols
-
-        df = In.get_MA(df, window = 50, names = (OPEN, CLOSE, LOW, HIGH), return_df = True)
-        df = In.get_MA(df, window = 200, names = (OPEN, CLOSE, LOW, HIGH), return_df = True)
-
-        df = In.get_CCI(df, window = window, names = cols, return_df = True)
-        
-    
-        df.dropna(inplace = True)
-        df.sort_index(ascending = False,inplace = True)
-        df.reset_index(inplace = True, drop = True)
+        df = self._prepare_cci(df, window, cols)
 
         for index in df.index[1:-1]:
             if (df.loc[index-1,'CCI'] < buying_thresh) and (df.loc[index,'CCI'] > buying_thresh) and (self.can_buy) and \
@@ -208,15 +544,7 @@ class Backtest():
         returns: A dictonary of top-n stocks which gave highest returns
         '''
         OPEN, CLOSE, LOW, HIGH, DATE = cols
-
-        df = In.get_MA(df, window = 200, names = (OPEN, CLOSE, LOW, HIGH), return_df = True)
-
-        df = In.get_RSI(df,return_df = True)
-
-        df.dropna(inplace = True)
-        df.sort_index(ascending = False,inplace = True)
-        df.reset_index(inplace = True, drop = True)
-
+        df = self._prepare_rsi(df, cols, window)
 
         for index in df.index[1:-1]:
             if (df.loc[index-1,'RSI'] < buying_thresh) and (df.loc[index,'RSI'] > buying_thresh) and (self.can_buy) and \
@@ -247,12 +575,7 @@ class Backtest():
         returns: A dictonary of top-n stocks which gave highest returns
         '''
         OPEN, CLOSE, LOW, HIGH, DATE = cols
-      
-        df['MACD Diff'] = macd_diff(df[CLOSE], window_slow = window_slow, window_fast = window_fast, window_sign = window_sign) # Get MACD DIfference
-        
-        df.sort_index(ascending=False, inplace = True) # Sort Again from oldest to newest
-        df.dropna(inplace=True) # Drop the oldest ones
-        df.reset_index(inplace=True,drop=True)
+        df = self._prepare_macd(df, cols, window_slow, window_fast, window_sign)
 
         for index in df.index[1:-1]: # Has to consider Past and Future candle  so [1:-1] 
             if (df.loc[index-1,'MACD Diff'] < 0) and (df.loc[index,'MACD Diff'] > 0) and (self.can_buy): # Buy means to decrease the account value
@@ -275,16 +598,7 @@ class Backtest():
             r2r: Risk to Reward Ratio 1:2 means if the risk is of 1 rupee, then exit only after gaining 2rupees
         '''
         OPEN, CLOSE, LOW, HIGH, DATE = cols
-        simple = True if ma_type == 'simple' else False
-
-        df = In.get_MA(df, window = window, names = (OPEN, CLOSE, LOW, HIGH), simple = simple, return_df = True)
-        df = In.get_MA(df, window = 200, names = (OPEN, CLOSE, LOW, HIGH), simple = simple, return_df = True)
-        df = In.get_RSI(df, Close = CLOSE, return_df = True)
-
-        df.sort_index(ascending=False, inplace = True) # Sort Again from oldest to newest
-        df.dropna(inplace=True) # Drop the oldest ones
-        df.reset_index(inplace=True,drop=True)
-
+        df = self._prepare_ma(df, cols, ma_type, window)
 
         for index in df.index[1:-1]: # start from second entry because we have to consider that -> stop loss is lowest of current OR current
             if (df.loc[index,CLOSE] > df.loc[index,OPEN]) and (df.loc[index,CLOSE] > df.loc[index,f"{window}-MA"]) and \
@@ -336,14 +650,7 @@ class Backtest():
         returns: A dictonary of top-n stocks which gave highest returns
         '''
         OPEN, CLOSE, LOW, HIGH, DATE = cols
-      
-        df = In.get_MA(df, window = 200, names = (OPEN, CLOSE, LOW, HIGH), return_df = True) # Buy Only Over 200-MA Closing
-        df = In.Stochastic(df, k_period, d_period, smooth_k, names=(OPEN, CLOSE, LOW, HIGH), return_df=True) # Get Values of Stochastic Blue and Red Line
-        df['Diff'] = df['Red Line'] - df['Blue Line']
-        
-        df.sort_index(ascending=False, inplace = True) # Sort Again from oldest to newest
-        df.dropna(inplace=True) # Drop the oldest ones which are NaN-s
-        df.reset_index(inplace=True,drop=True)
+        df = self._prepare_stochastic_osc(df, cols, k_period, d_period, smooth_k)
 
         buy_lock = False
         sell_lock = False
@@ -371,3 +678,250 @@ class Backtest():
 
             elif (not self.can_buy) and (sell_lock) and (df.loc[index,'Red Line'] < selling_thresh): # Sell only when both the lines are below the selling threshold
                 self.sell(name, date = df.loc[index+1, DATE], price = df.loc[index+1,OPEN])
+
+
+    def _prepare_cci(self, df, window:int = 20, cols:tuple = ('OPEN','CLOSE','LOW','HIGH', 'DATE')):
+        '''
+        Add 50-MA, 200-MA and CCI. Returns the DataFrame from oldest to newest with NaN rows removed
+        '''
+        OPEN, CLOSE, LOW, HIGH, DATE = cols
+
+        df = In.get_MA(df, window = 50, names = (OPEN, CLOSE, LOW, HIGH), return_df = True)
+        df = In.get_MA(df, window = 200, names = (OPEN, CLOSE, LOW, HIGH), return_df = True)
+
+        df = In.get_CCI(df, window = window, names = cols, return_df = True)
+        
+    
+        df.dropna(inplace = True)
+        df.sort_index(ascending = False,inplace = True)
+        df.reset_index(inplace = True, drop = True)
+        return df
+
+
+    def _prepare_rsi(self, df, cols:tuple = ('OPEN','CLOSE','LOW','HIGH', 'DATE'), window:int = 14):
+        '''
+        Add 200-MA and RSI. Returns the DataFrame from oldest to newest with NaN rows removed
+        '''
+        OPEN, CLOSE, LOW, HIGH, DATE = cols
+
+        df = In.get_MA(df, window = 200, names = (OPEN, CLOSE, LOW, HIGH), return_df = True)
+
+        df = In.get_RSI(df, return_df = True)
+
+        df.dropna(inplace = True)
+        df.sort_index(ascending = False,inplace = True)
+        df.reset_index(inplace = True, drop = True)
+        return df
+
+
+    def _prepare_macd(self, df, cols:tuple = ('OPEN','CLOSE','LOW','HIGH', 'DATE'), window_slow:int = 26, window_fast:int = 12, window_sign:int = 9):
+        '''
+        Add MACD Diff. Returns the DataFrame from oldest to newest with NaN rows removed
+        '''
+        OPEN, CLOSE, LOW, HIGH, DATE = cols
+      
+        df['MACD Diff'] = macd_diff(df[CLOSE], window_slow = window_slow, window_fast = window_fast, window_sign = window_sign) # Get MACD DIfference
+        
+        df.sort_index(ascending=False, inplace = True) # Sort Again from oldest to newest
+        df.dropna(inplace=True) # Drop the oldest ones
+        df.reset_index(inplace=True,drop=True)
+        return df
+
+
+    def _prepare_ma(self, df, cols:tuple = ('OPEN','CLOSE','LOW','HIGH', 'DATE'), ma_type:str = 'simple', window:int = 44):
+        '''
+        Add the window-MA, 200-MA and RSI. Returns the DataFrame from oldest to newest with NaN rows removed
+        '''
+        OPEN, CLOSE, LOW, HIGH, DATE = cols
+        simple = True if ma_type == 'simple' else False
+
+        df = In.get_MA(df, window = window, names = (OPEN, CLOSE, LOW, HIGH), simple = simple, return_df = True)
+        df = In.get_MA(df, window = 200, names = (OPEN, CLOSE, LOW, HIGH), simple = simple, return_df = True)
+        df = In.get_RSI(df, Close = CLOSE, return_df = True)
+
+        df.sort_index(ascending=False, inplace = True) # Sort Again from oldest to newest
+        df.dropna(inplace=True) # Drop the oldest ones
+        df.reset_index(inplace=True,drop=True)
+        return df
+
+
+    def _prepare_stochastic_osc(self, df, cols:tuple = ('OPEN','CLOSE','LOW','HIGH', 'DATE'), k_period:int = 14, d_period:int = 3, smooth_k:int = 3):
+        '''
+        Add 200-MA, Blue Line, Red Line and their Diff. Returns the DataFrame from oldest to newest with NaN rows removed
+        '''
+        OPEN, CLOSE, LOW, HIGH, DATE = cols
+      
+        df = In.get_MA(df, window = 200, names = (OPEN, CLOSE, LOW, HIGH), return_df = True) # Buy Only Over 200-MA Closing
+        df = In.Stochastic(df, k_period, d_period, smooth_k, names=(OPEN, CLOSE, LOW, HIGH), return_df=True) # Get Values of Stochastic Blue and Red Line
+        df['Diff'] = df['Red Line'] - df['Blue Line']
+        
+        df.sort_index(ascending=False, inplace = True) # Sort Again from oldest to newest
+        df.dropna(inplace=True) # Drop the oldest ones which are NaN-s
+        df.reset_index(inplace=True,drop=True)
+        return df
+
+
+    def session_masks(self, dates):
+        '''
+        Session rules for the intraday data. A position is squared off at the Close of the last bar of the session (or the first bar at / after
+        "self.square_off" time) and no buy can happen on or after that bar. Bars before "self.trade_from" are only there as history for the indicators
+        args:
+            dates: Series of the dates (oldest first)
+        returns: Tuple of boolean arrays (signal bars whose next bar can be bought, square off bars) or (None, None) for the daily data
+        '''
+        if not self.intraday:
+            return None, None
+
+        dates = pd.DatetimeIndex(dates)
+        days = dates.normalize()
+        square_off = np.r_[days[1:] != days[:-1], True] # Last bar of every session
+        if self.square_off is not None:
+            square_off |= (dates.hour * 60 + dates.minute) >= (self.square_off.hour * 60 + self.square_off.minute)
+
+        can_buy = np.r_[~square_off[:-1] & ~square_off[1:], False] # Next bar must be in the same session and before the square off
+        if self.trade_from is not None:
+            can_buy &= days >= self.trade_from
+        return can_buy, square_off
+
+
+    def _next_open_trades(self, name:str, df, buy, sell, cols:tuple):
+        '''
+        Trades of the strategies which act at the Open of the next day of the signal. Intraday positions are squared off at the Close. See "session_masks"
+        args:
+            name: Name of the stock
+            df: Prepared DataFrame (oldest first)
+            buy, sell: Boolean arrays of signals
+            cols: Columns that contains the Open, close, low, high, date
+        '''
+        OPEN, CLOSE, LOW, HIGH, DATE = cols
+        buy[[0, -1]] = sell[[0, -1]] = False # Every signal needs the previous and the next candle
+        can_buy, square_off = self.session_masks(df[DATE])
+        if can_buy is not None:
+            buy &= can_buy
+
+        entries, exits, squared = alternate(buy, sell, square_off)
+        opens, closes = df[OPEN].values, df[CLOSE].values
+        next_bar = np.minimum(exits + 1, len(df) - 1)
+        sell_prices = np.where(squared, closes[exits], opens[next_bar])
+        self.record_trades(name, df[DATE], list(opens[entries + 1]), list(sell_prices), entries + 1, np.where(squared, exits, exits + 1))
+
+
+    def cci_trades(self, name, df, buying_thresh:float = -100, selling_thresh:float = 100, window:int = 20, cols = ('OPEN','CLOSE','LOW','HIGH', 'DATE'), prepared:bool = False):
+        '''
+        Vectorized "cci". Same args and trades. "prepared" means the df is already from the _prepare_ function
+        '''
+        OPEN, CLOSE, LOW, HIGH, DATE = cols
+        if not prepared:
+            df = self._prepare_cci(df, window, cols)
+        if len(df) < 3: return
+
+        cci, close, ma_50 = df['CCI'].values, df[CLOSE].values, df['50-MA'].values
+        buy = crossed_above(cci, buying_thresh) & (close > ma_50) & (ma_50 > df['200-MA'].values)
+        sell = crossed_below(cci, selling_thresh) | (cci > 200)
+        self._next_open_trades(name, df, buy, sell, cols)
+
+
+    def rsi_trades(self, name, df, buying_thresh:float = 30, selling_thresh:float = 70, cols = ('OPEN','CLOSE','LOW','HIGH', 'DATE'), window:int = 14, prepared:bool = False):
+        '''
+        Vectorized "rsi". Same args and trades. "prepared" means the df is already from the _prepare_ function
+        '''
+        OPEN, CLOSE, LOW, HIGH, DATE = cols
+        if not prepared:
+            df = self._prepare_rsi(df, cols, window)
+        if len(df) < 3: return
+
+        rsi = df['RSI'].values
+        buy = crossed_above(rsi, buying_thresh) & (df[CLOSE].values > df['200-MA'].values)
+        sell = crossed_below(rsi, selling_thresh) | (rsi > 80)
+        self._next_open_trades(name, df, buy, sell, cols)
+
+
+    def macd_trades(self, name, df, cols = ('OPEN','CLOSE','LOW','HIGH', 'DATE'), window_slow:int = 26, window_fast:int = 12, window_sign:int = 9, prepared:bool = False):
+        '''
+        Vectorized "macd". Same args and trades. "prepared" means the df is already from the _prepare_ function
+        '''
+        if not prepared:
+            df = self._prepare_macd(df, cols, window_slow, window_fast, window_sign)
+        if len(df) < 3: return
+
+        diff = df['MACD Diff'].values
+        self._next_open_trades(name, df, crossed_above(diff, 0), crossed_below(diff, 0), cols)
+
+
+    def stochastic_osc_trades(self,name, df, k_period:int = 14, d_period:int = 3, smooth_k = 3, buying_thresh:int = 20, selling_thresh:int =  80, cols = ('OPEN','CLOSE','LOW','HIGH', 'DATE'), prepared:bool = False):
+        '''
+        Vectorized "stochastic_osc". Same args and trades. "prepared" means the df is already from the _prepare_ function
+        '''
+        OPEN, CLOSE, LOW, HIGH, DATE = cols
+        if not prepared:
+            df = self._prepare_stochastic_osc(df, cols, k_period, d_period, smooth_k)
+        if len(df) < 3: return
+
+        blue, red, diff = df['Blue Line'].values, df['Red Line'].values, df['Diff'].values
+        up, down = crossed_above(diff, 0), crossed_below(diff, 0)
+        up[-1] = down[-1] = False # Locks are not changed on the last candle by the loop
+
+        buy_lock = latched(up & (blue < buying_thresh) & (red < buying_thresh), down)
+        sell_lock = latched(down & (blue > selling_thresh) & (red > selling_thresh), up)
+
+        buy = buy_lock & (red > buying_thresh) & (df[CLOSE].values > df['200-MA'].values)
+        sell = sell_lock & (red < selling_thresh)
+        self._next_open_trades(name, df, buy, sell, cols)
+
+
+    def ma_trades(self, name, df, cols:tuple = ('OPEN','CLOSE','LOW','HIGH', 'DATE'), ma_type:str='simple', window:int = 44, diff:float = 0.015, r2r:float = 1.99, prepared:bool = False):
+        '''
+        Vectorized "ma". Same args and trades. "prepared" means the df is already from the _prepare_ function. Exit depends on the buying price so it is found separately for each trade
+        '''
+        OPEN, CLOSE, LOW, HIGH, DATE = cols
+        if not prepared:
+            df = self._prepare_ma(df, cols, ma_type, window)
+        if len(df) < 3: return
+
+        open_, close, low, high = df[OPEN].values, df[CLOSE].values, df[LOW].values, df[HIGH].values
+        ma, ma_200 = df[f"{window}-MA"].values, df["200-MA"].values
+
+        setup = (close > open_) & (close > ma) & (close > ma_200) & (df['RSI'].values < 70) & \
+                (np.minimum(np.abs(open_ - ma), np.abs(low - ma)) < (close * diff))
+        setup[[0, -1]] = False
+
+        entries = setup[:-1] & (high[1:] > high[:-1])
+        can_buy, square_off = self.session_masks(df[DATE])
+        if can_buy is not None:
+            entries &= can_buy[:-1]
+            ends = np.flatnonzero(square_off)
+        entries = np.flatnonzero(entries)
+        last = len(df) - 1 # Loop never looks at the last candle
+        buys, sells, buy_prices, sell_prices = [], [], [], []
+        position = 0
+        while True:
+            i = np.searchsorted(entries, position)
+            if i == len(entries):
+                break
+            index = entries[i]
+            buying_price = high[index]
+            stop_loss = min(low[index], low[index-1])
+            target_price = buying_price + (r2r * (buying_price - stop_loss))
+            ten_percent = buying_price + (buying_price * 0.10)
+            buys.append(index + 1)
+            buy_prices.append(buying_price)
+
+            start = index + 1
+            stop = last if can_buy is None else ends[np.searchsorted(ends, start)] + 1 # Square off bar is checked too
+            h, l = high[start:stop], low[start:stop]
+            hit = ~setup[start:stop] & ((h > target_price) | (l < stop_loss) | (h > ten_percent)) # Exit is not checked on a candle which is a setup
+            if hit.any():
+                sell = start + np.argmax(hit)
+                if high[sell] > target_price: selling_price = target_price
+                elif low[sell] < stop_loss: selling_price = stop_loss
+                else: selling_price = ten_percent
+            elif can_buy is not None:
+                sell, selling_price = stop - 1, close[stop - 1] # Square off at the end of the session
+            else:
+                break
+
+            sells.append(sell)
+            sell_prices.append(selling_price)
+            position = sell + 1
+
+        self.record_trades(name, df[DATE], buy_prices, sell_prices, np.array(buys, dtype = int), np.array(sells, dtype = int))
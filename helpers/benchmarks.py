@@ -0,0 +1,224 @@
+'''
+Benchmarks to keep an eye on the speed of the data pipeline. Run them from the root of the project just like the Tutorial notebook
+'''
+from time import perf_counter
+from os.path import join
+
+import pandas as pd
+import numpy as np
+
+
+def load_time(handler, symbols:list = None):
+    '''
+    Compare the time to load the whole universe from the legacy CSV files vs the columnar store
+    args:
+        handler: DataHandler object
+        symbols: List of symbols to load. Default is all the symbols present in both the CSV directory and the store
+    returns: DataFrame with the total and per symbol time in seconds for each of the source
+    '''
+    if symbols is None:
+        symbols = [name for name in handler.store.symbols() if name in handler.all_stocks]
+
+    result = {}
+
+    start = perf_counter()
+    for name in symbols:
+        df = pd.read_csv(join(handler.data_path, handler.all_stocks[name]))
+        df['DATE'] = pd.to_datetime(df['DATE'])
+    result['csv'] = perf_counter() - start
+
+    start = perf_counter()
+    for name in symbols:
+        handler.store.read(name)
+    result['store'] = perf_counter() - start
+
+    df = pd.DataFrame({'Total (s)':result})
+    df['Per Symbol (ms)'] = (df['Total (s)'] / max(len(symbols), 1)) * 1000
+    df['Symbols'] = len(symbols)
+    return df.round(4)
+
+
+def _panel_attach_time(_):
+    from .panel import worker_panel
+    panel = worker_panel()
+    return panel.attach_time, float(np.nansum(panel['CLOSE'][-1]))
+
+
+def panel_time(handler, stocks:list = None, workers:int = 4):
+    '''
+    Report the memory footprint of the universe panel, the time to load it once and the time taken by Pool workers to attach to it through shared memory
+    args:
+        handler: DataHandler object
+        stocks: List of stocks to load. Default is all the stocks in the store
+        workers: No of worker processes
+    '''
+    from multiprocessing import Pool
+    from .panel import init_worker
+
+    panel = handler.get_panel(stocks, refit = True)
+    handle = panel.to_shared()
+    report = panel.report()
+    try:
+        with Pool(workers, initializer = init_worker, initargs = (handle,)) as pool:
+            attach = [result[0] for result in pool.map(_panel_attach_time, range(workers))]
+    finally:
+        panel.unlink()
+        handler._panel = None
+
+    report['Worker Attach Time (s)'] = max(attach)
+    return report
+
+
+def _indicator_row(analyser, df, mvs:list = [20,50,100,200]):
+    '''
+    Row of BatchIndicators.table for a single stock using the per stock functions of AnalyseStocks
+    '''
+    row = {'LTP': df['CLOSE'].iloc[0]}
+    for mv in mvs:
+        row[f'{mv}-MA'] = analyser.get_MA(df, mv, return_df = False)
+    row['RSI'], row['ATR'] = analyser.get_RSI(df), analyser.get_ATR(df)
+    row['CCI'], row['CCI Signal'] = analyser.get_CCI(df, signal_only = False), analyser.get_CCI(df)
+    row['ADX'], row['MACD Signal'] = analyser.get_ADX(df), analyser.macd_signal(df)
+    row['Blue Line'], row['Red Line'] = analyser.Stochastic(df)
+    return row
+
+
+def indicator_time(analyser, nifty:int = 500, rtol:float = 1e-7):
+    '''
+    Time taken to compute the indicator table of a whole Nifty index in one vectorized call vs calling the per stock functions. Also checks that both give the same values
+    args:
+        analyser: AnalyseStocks object
+        nifty: Nifty Index
+        rtol: Relative tolerance of the numeric values
+    returns: Dictonary with the time of both and the symbols whose values are not the same (must be empty)
+    '''
+    stocks = [name for name in analyser.data[f'nifty_{nifty}'] if analyser.store.has(name)]
+    analyser.get_panel(stocks) # loading is not part of the computation
+
+    start = perf_counter()
+    table = analyser.get_indicator_table(custom_list = stocks)
+    batch = perf_counter() - start
+
+    start = perf_counter()
+    rows = {name: _indicator_row(analyser, analyser.open_downloaded_stock(name)) for name in stocks}
+    elapsed = perf_counter() - start
+
+    single = pd.DataFrame.from_dict(rows, orient = 'index').loc[table.index, table.columns]
+    mismatch = pd.Series(False, index = table.index)
+    for col in table.columns:
+        if not pd.api.types.is_numeric_dtype(table[col]): # Signals
+            mismatch |= table[col].values != single[col].values
+        else:
+            mismatch |= ~np.isclose(table[col].astype(float), single[col].astype(float), rtol = rtol, equal_nan = True)
+
+    return {'Symbols':len(stocks), 'Batch (s)':round(batch, 3), 'Per Stock (s)':round(elapsed, 3), 'Mismatch':list(table.index[mismatch.values])}
+
+
+def screener_time(investing, budget:float, diff:float = 13, nifty:str = 'nifty_200'):
+    '''
+    Time taken by Investing.calculate with the fused single pass pipeline vs the old one which opens every stock for every stage
+    args:
+        investing: Investing object
+        budget, diff, nifty: Same as Investing.calculate
+    returns: Dictonary with the total time of both and the stage wise time of the fused pipeline
+    '''
+    result = {}
+    for fused in (True, False):
+        investing.all_ichi, investing._eligible, investing._old_budget = None, None, -1 # Start cold every time
+        start = perf_counter()
+        investing.calculate(budget, diff = diff, nifty = nifty, show_only = False, fused = fused)
+        result['Fused (s)' if fused else 'Per Stock (s)'] = round(perf_counter() - start, 3)
+        if fused:
+            stages = dict(investing.timings)
+    result.update(stages)
+    return result
+
+
+def backtest_time(backtest, strategy:str, stocks = 'nifty_50', min_days:int = 365, **kwargs):
+    '''
+    Time taken by Backtest.backtest with the vectorized engine vs the row by row loop. Also checks that both give the exact same trades
+    args:
+        backtest: Backtest object
+        strategy, stocks, min_days, kwargs: Same as Backtest.backtest
+    returns: Dictonary with the time of both and the symbols whose trades are not the same (must be empty)
+    '''
+    result, history = {}, {}
+    for vectorized in (True, False):
+        start = perf_counter()
+        backtest.backtest(strategy, min_days = min_days, top_n = 'all', stocks = stocks, vectorized = vectorized, **kwargs)
+        result['Vectorized (s)' if vectorized else 'Loop (s)'] = round(perf_counter() - start, 3)
+        history[vectorized] = backtest.history
+
+    result['Symbols'] = len(history[False])
+    result['Mismatch'] = [name for name in history[False] if history[False][name] != history[True].get(name)]
+    return result
+
+
+def kite_fetch_time(kite, names:list, intervals:list = (5, 15), workers:int = 4, rate:float = 3, **kwargs):
+    '''
+    Time taken to download the historical data of many stocks one by one with KiteZerodha.get_historical_data vs the batched fetcher. Point the
+    KiteZerodha to a fake_kite.FakeKite server to run it without an account
+    args:
+        kite: KiteZerodha object
+        names, intervals, workers, rate: Same as KiteZerodha.get_historical_batch
+        kwargs: starting_from_date, no_days_back etc. Same as KiteZerodha.get_historical_data
+    returns: Dictonary with the time of both and the (name, interval) whose data is not the same (must be empty)
+    '''
+    result, single = {}, {}
+    start = perf_counter()
+    for name in names:
+        for interval in intervals:
+            single[(name, interval)] = kite.get_historical_data(name, 'min', interval = interval, **kwargs)
+    result['One by One (s)'] = round(perf_counter() - start, 3)
+
+    start = perf_counter()
+    batch = dict(kite.get_historical_batch(names, intervals, workers = workers, rate = rate, **kwargs))
+    result['Batch (s)'] = round(perf_counter() - start, 3)
+
+    result['Requests'] = len(single)
+    result['Mismatch'] = [key for key, df in single.items() if (df is None) or (batch[key] is None) or not df.equals(batch[key])]
+    return result
+
+
+_import_script = '''
+import socket, sys, time
+def offline(*args, **kwargs):
+    raise OSError("Network used while importing")
+socket.socket.connect = offline
+socket.create_connection = offline
+sys.path.insert(0, sys.argv[2])
+start = time.perf_counter()
+__import__(sys.argv[1])
+print(time.perf_counter() - start)
+'''
+
+
+def import_time(modules:list = None, repeat:int = 3):
+    '''
+    Time taken to import the helpers modules in a fresh interpreter with the network disabled. Importing must not open any connection
+    or read the data files so it must work offline and from any directory. "pandas" is there as the baseline every module pays for
+    args:
+        modules: List of module names. Default is pandas and all the main helpers modules
+        repeat: No of runs. Best of them is taken
+    returns: DataFrame with the import time of every module and whether it could be imported offline
+    '''
+    import subprocess
+    import sys
+    import tempfile
+    from os.path import dirname, abspath
+
+    root = dirname(dirname(abspath(__file__)))
+    modules = modules or ['pandas', 'helpers.datahandler', 'helpers.stock_analyser', 'helpers.investing', 'helpers.backtest', 'helpers.intraday', 'helpers.FnO']
+
+    result = {}
+    with tempfile.TemporaryDirectory() as cwd: # No data.json there
+        for module in modules:
+            times = []
+            for _ in range(repeat):
+                run = subprocess.run([sys.executable, '-c', _import_script, module, root], cwd = cwd, capture_output = True, text = True)
+                if run.returncode:
+                    break
+                times.append(float(run.stdout.strip().splitlines()[-1]))
+            result[module] = {'Import (s)': round(min(times), 3) if times else np.nan, 'Offline Safe': not run.returncode}
+
+    return pd.DataFrame(result).T
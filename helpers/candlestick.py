@@ -1,4 +1,22 @@
 from pandas import DataFrame as frame
+import numpy as np
+import pandas as pd
+
+
+# Categories of the array versions in the same order as the checks of the scalar functions
+single_names = ['Dragonfly Doji', 'Gravestone Doji', 'Doji', 'Hammer', 'Hanging Man', 'Shooting Star', 'Inverted Hammer',
+                'Green Doji', 'Red Doji', 'Bullish', 'Bearish', 'Unknown Green', 'Unknown Red']
+double_names = ['Bullish Engulfing', 'Bearish Engulfing', 'Bearish Harami', 'Bullish Harami', 'Unknown']
+triple_names = ['V Pattern', 'Reverse V Pattern', 'Three White Soldiers', 'Three Black Crows', 'Unknown']
+
+
+def previous(x, n:int = 1):
+    '''
+    Value "n" bars before along the first axis. Float arrays get NaN and integer arrays (codes) get -1 for the first "n" bars
+    '''
+    out = np.full(x.shape, -1 if x.dtype.kind == 'i' else np.nan, dtype = x.dtype)
+    out[n:] = x[:-n]
+    return out
 
 
 class CandlePattern:
@@ -131,4 +149,84 @@ class CandlePattern:
         
         
         
-    
\ No newline at end of file
+    
+
+
+    def name_codes(self, open, close, low, high):
+        '''
+        Array version of "find_name" for every bar at once. Inputs can be of any shape (such as bars x symbols)
+        returns: Integer array of the index of the name in "single_names"
+        '''
+        open, close, low, high = (np.asarray(x, dtype = 'float64') for x in (open, close, low, high))
+        body = np.abs(close - open)
+        green = ~(close < open)
+        upper = high - np.maximum(open, close)
+        lower = low - np.minimum(open, close)
+
+        conditions = [(high == open) & (open == close), (low == open) & (open == close), open == close,
+                      (np.abs(lower) > 2 * body) & (lower > np.abs(upper)), # abs() of the scalar version is on the comparison so it does nothing
+                      (np.abs(upper) > 2 * body) & (upper > np.abs(lower)),
+                      (np.abs(upper) > body) & (np.abs(lower) > body),
+                      (np.abs(upper) < 0.15 * body) & (np.abs(lower) < 0.15 * body)]
+        choices = [0, 1, 2, np.where(green, 3, 4), np.where(green, 6, 5), np.where(green, 7, 8), np.where(green, 9, 10)]
+        return np.select(conditions, choices, np.where(green, 11, 12))
+
+
+    def double_codes(self, open, close, low, high):
+        '''
+        Array version of "double_candle_pattern" for every bar with the bar before it. Bars are from the oldest to the newest along the first axis
+        returns: Integer array of the index of the pattern in "double_names". -1 for the first bar
+        '''
+        open, close, low, high = (np.asarray(x, dtype = 'float64') for x in (open, close, low, high))
+        sec_open, sec_close = previous(open), previous(close)
+        sec_red, red = sec_close < sec_open, close < open
+        sec_green = ~sec_red
+        name = self.name_codes(open, close, low, high)
+
+        conditions = [sec_red & ~red & (sec_close >= open) & (sec_open <= close),
+                      sec_green & red & (sec_close <= open) & (sec_open >= close),
+                      sec_green & (sec_open < low) & (sec_close > high) & (name == single_names.index('Red Doji')),
+                      sec_red & (sec_close < low) & (sec_open > high) & (name == single_names.index('Green Doji'))]
+        codes = np.select(conditions, [0, 1, 2, 3], 4)
+        codes[:1] = -1
+        return codes
+
+
+    def triple_codes(self, open, close, low, high):
+        '''
+        Array version of "triple_candle_pattern" for every bar with the 2 bars before it. Bars are from the oldest to the newest along the first axis
+        returns: Integer array of the index of the pattern in "triple_names". -1 for the first 2 bars
+        '''
+        open, close, low, high = (np.asarray(x, dtype = 'float64') for x in (open, close, low, high))
+        sec_open, sec_close, sec_low, sec_high = (previous(x) for x in (open, close, low, high))
+        third_open, third_close, third_low, third_high = (previous(x, 2) for x in (open, close, low, high))
+        name = self.name_codes(open, close, low, high)
+        same = (name == previous(name)) & (name == previous(name, 2))
+
+        conditions = [(third_high > sec_high) & (third_low > sec_low) & (low > sec_low) & (high > sec_high),
+                      (third_low < sec_low) & (third_high < sec_high) & (sec_high > high) & (sec_low > low),
+                      same & (name == single_names.index('Bullish')) & (third_close > sec_open) & (sec_open > third_open) & (sec_close > open) & (open > sec_open),
+                      same & (name == single_names.index('Bearish')) & (third_close < sec_open) & (sec_open < third_open) & (sec_close < open) & (open < sec_open)]
+        codes = np.select(conditions, [0, 1, 2, 3], 4)
+        codes[:2] = -1
+        return codes
+
+
+    def patterns(self, df, names = ('DATE','OPEN','CLOSE','LOW','HIGH')):
+        '''
+        Name of the candle, double candle and triple candle pattern of every row of a stock. Same as calling "find_name", "double_candle_pattern" and
+        "triple_candle_pattern" with the data till that row
+        args:
+            df: Pandas DataFrame in any order of dates
+            names: Name of Columns representing ('DATE','OPEN','CLOSE','LOW','HIGH') in same order
+        returns: DataFrame of categorical columns 'Candle', 'Double Candle', 'Triple Candle' with the same index as df. Missing where there are not enough previous rows
+        '''
+        Date, Open, Close, Low, High = names
+        descending = (len(df) > 1) and (df[Date].iloc[0] > df[Date].iloc[1])
+        data = df.iloc[::-1] if descending else df
+        values = [data[name].values for name in (Open, Close, Low, High)]
+
+        result = pd.DataFrame({'Candle': pd.Categorical.from_codes(self.name_codes(*values), single_names),
+                               'Double Candle': pd.Categorical.from_codes(self.double_codes(*values), double_names),
+                               'Triple Candle': pd.Categorical.from_codes(self.triple_codes(*values), triple_names)}, index = data.index)
+        return result.iloc[::-1] if descending else result
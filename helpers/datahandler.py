@@ -1,5 +1,10 @@
-from jugaad_data.nse import stock_df
-from .nse_data import NSEData
+from .nse_data import NSEData, read_Bhavcopy
+from .price_store import PriceStore
+from .intraday_store import IntradayStore
+from .panel import PricePanel, worker_panel
+from .result_cache import ResultCache
+from .pattern_index import PatternIndex
+from .lazy import LazyModule
 
 from datetime import date, datetime, timedelta
 
@@ -7,17 +12,18 @@ import pandas as pd
 import numpy as np
 
 from os import listdir, mkdir, cpu_count
-from shutil import rmtree
-from os.path import join, expanduser
+from os.path import join, expanduser, exists
 
 import json
 import warnings
+import re
 
 import random
 
 from multiprocessing import Pool
 
 NSE = NSEData()
+nse_history = LazyModule('jugaad_data.nse') # Only needed while downloading
 workers = int(0.8*cpu_count())
 
 
@@ -25,13 +31,27 @@ drop = ['SERIES','PREV. CLOSE','VWAP','VOLUME','VALUE','NO OF TRADES', 'LTP']
 
 
 class DataHandler:
-    def __init__(self, data_path = './data', check_fresh = False):
+    def __init__(self, data_path = './data', check_fresh = False, store_path = './data_store', cache_path = './cache/results.sqlite',
+                 pattern_path = './cache/patterns.sqlite', intraday_path = './intraday_data'):
         '''
+        args:
+            data_path: Directory of the legacy per symbol CSV files
+            check_fresh: Whether to check and download the fresh data
+            store_path: Directory of the columnar PriceStore
+            cache_path: SQLite file where the per stock screening results are cached. See ResultCache
+            pattern_path: SQLite file of the candlestick pattern occurrences of every stock. See PatternIndex
+            intraday_path: Directory of the minutes data. Monthly files of the IntradayStore as well as the legacy CSV files
         '''
         self.present = date.today()
         self.week_num = self.present.strftime("%W")
         
         self.data_path = data_path
+        self.store = PriceStore(store_path)
+        self.cache = ResultCache(cache_path)
+        self.pattern_index = PatternIndex(pattern_path)
+        self.intraday_store = IntradayStore(intraday_path)
+        self._panel = None
+        self._panel_stocks = None
         
         self.read_data = DataHandler.read_data # because it is static
         self.data = self.read_data()
@@ -43,6 +63,32 @@ class DataHandler:
             self.check_new_data_availability()
 
     
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_panel'] = None # Never send the in memory panel to worker processes. ParallelExecutor shares it using PricePanel.to_shared instead
+        return state
+
+
+    def get_panel(self, stocks:list = None, dtype:str = 'float64', refit:bool = False, timeframe:str = 'D'):
+        '''
+        Load the whole universe once per session as a PricePanel of aligned (dates x symbols) arrays
+        args:
+            stocks: List of stocks to load. Default is all the stocks in the store
+            dtype: dtype of the prices. 'float32' halves the memory
+            refit: Whether to reload even if a panel is already loaded
+            timeframe: 'D' for the Daily data or 'W', 'M' for the Weekly / Monthly bars of the store. Only the Daily panel is kept for the session
+        '''
+        stocks = list(stocks) if stocks is not None else None
+        if timeframe != 'D':
+            self.store.update_views(stocks) # Only the ones missing or older than the Daily data
+            return PricePanel.from_store(self.store.view(timeframe), stocks, dtype)
+
+        if (self._panel is None) or refit or (stocks != self._panel_stocks) or (dtype != self._panel.arrays['CLOSE'].dtype):
+            self._panel = PricePanel.from_store(self.store, stocks, dtype)
+            self._panel_stocks = stocks
+        return self._panel
+
+
     def update_FnO(self):
         '''
         Update the newest Futures and Options Derivatives list
@@ -78,10 +124,7 @@ class DataHandler:
         self.update_data(self.data)
 
         print('\nUpdate Successful. Downloading New Files')
-        rmtree(self.data_path) # Delete Data Folder so that new things can be downloaded
-        mkdir(self.data_path)
-
-        self.multiprocess_download_stocks()
+        self.update_incremental() # New listings are downloaded in full, rest only get the missing sessions
 
     
     def update_fresh_nifty_indices(self):
@@ -91,24 +134,16 @@ class DataHandler:
         print('Updating New Nifty, Sectoral and thematic Indices')
         success = True
         try:
-            for index_name in ['Sectoral Indices','Thematic Indices']: # Update Sectoral first
-                index_key = index_name.replace(' ','_').lower() # setoral_indices, thematic_indices
-                self.data[index_key] = {} # Will contain names of individual sectors
+            nifties = {'nifty_50':'NIFTY 50', 'nifty_100': 'NIFTY 100', 'nifty_200':'NIFTY 200', 'nifty_500':'NIFTY500 MULTICAP 50:25:25'}
+            branches = {index_name: self.data['all_indices_names'][index_name] for index_name in ['Sectoral Indices','Thematic Indices']} # All the available sectors and themes
+            members = self._index_members(list(dict.fromkeys([name for names in branches.values() for name in names] + list(nifties.values()))))
 
-                branches = self.data['all_indices_names'][index_name] # Get all the available sectors and themes
-                for branch_name in branches: # get individial names: Such as Nifty IT, Nifty Auto etc
-                    names = NSE.open_nse_index(branch_name, show_n=9999)['symbol'].tolist()
-                    self.data[index_key][branch_name] = names
+            for index_name in branches.keys(): # Update Sectoral first
+                index_key = index_name.replace(' ','_').lower() # setoral_indices, thematic_indices
+                self.data[index_key] = {branch_name: members[branch_name] for branch_name in branches[index_name]} # Names of individual sectors such as Nifty IT, Nifty Auto etc
 
-            nifties = {'nifty_50':'NIFTY 50', 'nifty_100': 'NIFTY 100', 'nifty_200':'NIFTY 200', 'nifty_500':'NIFTY500 MULTICAP 50:25:25'}
             for index_name in nifties.keys():
-                valid_names = [] # Names which are in Nifty Index but not in registered
-
-                names = NSE.open_nse_index(nifties[index_name], show_n=500)['symbol'].tolist()
-                for name in names:
-                    if name in self.data['registered_stocks']:
-                        valid_names.append(name)
-                self.data[index_name] = valid_names
+                self.data[index_name] = [name for name in members[nifties[index_name]][:500] if name in self.data['registered_stocks']] # Names which are in Nifty Index and registered
 
         except Exception as e:
             success = False
@@ -119,13 +154,43 @@ class DataHandler:
             self.update_data(self.data)
         
 
+    def _index_members(self, index_names:list):
+        '''
+        Symbols of all the given NSE indices. They are fetched concurrently when aiohttp is installed else one by one
+        args:
+            index_names: List of NSE index names such as 'NIFTY 50', 'NIFTY IT'
+        returns: Dictonary of {index name: list of symbols}
+        '''
+        try:
+            from .async_nse import open_nse_indices
+            frames = open_nse_indices(index_names, show_n = 9999, max_age = 86400, cache = NSE.cache)
+        except ImportError:
+            frames = {name: NSE.open_nse_index(name, show_n = 9999, max_age = 86400) for name in index_names}
+        return {name: df['symbol'].tolist() for name, df in frames.items()}
+
+
     def __fresh(self,):
-        files = listdir(self.data_path)
-        if not len(files):
-            warnings.warn(f"No CSV data files present at {self.data_path} Downloading new data for analysis")
+        if not len(self.store.symbols()):
+            if exists(self.data_path) and len(listdir(self.data_path)):
+                print('Migrating CSV files to the columnar store.....')
+                self.migrate_to_store()
+                return
+
+            warnings.warn(f"No data present at {self.store.path} Downloading new data for analysis")
             self.multiprocess_download_stocks()
             
             self.update_fresh_files()
+
+
+    def migrate_to_store(self, overwrite:bool = False):
+        '''
+        One shot migration of the downloaded 'SYMBOL_Company_DATE.csv' files from the data_path to the columnar store
+        args:
+            overwrite: Whether to overwrite the symbols which are already in the store
+        '''
+        migrated = self.store.migrate_from_csv(self.all_stocks, self.data_path, overwrite)
+        self.update_patterns(migrated)
+        return migrated
   
     
     @staticmethod
@@ -152,105 +217,313 @@ class DataHandler:
             json.dump(updated_data,f)
 
     
-    def open_live_stock_data(self,name:str,):
+    def open_live_stock_data(self,name:str, from_date:date = None):
         '''
         Open the fresh stock from the market
         args:
             name: ID of the stock given
+            from_date: Date from which to get the data. Default is 750 days back
         '''
-        return stock_df(symbol=name, from_date = self.present - timedelta(days = 750), to_date = self.present, series="EQ").drop(drop,axis=1) # almost 2 years
+        from_date = from_date if from_date else self.present - timedelta(days = 750) # almost 2 years
+        return nse_history.stock_df(symbol=name, from_date = from_date, to_date = self.present, series="EQ").drop(drop,axis=1)
     
     
-    def open_downloaded_stock(self, name:str, resample:str = None, kind = 'daily'):
+    def open_downloaded_stock(self, name:str, resample:str = None, kind = 'daily', start = None, end = None):
         '''
         Open the Individual stock based on it's Official Term
         args:
             name: Name / ID given to the stock. Example, Infosys is "INFY"
-            resample: Resample the data to Weekly, Monthly, Yearly. Pass in ['M','W','Y']. Default: None means Daily
-            kind: Kind of data file to open" could be "daily" or any of [minutes_2, minutes_3, minutes_4, minutes_5, minutes_15, minutes_30, minutes_60]
+            resample: Resample the data to Weekly, Monthly, Yearly. Pass in ['M','W','Y']. Minutes data can be resampled to any multiple of its interval such as '45min'. Default: None
+                Weekly and Monthly bars of the whole history are read from the store (see PriceStore.view) where the weeks / months without any trading are absent
+            kind: Kind of data file to open" could be "daily" or any of [minutes_2, minutes_3, minutes_4, minutes_5, minutes_10, minutes_15, minutes_30, minutes_60].
+                An interval which is not downloaded is made from a finer downloaded one which divides it
+            start: Only the data from this date / time. Default is from the oldest
+            end: Only the data till this date / time (a date includes the whole day). Default is till the newest. Minutes data reads only the months in between
         returns: DataFrame of that stock
         '''
         if kind == 'daily':
-            df = pd.read_csv(join(self.data_path,self.all_stocks[name]))
-            df['DATE'] = pd.to_datetime(df['DATE'])
+            if resample in self.store.views and (start is None) and (end is None) and self.store.fresh_view(name, resample): # Bars kept in the store
+                return self.store.view(resample).read(name).loc[:, ['DATE','OPEN','HIGH','LOW','CLOSE']]
+
+            panel = worker_panel() # Attached inside the workers of a ParallelExecutor given a panel
+            if (panel is not None) and panel.fresh(name, self.store):
+                df = panel.frame(name)
+            elif self.store.has(name):
+                df = self.store.read(name)
+            else: # Not migrated yet
+                df = pd.read_csv(join(self.data_path,self.all_stocks[name]))
+                df['DATE'] = pd.to_datetime(df['DATE'])
 
+            if (start is not None) or (end is not None):
+                df = df[df['DATE'].between(*IntradayStore.window(start, end))].reset_index(drop = True)
             if resample:
                 df = self.resample_data(df,resample)
             return df
         
-        else:
-            file = f'./intraday_data/{kind}/{self.all_stocks[name]}'
+        elif self.intraday_store.available(name, kind): # Stored or made from a finer stored interval
+            df = self.intraday_store.read(name, kind, start, end)
+
+        else: # Legacy CSV file
+            file = f'{self.intraday_store.path}/{kind}/{self.all_stocks[name]}'
             try:
                 df = pd.read_csv(file)
                 df['DATE'] = pd.to_datetime(df['DATE'])
-                return df
+                if (start is not None) or (end is not None):
+                    df = df[df['DATE'].between(*IntradayStore.window(start, end))].reset_index(drop = True)
             except:
                 print(f"Unable to Open {file}. Check if there's a file in the corresponding directory")
+                return None
+
+        return self.resample_data(df, resample) if resample else df
+
+
+    def iter_downloaded_stock(self, name:str, kind:str = 'minutes_5', sessions:int = 20, warmup:int = 500):
+        '''
+        Open the minutes data a few sessions (days) at a time so that the memory stays bounded for big files. Only the DATE column is read in full
+        args:
+            name: Name / ID given to the stock
+            kind: Any of [minutes_2, minutes_3, minutes_4, minutes_5, minutes_15, minutes_30, minutes_60]
+            sessions: No of sessions in every piece
+            warmup: No of bars before the first session of a piece which are added to it so that the indicators have history
+        yields: Tuple of (DataFrame of the piece, newest first just like open_downloaded_stock, Date of the first session of the piece). Oldest piece comes first
+        '''
+        stored = self.intraday_store.available(name, kind)
+        file = f'{self.intraday_store.path}/{kind}/{self.all_stocks[name]}'
+        if stored:
+            dates = self.intraday_store.dates(name, kind)
+        else:
+            dates = pd.to_datetime(pd.read_csv(file, usecols = ['DATE'])['DATE']) # Newest first
+        days = dates.dt.normalize()
+        bounds = list(np.flatnonzero(np.r_[True, days.values[1:] != days.values[:-1]])) + [len(days)] # Rows where every session starts in the file
+
+        for stop in range(len(bounds) - 1, 0, -sessions):
+            start = max(stop - sessions, 0)
+            first, last = bounds[start], min(bounds[stop] + warmup, len(days))
+            if stored: # Only the months of the piece are opened
+                df = self.intraday_store.read(name, kind, dates.iloc[last - 1], dates.iloc[first])
+            else:
+                df = pd.read_csv(file, skiprows = range(1, first + 1), nrows = last - first)
+                df['DATE'] = pd.to_datetime(df['DATE'])
+            yield df, days.iloc[bounds[stop] - 1]
 
     
     def resample_data(self, data, to:str  = 'W', names:tuple = ('OPEN','CLOSE','LOW','HIGH','DATE')):
         '''
-        Resample the data from Daily to Weekly, Monthly or Yearly
+        Resample the data from Daily to Weekly, Monthly or Yearly. Minutes data is resampled within every session, bars starting at 9:15 like Kite
         args:
-            data: Dataframe of Daily data
-            to: One of  ['W','M','Y']
+            data: Dataframe of Daily or Minutes data
+            to: One of  ['W','M','Y'] for the Daily data. Minutes such as 15, '15min' or '15T' for the Minutes data
         '''
         Open, Close, Low, High, Date = names
+        minutes = re.fullmatch(r'(\d+)\s*(?:min|minutes|T)?', str(to))
+        if minutes:
+            data = data.rename(columns = {Open:'OPEN', Close:'CLOSE', Low:'LOW', High:'HIGH', Date:'DATE'})
+            data = IntradayStore.resample(data, int(minutes.group(1)))
+            return data.rename(columns = {'OPEN':Open, 'CLOSE':Close, 'LOW':Low, 'HIGH':High, 'DATE':Date})
+
         data = data.resample(to,on=Date).agg({Open:'first', High:'max', Low: 'min', Close:'last'})
         return data.sort_index(ascending = False).reset_index()
     
 
-    def download_new(self,name:str, path:str = "./data"):
+    def download_new(self,name:str, path:str = None):
         '''
-        Download a New Stock Data
+        Download a New Stock Data and save it to the columnar store
         args:
             name: ID / name of the Stock
-            path: Path to the directory where downloaded files have to be stored
+            path: Path to the directory where a legacy CSV copy has to be stored. If None, only the store is written
          '''
         try:
             df = self.open_live_stock_data(name)
             df['DATE'] = pd.to_datetime(df['DATE'])
-            ID, NAME, _ = self.all_stocks[name].split('_')
-            save = f"{path}/{ID}_{NAME}_{str(self.present)}.csv"
-            df.to_csv(save,index=None)
+            self.store.write(name, df)
+
+            if path:
+                ID, NAME, _ = self.all_stocks[name].split('_')
+                save = f"{path}/{ID}_{NAME}_{str(self.present)}.csv"
+                df.to_csv(save,index=None)
         except Exception as e:
             print(name,'----',e)
 
 
-    def multiprocess_download_stocks(self,path:str = './data'):
+    def multiprocess_download_stocks(self,path:str = None, stocks:list = None):
         '''
         Multiprocess Download stocks
         args:
-            path: Path where files will be downloaded
-            worker: No of workers
+            path: Path where legacy CSV files will be downloaded. If None, only the store is written
+            stocks: List of stocks to download. Default is all the registered stocks
         '''
-        stocks = self.data['registered_stocks']
+        stocks = stocks if stocks is not None else self.data['registered_stocks']
 
         pool = Pool(workers)
-        results = pool.map(self.download_new,stocks)
+        results = pool.starmap(self.download_new,[(stock, path) for stock in stocks])
         pool.close()
         pool.join()
+        self.update_patterns(stocks)
         return True
 
 
+    def download_delta(self, name:str):
+        '''
+        Download only the sessions after the last stored date of a stock and append them to the store. Stocks not present in the store are downloaded in full
+        args:
+            name: ID / name of the Stock
+        returns: No of new rows appended
+        '''
+        last = self.store.last_date(name)
+        if last is None:
+            self.download_new(name)
+            return 0
+
+        from_date = last.date() + timedelta(days = 1)
+        if from_date > self.present:
+            return 0
+
+        try:
+            df = self.open_live_stock_data(name, from_date = from_date)
+            if len(df):
+                self.store.append(name, df)
+            return len(df)
+        except Exception as e:
+            print(name,'----',e)
+            return 0
+
+
+    def update_incremental(self, stocks:list = None):
+        '''
+        Incremental update: Fetch only the missing sessions for every stock and append them to the existing store
+        args:
+            stocks: List of stocks to update. Default is all the registered stocks
+        returns: Dictonary of {stock: no of new rows}
+        '''
+        stocks = stocks if stocks is not None else self.data['registered_stocks']
+
+        pool = Pool(workers)
+        results = pool.map(self.download_delta, stocks)
+        pool.close()
+        pool.join()
+
+        results = dict(zip(stocks, results))
+        self.update_patterns([name for name in stocks if results[name]])
+        return results
+
+
+    def update_patterns(self, stocks:list = None):
+        '''
+        Add the new sessions of the stocks to the pattern index. Called after every refresh of the store. The stocks of the store which are not
+        in the index yet (such as on the first refresh after an install) are always added too so that the index covers the whole store
+        args:
+            stocks: List of stocks. Default is all the stocks in the store (builds the whole index the first time)
+        returns: Dictonary of {stock: no of pattern occurrences written}
+        '''
+        try:
+            if stocks is not None:
+                stocks = sorted(set(stocks) | set(self.pattern_index.missing(self.store)))
+                if not len(stocks):
+                    return {}
+            return self.pattern_index.update(self.store, stocks)
+        except Exception as e:
+            warnings.warn(f"Pattern index could not be updated: {e}")
+            return {}
+
+
+    def ingest_bhavcopy(self, bhavcopies:list, stocks:list = None):
+        '''
+        Bulk End of Day update from one or more Bhavcopies instead of downloading every stock one by one.
+        EQ series is filtered, every stock is split out of the combined data in one groupby and appended to the store.
+        52 Week High / Low are not present in Bhavcopy so they are calculated from the stored history
+        args:
+            bhavcopies: List of Bhavcopy file paths (.csv or .zip) or raw DataFrames. See nse_data.get_Bhavcopy
+            stocks: Stocks to update. Default is all the registered stocks
+        returns: Dictonary of {stock: no of rows in the bhavcopies}
+        '''
+        return self._ingest_EOD(pd.concat([read_Bhavcopy(bhavcopy) for bhavcopy in bhavcopies], ignore_index = True), stocks)
+
+
+    def _ingest_EOD(self, df, stocks:list = None):
+        '''
+        Split the combined End of Day data of all the stocks and append each to the store
+        args:
+            df: DataFrame from nse_data.read_Bhavcopy having rows of many stocks and dates
+            stocks: Stocks to update. Default is all the registered stocks
+        '''
+        stocks = set(stocks if stocks is not None else self.data['registered_stocks'])
+        df = df[df['SYMBOL'].isin(stocks)].drop_duplicates(['SYMBOL','DATE'], keep = 'last')
+
+        updated = {}
+        for name, new in df.groupby('SYMBOL'):
+            self._append_with_52W(name, new)
+            updated[name] = len(new)
+
+        self.update_patterns(list(updated))
+        return updated
+
+
+    def ingest_bhavcopy_dir(self, path:str, start:date = None, end:date = None, stocks:list = None):
+        '''
+        Backfill a date range from a local directory of Bhavcopy files (.csv or .zip) such as the ones named 'cm01JAN2022bhav.csv.zip'
+        args:
+            path: Directory where the Bhavcopy files are present
+            start: First date to ingest. Default is the oldest available
+            end: Last date to ingest. Default is the newest available
+            stocks: Stocks to update. Default is all the registered stocks
+        returns: Dictonary of {stock: no of rows in the bhavcopies}
+        '''
+        start = pd.Timestamp(start) if start else pd.Timestamp.min
+        end = pd.Timestamp(end) if end else pd.Timestamp.max
+
+        bhavcopies = []
+        for file in sorted(listdir(path)):
+            if not file.lower().endswith(('.csv','.zip')):
+                continue
+
+            found = re.search(r'cm(\d{2}[A-Za-z]{3}\d{4})bhav', file) # Date is in the name of the file, no need to open the ones out of range
+            if found and not (start <= pd.Timestamp(datetime.strptime(found.group(1).title(), '%d%b%Y')) <= end):
+                continue
+
+            df = read_Bhavcopy(join(path, file))
+            bhavcopies.append(df[(df['DATE'] >= start) & (df['DATE'] <= end)])
+
+        if not len(bhavcopies):
+            warnings.warn(f"No Bhavcopy found at {path} between {start} and {end}")
+            return {}
+
+        return self._ingest_EOD(pd.concat(bhavcopies, ignore_index = True), stocks)
+
+
+    def _append_with_52W(self, name:str, new):
+        '''
+        Append the rows from Bhavcopy to the store after calculating the 52 Week High and Low using the stored history
+        args:
+            name: Name of the stock
+            new: DataFrame of new rows with columns ['DATE','OPEN','HIGH','LOW','CLOSE','SYMBOL']
+        '''
+        new = new.sort_values('DATE').set_index('DATE')
+
+        history = new.loc[:,['HIGH','LOW']]
+        if self.store.has(name):
+            old = self.store.read(name).set_index('DATE').loc[:,['HIGH','LOW']]
+            history = pd.concat([old[~old.index.isin(new.index)], history]).sort_index()
+
+        new['52W H'] = history['HIGH'].rolling('365D').max().loc[new.index]
+        new['52W L'] = history['LOW'].rolling('365D').min().loc[new.index]
+        return self.store.append(name, new.reset_index())
+
+
     def check_new_data_availability(self):
         '''
         Check and download new available or unfinished data
         '''
         name = random.choice(self.data['nifty_50'])
         old = self.open_downloaded_stock(name)
-        new = self.open_live_stock_data(name)
+        new = self.open_live_stock_data(name, from_date = old.iloc[0,0].date())
         if old.iloc[0,0] < new.iloc[0,0]:
             print('New Data Available. Downloading now....')
-            
-            rmtree(self.data_path)
-            mkdir(self.data_path)
-            self.multiprocess_download_stocks()
+            self.update_incremental()
         
-        missing_list = set(self.all_stocks.keys()) - set([i.split('_')[0] for i in listdir('./data')])
+        missing_list = set(self.all_stocks.keys()) - set(self.store.symbols())
         if len(missing_list):
             print('Data Count Mismatch. Downloading Missing.....',missing_list)
-            self.multiprocess_download_stocks()
+            self.multiprocess_download_stocks(stocks = list(missing_list))
         
         self.update_fresh_files()
         
@@ -259,7 +532,7 @@ class DataHandler:
         '''
         Update Downloaded Files in the data.json
         '''
-        files = listdir(self.data_path)
+        files = listdir(self.data_path) if exists(self.data_path) else []
         self.data = self.read_data()
 
         for file in files:
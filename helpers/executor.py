@@ -0,0 +1,92 @@
+'''
+Process pool for the screening functions which run the same per stock function over hundreds of symbols
+'''
+from multiprocessing import Pool
+from os import cpu_count
+from pickle import PicklingError
+
+import warnings
+
+from . import panel as _panel
+
+
+_context = None # Object whose methods are run inside a worker process. See _init_worker
+
+
+def _init_worker(context, handle:dict = None):
+    '''
+    Initializer of the Pool so that the (big) analyser object is sent once per worker instead of once per symbol. Workers attach to the shared
+    PricePanel (if any) here so that DataHandler.open_downloaded_stock gives its symbols from the shared memory instead of reading the files
+    '''
+    global _context
+    _context = context
+    if handle is not None:
+        _panel.init_worker(handle)
+
+
+def _run_chunk(method:str, chunk:list, args:tuple, kwargs:dict):
+    func = getattr(_context, method)
+    return [func(item, *args, **kwargs) for item in chunk]
+
+
+class ParallelExecutor:
+    '''
+    Run a method of an object (DataHandler, AnalyseStocks, Investing etc) for a list of symbols in parallel. Results are in the same order as the symbols.
+    Runs serially when there is only 1 worker, too few symbols or if the worker processes can not be started, giving the exact same results
+    '''
+    def __init__(self, workers:int = None, chunksize:int = None, min_items:int = 20, panel = None):
+        '''
+        args:
+            workers: No of worker processes. Default is 80% of the CPUs. 1 means serial
+            chunksize: No of symbols sent to a worker at a time. Default splits the symbols in 4 chunks per worker
+            min_items: Run serially if there are less symbols than this as starting the processes costs more than the work
+            panel: PricePanel already loaded in this process (see DataHandler.get_panel). Workers attach to it zero copy and read the daily data of its
+                symbols from it. Symbols missing from it or changed in the store after it was loaded are still read from the store
+        '''
+        self.workers = max(int(0.8*cpu_count()), 1) if workers is None else max(workers, 1)
+        self.chunksize = chunksize
+        self.min_items = min_items
+        self.panel = panel
+
+
+    def serial(self, context, method:str, items:list, *args, **kwargs):
+        '''
+        Run in the current process. Same arguments as "map"
+        '''
+        func = getattr(context, method)
+        return [func(item, *args, **kwargs) for item in items]
+
+
+    def map(self, context, method:str, items:list, *args, **kwargs):
+        '''
+        Run "context.method(item, *args, **kwargs)" for every item
+        args:
+            context: Object whose method is to be run. It is pickled once per worker so it must not hold any open session. Module level NSEData is never used by the screeners
+            method: Name of the method
+            items: List of symbols
+            args, kwargs: Extra arguments passed to the method
+        returns: List of results in the same order as the items
+        '''
+        items = list(items)
+        if (self.workers == 1) or (len(items) < self.min_items):
+            return self.serial(context, method, items, *args, **kwargs)
+
+        size = self.chunksize or max(-(-len(items) // (self.workers * 4)), 1)
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        shared = (self.panel is not None) and not self.panel._shared # Shared here so it goes back to the private memory when done
+        try:
+            handle = self.panel.to_shared() if self.panel is not None else None
+            pool = Pool(min(self.workers, len(chunks)), initializer = _init_worker, initargs = (context, handle))
+        except (OSError, PicklingError, AttributeError) as e:
+            if shared and self.panel._shared:
+                self.panel.unshare()
+            warnings.warn(f"Unable to start the worker processes, running serially: {e}")
+            return self.serial(context, method, items, *args, **kwargs)
+
+        try:
+            with pool:
+                results = pool.starmap(_run_chunk, [(method, chunk, args, kwargs) for chunk in chunks])
+        finally:
+            if shared:
+                self.panel.unshare()
+        return [result for chunk in results for result in chunk]
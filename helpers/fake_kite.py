@@ -0,0 +1,172 @@
+'''
+Local stand in for the Kite website to test and benchmark the historical data fetchers without an account or the network. It logs in any user,
+enforces a requests per second limit (429 like Kite), can expire the session after some requests and answers the historical API with made up
+but repeatable candles. Example:
+    with FakeKite(latency = 0.2, rate = 3) as server:
+        kite = KiteZerodha(user_id = 'AB1234', password = 'x', two_factor_pin = '1', base_url = server.url)
+'''
+import json
+import re
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Lock
+from time import monotonic, sleep
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+
+class FakeKite:
+    '''
+    Threaded HTTP server on localhost
+    '''
+    def __init__(self, port:int = 0, latency:float = 0.1, rate:float = 3, expire_after:int = None, max_days:dict = None):
+        '''
+        args:
+            port: Port to listen on. 0 picks a free one
+            latency: Seconds taken to answer every historical request
+            rate: Maximum no of historical requests per second. Requests above it get 429. None for no limit
+            expire_after: Expire the session (403) after these many historical requests so that the client has to log in again. None never expires
+            max_days: Dictonary of {interval in minutes (None for daily): maximum no of days in one request}. Longer ranges get 400 like Kite. None for no limit
+        '''
+        self.port = port
+        self.latency = latency
+        self.rate = rate
+        self.expire_after = expire_after
+        self.max_days = max_days
+        self.counts = {'login': 0, 'historical': 0, 'limited': 0, 'expired': 0, 'in_flight': 0, 'peak': 0}
+        self.token = None
+        self._served = 0 # Historical requests served with the current token
+        self._times = [] # Times of the recent historical requests for the rate limit
+        self._lock = Lock()
+        self._server = None
+
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}/'
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                fake.answer(self, 'POST')
+
+            def do_GET(self):
+                fake.answer(self, 'GET')
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self._server.daemon_threads = True
+        Thread(target = self._server.serve_forever, daemon = True).start()
+        return self
+
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+    def answer(self, handler, method:str):
+        '''
+        Reply to a request
+        '''
+        path = urlsplit(handler.path).path
+        if method == 'POST' and path == '/api/login':
+            return self.send(handler, 200, {'status': 'success', 'data': {'request_id': 'fake'}})
+
+        if method == 'POST' and path == '/api/twofa':
+            with self._lock:
+                self.counts['login'] += 1
+                self.token = f"token{self.counts['login']}"
+                self._served = 0
+            return self.send(handler, 200, {'status': 'success', 'data': {}}, {'Set-Cookie': f'enctoken={self.token}; Path=/'})
+
+        found = re.fullmatch(r'/oms/instruments/historical/(\d+)/(\w+)', path)
+        if method == 'GET' and found:
+            return self.historical(handler, int(found.group(1)), found.group(2), parse_qs(urlsplit(handler.path).query))
+
+        self.send(handler, 404, {'status': 'error', 'message': 'Not found'})
+
+
+    def historical(self, handler, code:int, interval:str, query:dict):
+        '''
+        Candles of a made up instrument. Same code, interval and date always give the same candles
+        '''
+        with self._lock:
+            now = monotonic()
+            self._times = [moment for moment in self._times if now - moment < 1]
+            if self.rate and len(self._times) >= self.rate:
+                self.counts['limited'] += 1
+                return self.send(handler, 429, {'status': 'error', 'message': 'Too many requests', 'error_type': 'NetworkException'})
+            self._times.append(now)
+
+            if handler.headers.get('Authorization') != f'enctoken {self.token}' or (self.expire_after and self._served >= self.expire_after):
+                self.counts['expired'] += 1
+                return self.send(handler, 403, {'status': 'error', 'message': 'Incorrect `api_key` or `access_token`.', 'error_type': 'TokenException'})
+            self._served += 1
+            self.counts['historical'] += 1
+            self.counts['in_flight'] += 1
+            self.counts['peak'] = max(self.counts['peak'], self.counts['in_flight'])
+
+        try:
+            start, end = (datetime.strptime(query[key][0], '%Y-%m-%d') for key in ('from', 'to'))
+            minutes = None if interval == 'day' else int(interval.replace('minute', ''))
+            if self.max_days and (minutes in self.max_days) and ((end - start).days > self.max_days[minutes]):
+                return self.send(handler, 400, {'status': 'error', 'message': 'interval exceeds max limit', 'error_type': 'InputException'})
+            sleep(self.latency)
+            self.send(handler, 200, {'status': 'success', 'data': {'candles': candles(code, minutes, start, end)}})
+        finally:
+            with self._lock:
+                self.counts['in_flight'] -= 1
+
+
+    def send(self, handler, status:int, body:dict, headers:dict = {}):
+        content = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(content)))
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(content)
+
+
+def candles(code:int, interval:int, start:datetime, end:datetime):
+    '''
+    Made up candles from 9:15 to 15:30 of every week day between the dates (both included) in the format of Kite: [time, open, high, low, close, volume, oi]
+    args:
+        code: Instrument code. Seed of the prices
+        interval: Minutes of every candle. None for daily candles
+        start, end: First and last date
+    '''
+    result = []
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            times = [day] if interval is None else [day + timedelta(minutes = 555 + i * interval) for i in range(375 // interval)]
+            random = np.random.default_rng([code, interval or 0, day.toordinal()])
+            close = 100 + (code % 1000) / 10 + np.cumsum(random.normal(0, 0.5, len(times)))
+            open = close + random.normal(0, 0.2, len(times))
+            high = np.maximum(open, close) + random.random(len(times))
+            low = np.minimum(open, close) - random.random(len(times))
+            volume = random.integers(1000, 100000, len(times))
+            result.extend([moment.strftime('%Y-%m-%dT%H:%M:%S+0530'), round(o, 2), round(h, 2), round(l, 2), round(c, 2), int(v), 0]
+                          for moment, o, h, l, c, v in zip(times, open, high, low, close, volume))
+        day += timedelta(days = 1)
+    return result
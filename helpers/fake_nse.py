@@ -0,0 +1,189 @@
+'''
+Local stand in for the NSE website to test NSEData and AsyncNSEData without the network. It gives the cookies on the home page like NSE, answers
+401 to the API without them, can expire the cookies or fail the next few requests on purpose and answers the APIs with made up but repeatable data. Example:
+    with FakeNSE(latency = 0.1) as server:
+        nse = AsyncNSEData(baseurl = server.url)
+'''
+import json
+import zlib
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from http.cookies import SimpleCookie
+from threading import Thread, Lock
+from time import sleep
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+
+
+class FakeNSE:
+    '''
+    Threaded HTTP server on localhost
+    '''
+    def __init__(self, port:int = 0, latency:float = 0.05, indices:int = 20, members:int = 30):
+        '''
+        args:
+            port: Port to listen on. 0 picks a free one
+            latency: Seconds taken to answer every API request
+            indices: No of made up indices named 'INDEX 0', 'INDEX 1' ...
+            members: No of stocks in every index
+        '''
+        self.port = port
+        self.latency = latency
+        self.indices = [f'INDEX {i}' for i in range(indices)]
+        self.members = members
+        self.counts = {'home': 0, 'api': 0, 'unauthorized': 0, 'failed': 0, 'in_flight': 0, 'peak': 0}
+        self.failures = [] # Status codes to answer the next API requests with, in order
+        self.tokens = set() # Cookies given and not expired yet. Every client has its own like on NSE
+        self._lock = Lock()
+        self._server = None
+
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_address[1]}/'
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.answer(self)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.port), Handler)
+        self._server.daemon_threads = True
+        Thread(target = self._server.serve_forever, daemon = True).start()
+        return self
+
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+    def fail(self, statuses:list):
+        '''
+        Answer the next API requests with these status codes (such as [503, 429]) before answering normally again
+        '''
+        with self._lock:
+            self.failures.extend(statuses)
+
+
+    def expire(self):
+        '''
+        Expire all the cookies given so far. API requests get 401 till the home page is visited again
+        '''
+        with self._lock:
+            self.tokens.clear()
+
+
+    def answer(self, handler):
+        '''
+        Reply to a request
+        '''
+        parts = urlsplit(handler.path)
+        query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+        if parts.path == '/':
+            with self._lock:
+                self.counts['home'] += 1
+                token = f"token{self.counts['home']}"
+                self.tokens.add(token)
+            return self.send(handler, 200, b'<html>NSE</html>', 'text/html', {'Set-Cookie': f'nsit={token}; Path=/'})
+
+        routes = {'/api/allIndices': self.all_indices, '/api/equity-stockIndices': self.index, '/api/historical/cm/equity': self.historical,
+                  '/api/live-analysis-52Week': self.fifty_two_week}
+        if parts.path not in routes:
+            return self.send(handler, 404, {'error': 'Not found'})
+
+        cookies = SimpleCookie(handler.headers.get('Cookie', ''))
+        with self._lock:
+            self.counts['api'] += 1
+            if self.failures:
+                self.counts['failed'] += 1
+                return self.send(handler, self.failures.pop(0), {'error': 'Failed on purpose'})
+            if ('nsit' not in cookies) or (cookies['nsit'].value not in self.tokens):
+                self.counts['unauthorized'] += 1
+                return self.send(handler, 401, {'error': 'Unauthorized'})
+            self.counts['in_flight'] += 1
+            self.counts['peak'] = max(self.counts['peak'], self.counts['in_flight'])
+
+        try:
+            sleep(self.latency)
+            body = routes[parts.path](query)
+            self.send(handler, 200 if body is not None else 404, body if body is not None else {'error': 'Not found'})
+        finally:
+            with self._lock:
+                self.counts['in_flight'] -= 1
+
+
+    def send(self, handler, status:int, body, content_type:str = 'application/json', headers:dict = {}):
+        content = body if isinstance(body, bytes) else json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(len(content)))
+        for key, value in headers.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(content)
+
+
+    def all_indices(self, query:dict):
+        rows = []
+        for i, name in enumerate(self.indices):
+            random = np.random.default_rng(seed(name))
+            last = round(float(random.uniform(1000, 40000)), 2)
+            change = round(float(random.normal(0, 1.5)), 2)
+            rows.append({'key': 'INDICES ELIGIBLE IN DERIVATIVES' if i < 3 else 'SECTORAL INDICES', 'index': name, 'indexSymbol': name, 'last': last,
+                         'variation': round(last * change / 100, 2), 'percentChange': change, 'open': last, 'high': last, 'low': last})
+        return {'data': rows}
+
+
+    def index(self, query:dict):
+        name = query.get('index')
+        if name not in self.indices:
+            return None
+        rows = []
+        for i, symbol in enumerate([name] + [f"{name.replace(' ', '')}S{j}" for j in range(self.members)]):
+            random = np.random.default_rng(seed(symbol))
+            close = round(float(random.uniform(50, 5000)), 2)
+            change = round(float(random.normal(0, 2)), 2)
+            last = round(close * (1 + change / 100), 2)
+            rows.append({'priority': int(i == 0), 'symbol': symbol, 'identifier': f'{symbol}EQN', 'open': close, 'dayHigh': max(close, last) + 1,
+                         'dayLow': min(close, last) - 1, 'lastPrice': last, 'previousClose': close, 'change': round(last - close, 2), 'pChange': change})
+        return {'name': name, 'data': rows}
+
+
+    def historical(self, query:dict):
+        symbol = query.get('symbol', '')
+        random = np.random.default_rng(seed(symbol))
+        close = 100 + np.cumsum(random.normal(0, 1, 50))
+        return {'data': [{'CH_SYMBOL': symbol, 'CH_TIMESTAMP': f'2021-{10 + i // 30:02d}-{1 + i % 30:02d}', 'CH_OPENING_PRICE': round(c - 0.5, 2),
+                          'CH_TRADE_HIGH_PRICE': round(c + 1, 2), 'CH_TRADE_LOW_PRICE': round(c - 1, 2), 'CH_CLOSING_PRICE': round(c, 2),
+                          'CH_52WEEK_HIGH_PRICE': round(close.max() + 1, 2), 'CH_52WEEK_LOW_PRICE': round(close.min() - 1, 2)} for i, c in enumerate(close)]}
+
+
+    def fifty_two_week(self, query:dict):
+        direction = query.get('index', 'high')
+        random = np.random.default_rng(seed(direction))
+        rows = [{'symbol': f'{direction.upper()}{i}', 'ltp': round(float(random.uniform(5, 500)), 2), 'pChange': round(float(random.normal(0, 2)), 2)} for i in range(10)]
+        return {'dataLtpGreater20': [row for row in rows if row['ltp'] >= 20], 'dataLtpLess20': [row for row in rows if row['ltp'] < 20]}
+
+
+def seed(text:str):
+    '''
+    Seed of the made up values of a name. Same on every run unlike hash()
+    '''
+    return zlib.crc32(text.encode())
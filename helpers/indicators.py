@@ -0,0 +1,474 @@
+'''
+Vectorized indicators for the whole universe at once. Every function works on 2D arrays of shape (bars, symbols) sorted from the Oldest to the Newest bar
+and gives the same values as the per stock functions of AnalyseStocks (which use the "ta" library and pandas).
+Bars of every symbol must start at row 0 (see "left_align"). Rows after the last bar of a symbol are NaN and whatever is computed there is ignored
+'''
+import numpy as np
+import pandas as pd
+from copy import copy
+
+from .candlestick import CandlePattern, single_names, double_names, triple_names
+
+
+def left_align(values, mask):
+    '''
+    Move the valid rows of every column to the top so that the history of every symbol starts at row 0. Dates where a symbol did not trade are dropped,
+    exactly like they are absent from it's DataFrame
+    args:
+        values: 2D array (dates x symbols)
+        mask: 2D boolean array which is True where the value is valid
+    returns: Tuple of (aligned 2D array, row order used, length of every column)
+    '''
+    order = np.argsort(~mask, axis = 0, kind = 'stable')
+    lengths = mask.sum(axis = 0)
+    aligned = np.take_along_axis(values, order, axis = 0).astype('float64')
+    aligned[np.arange(values.shape[0])[:, None] >= lengths[None, :]] = np.nan
+    return aligned, order, lengths
+
+
+def scatter_back(aligned, order, lengths):
+    '''
+    Inverse of "left_align". Put the values back on their dates
+    args:
+        aligned: 2D array returned by an indicator on left aligned arrays
+        order, lengths: As returned by "left_align"
+    '''
+    out = np.full(aligned.shape, np.nan)
+    valid = np.arange(aligned.shape[0])[:, None] < lengths[None, :]
+    np.put_along_axis(out, order, np.where(valid, aligned, np.nan), axis = 0)
+    return out
+
+
+def latest(aligned, lengths):
+    '''
+    Value at the last bar of every column
+    args:
+        aligned: Left aligned 2D array
+        lengths: No of bars of every column
+    '''
+    rows = np.maximum(lengths - 1, 0)
+    values = aligned[rows, np.arange(aligned.shape[1])].astype('float64')
+    values[lengths == 0] = np.nan
+    return values
+
+
+def shift(x, n:int = 1):
+    '''
+    Shift down by "n" rows like pandas.Series.shift
+    '''
+    out = np.full(x.shape, np.nan)
+    out[n:] = x[:-n]
+    return out
+
+
+def rolling_sum(x, window:int):
+    '''
+    Rolling sum which is NaN until the window is full or if any value inside the window is NaN
+    '''
+    out = np.full(x.shape, np.nan)
+    if window > x.shape[0]:
+        return out
+    total = x[window - 1:].copy()
+    for k in range(1, window):
+        total += x[window - 1 - k: x.shape[0] - k]
+    out[window - 1:] = total
+    return out
+
+
+def rolling_mean(x, window:int, min_periods:int = None):
+    '''
+    Same as pandas rolling(window, min_periods).mean() for left aligned arrays
+    args:
+        x: 2D array
+        window: Length of the window
+        min_periods: Minimum no of values. Default is the window. 1 gives the expanding mean for the first rows like get_MA
+    '''
+    min_periods = window if min_periods is None else min_periods
+    if min_periods >= window:
+        return rolling_sum(x, window) / window
+
+    # Same kernel as pandas so that the values are equal to the last bit. A running cumsum drifts enough to flip roundings
+    return pd.DataFrame(x).rolling(window, min_periods = min_periods).mean().values
+
+
+def rolling_extreme(x, window:int, kind:str = 'max'):
+    '''
+    Rolling max or min which is NaN until the window is full
+    '''
+    func = np.maximum if kind == 'max' else np.minimum
+    out = np.full(x.shape, np.nan)
+    if window > x.shape[0]:
+        return out
+    result = x[window - 1:].copy()
+    for k in range(1, window):
+        result = func(result, x[window - 1 - k: x.shape[0] - k])
+    out[window - 1:] = result
+    return out
+
+
+def ewm_mean(x, alpha:float, adjust:bool = False, min_periods:int = 0):
+    '''
+    Same as pandas ewm(alpha, adjust, min_periods).mean(). Leading NaN (such as the first value of a diff) are skipped
+    args:
+        x: 2D array
+        alpha: Smoothing factor. span gives 2 / (span + 1) and com gives 1 / (1 + com)
+        adjust: Whether to use the adjusted (weights) formula
+        min_periods: Minimum number of non NaN values to return a value
+    '''
+    decay = 1 - alpha
+    out = np.full(x.shape, np.nan)
+    count = np.zeros(x.shape[1])
+    num = np.zeros(x.shape[1])
+    den = np.zeros(x.shape[1])
+    value = np.full(x.shape[1], np.nan)
+
+    for t in range(x.shape[0]):
+        current = x[t]
+        valid = ~np.isnan(current)
+        if adjust:
+            num = np.where(valid, current + decay * num, num)
+            den = np.where(valid, 1 + decay * den, den)
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                value = num / den
+        else:
+            value = np.where(valid, np.where(count == 0, current, alpha * current + decay * value), value)
+        count += valid
+        out[t] = np.where(count >= max(min_periods, 1), value, np.nan)
+    return out
+
+
+def moving_average(close, window:int = 44, simple:bool = True):
+    '''
+    Same as AnalyseStocks.get_MA
+    '''
+    if simple:
+        return rolling_mean(close, window, min_periods = 1)
+    return ewm_mean(close, 2 / (window + 1), adjust = False, min_periods = 1)
+
+
+def rsi(close, periods:int = 14, ema:bool = True):
+    '''
+    Same as AnalyseStocks.get_RSI
+    '''
+    delta = close - shift(close)
+    up = np.where(delta > 0, delta, np.where(np.isnan(delta), np.nan, 0))
+    down = np.where(delta < 0, -delta, np.where(np.isnan(delta), np.nan, 0))
+
+    if ema:
+        ma_up = ewm_mean(up, 1 / periods, adjust = True, min_periods = periods)
+        ma_down = ewm_mean(down, 1 / periods, adjust = True, min_periods = periods)
+    else:
+        ma_up = rolling_mean(up, periods)
+        ma_down = rolling_mean(down, periods)
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return 100 - (100 / (1 + ma_up / ma_down))
+
+
+def true_range(high, low, close):
+    '''
+    True Range as in "ta". First bar has no previous close so it is High - Low
+    '''
+    prev_close = shift(close)
+    return np.fmax(np.fmax(high - low, np.abs(high - prev_close)), np.abs(low - prev_close))
+
+
+def atr(high, low, close, lengths, window:int = 14):
+    '''
+    Same as AnalyseStocks.get_ATR (Wilder smoothing from "ta"). Symbols with less than "window" bars are NaN
+    '''
+    tr = true_range(high, low, close)
+    out = np.zeros(tr.shape)
+    if window <= tr.shape[0]:
+        out[window - 1] = tr[:window].mean(axis = 0)
+        for i in range(window, tr.shape[0]):
+            out[i] = (out[i - 1] * (window - 1) + tr[i]) / window
+    out[:, lengths < window] = np.nan
+    return out
+
+
+def cci(high, low, close, window:int = 20, constant:float = 0.015):
+    '''
+    Same as AnalyseStocks.get_CCI
+    '''
+    typical = (high + low + close) / 3.0
+    mean = rolling_sum(typical, window) / window
+
+    deviation = np.full(typical.shape, np.nan)
+    if window <= typical.shape[0]:
+        total = np.zeros((typical.shape[0] - window + 1, typical.shape[1]))
+        for k in range(window):
+            total += np.abs(typical[window - 1 - k: typical.shape[0] - k] - mean[window - 1:])
+        deviation[window - 1:] = total / window
+
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        return (typical - mean) / (constant * deviation)
+
+
+def adx(high, low, close, lengths, window:int = 14):
+    '''
+    Same as AnalyseStocks.get_ADX which uses the ADXIndicator of "ta" (including it's alignment of the +DI and -DI)
+    returns: Tuple of 2D arrays (-DI, +DI, ADX). Symbols with less than 2*window bars are NaN
+    '''
+    bars, symbols = close.shape
+    prev_close = shift(close)
+    tr = np.maximum(high, prev_close) - np.minimum(low, prev_close) # NaN at first bar like "ta"
+
+    diff_up = high - shift(high)
+    diff_down = shift(low) - low
+    pos = np.where((diff_up > diff_down) & (diff_up > 0), diff_up, 0.0)
+    neg = np.where((diff_down > diff_up) & (diff_down > 0), diff_down, 0.0)
+
+    size = bars - window + 1
+    trs = np.zeros((max(size, 1), symbols))
+    dip = np.zeros(trs.shape)
+    din = np.zeros(trs.shape)
+    neg_di = np.zeros((bars, symbols))
+    pos_di = np.zeros((bars, symbols))
+    adx_ = np.zeros((bars, symbols))
+
+    if size > window:
+        trs[0] = tr[1:window + 1].sum(axis = 0)
+        dip[0] = pos[1:window + 1].sum(axis = 0)
+        din[0] = neg[1:window + 1].sum(axis = 0)
+        for i in range(1, size):
+            trs[i] = trs[i - 1] - (trs[i - 1] / window) + tr[window + i] if window + i < bars else 0
+            dip[i] = dip[i - 1] - (dip[i - 1] / window) + pos[window + i] if window + i < bars else 0
+            din[i] = din[i - 1] - (din[i - 1] / window) + neg[window + i] if window + i < bars else 0
+
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            dip_perc = np.where(trs != 0, 100 * dip / trs, 0)
+            din_perc = np.where(trs != 0, 100 * din / trs, 0)
+            total = dip_perc + din_perc
+            directional = np.where(total != 0, 100 * np.abs((dip_perc - din_perc) / total), 0)
+
+        smooth = np.zeros(trs.shape)
+        smooth[window] = directional[:window].mean(axis = 0)
+        for i in range(window + 1, size):
+            smooth[i] = (smooth[i - 1] * (window - 1) + directional[i - 1]) / window
+        adx_[window - 1:] = smooth
+
+        pos_di[window + 1:] = dip_perc[1:size - 1] # "ta" puts the i-th value at i + window
+        neg_di[window + 1:] = din_perc[1:size - 1]
+
+    short = lengths < 2 * window
+    for array in (neg_di, pos_di, adx_):
+        array[:, short] = np.nan
+    return neg_di, pos_di, adx_
+
+
+def macd_diff(close, window_slow:int = 26, window_fast:int = 12, window_sign:int = 9):
+    '''
+    Same as ta.trend.macd_diff used by AnalyseStocks.macd_signal
+    '''
+    fast = ewm_mean(close, 2 / (window_fast + 1), adjust = False, min_periods = window_fast)
+    slow = ewm_mean(close, 2 / (window_slow + 1), adjust = False, min_periods = window_slow)
+    macd = fast - slow
+    signal = ewm_mean(macd, 2 / (window_sign + 1), adjust = False, min_periods = window_sign)
+    return macd - signal
+
+
+def stochastic(high, low, close, k_period:int = 14, d_period:int = 3, smooth_k:int = 3):
+    '''
+    Same as AnalyseStocks.Stochastic
+    returns: Tuple of 2D arrays (Blue Line, Red Line)
+    '''
+    n_high = rolling_extreme(high, k_period, 'max')
+    n_low = rolling_extreme(low, k_period, 'min')
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        blue = (close - n_low) * 100 / (n_high - n_low)
+    if smooth_k > 1:
+        blue = rolling_mean(blue, smooth_k)
+    red = rolling_mean(blue, d_period)
+    return blue, red
+
+
+def bollinger(close, window:int = 20):
+    '''
+    Same as AnalyseStocks.get_BollingerBands
+    returns: Tuple of 2D arrays (Upper, Lower)
+    '''
+    mean = rolling_mean(close, window)
+    std = np.sqrt(np.maximum(rolling_mean(close ** 2, window) - mean ** 2, 0))
+    return mean + 2 * std, mean - 2 * std
+
+
+def ichimoku(high, low, conversion:int = 9, base:int = 26, span_b:int = 52, displacement:int = 26):
+    '''
+    Same as AnalyseStocks.Ichimoku_Cloud. Lagging line is just the Close plotted "displacement" bars back so it is not returned
+    returns: Tuple of 2D arrays (blue_line, red_line, cloud_green_line_a, cloud_red_line_b)
+    '''
+    mid = lambda window: (rolling_extreme(high, window, 'max') + rolling_extreme(low, window, 'min')) / 2
+    blue, red = mid(conversion), mid(base)
+    return blue, red, shift((blue + red) / 2, displacement), shift(mid(span_b), displacement)
+
+
+class BatchIndicators:
+    '''
+    Indicators for every symbol of a PricePanel in one call. Results are either the latest value of every symbol (pandas Series indexed by symbol)
+    or the full series (DataFrame of dates x symbols)
+    '''
+    def __init__(self, panel):
+        '''
+        args:
+            panel: PricePanel object. See DataHandler.get_panel
+        '''
+        self.panel = panel
+        self.symbols = panel.symbols
+        self.open, self.order, self.lengths = left_align(panel['OPEN'], panel.mask)
+        self.high = left_align(panel['HIGH'], panel.mask)[0]
+        self.low = left_align(panel['LOW'], panel.mask)[0]
+        self.close = left_align(panel['CLOSE'], panel.mask)[0]
+
+
+    def subset(self, symbols:list):
+        '''
+        Same object for only a few of the symbols, without aligning the arrays again
+        args:
+            symbols: List of symbols present in the panel
+        '''
+        cols = [self.panel.columns[name] for name in symbols]
+        other = copy(self)
+        other.symbols = list(symbols)
+        for attr in ('open', 'high', 'low', 'close', 'order', 'lengths'):
+            setattr(other, attr, getattr(self, attr)[..., cols])
+        return other
+
+
+    def _result(self, aligned, name:str, latest_only:bool = True):
+        if latest_only:
+            return pd.Series(latest(aligned, self.lengths), index = self.symbols, name = name)
+        return pd.DataFrame(scatter_back(aligned, self.order, self.lengths), index = self.panel.dates, columns = self.symbols)
+
+
+    def previous(self, aligned):
+        '''
+        Value at the second last bar of every symbol
+        '''
+        return latest(aligned, self.lengths - 1)
+
+
+    def MA(self, window:int = 44, simple:bool = True, latest_only:bool = True):
+        return self._result(moving_average(self.close, window, simple), f'{window}-MA', latest_only)
+
+
+    def RSI(self, periods:int = 14, ema:bool = True, latest_only:bool = True):
+        return self._result(rsi(self.close, periods, ema), 'RSI', latest_only)
+
+
+    def ATR(self, window:int = 14, latest_only:bool = True):
+        return self._result(atr(self.high, self.low, self.close, self.lengths, window), 'ATR', latest_only)
+
+
+    def CCI(self, window:int = 20, latest_only:bool = True):
+        return self._result(cci(self.high, self.low, self.close, window), 'CCI', latest_only)
+
+
+    def ADX(self, window:int = 14, latest_only:bool = True):
+        return self._result(adx(self.high, self.low, self.close, self.lengths, window)[-1], 'ADX', latest_only)
+
+
+    def MACD_diff(self, window_slow:int = 26, window_fast:int = 12, window_sign:int = 9, latest_only:bool = True):
+        return self._result(macd_diff(self.close, window_slow, window_fast, window_sign), 'MACD Diff', latest_only)
+
+
+    def Stochastic(self, k_period:int = 14, d_period:int = 3, smooth_k:int = 3, latest_only:bool = True):
+        blue, red = stochastic(self.high, self.low, self.close, k_period, d_period, smooth_k)
+        return self._result(blue, 'Blue Line', latest_only), self._result(red, 'Red Line', latest_only)
+
+
+    def MACD_signal(self):
+        '''
+        Same as AnalyseStocks.macd_signal for every symbol
+        '''
+        values = macd_diff(self.close)
+        previous, current = self.previous(values), latest(values, self.lengths)
+        return pd.Series(np.select([(previous < 0) & (current > 0), (previous > 0) & (current < 0)], ['Buy','Sell'], 'No Signal'), index = self.symbols, name = 'MACD Signal')
+
+
+    def Ichi_count(self):
+        '''
+        Same as AnalyseStocks.Ichi_count(AnalyseStocks.Ichimoku_Cloud(df)) for every symbol. Lagging Line condition needs 27 bars, it is not counted for shorter histories
+        '''
+        blue, red, line_a, line_b = ichimoku(self.high, self.low)
+        low = latest(self.low, self.lengths)
+
+        count = ((latest(line_a, self.lengths) < low) & (latest(line_b, self.lengths) < low)).astype(int) # Cloud Below
+        count += (latest(self.close, self.lengths) > latest(self.high, self.lengths - 26)) & (self.lengths > 26) # Lagging Line
+        count += (self.previous(blue) <= self.previous(red)) & (latest(blue, self.lengths) >= latest(red, self.lengths)) # Cross Over
+        return pd.Series(count, index = self.symbols, name = 'Ichi')
+
+
+    def Candle_patterns(self, latest_only:bool = True):
+        '''
+        Name of the Candle, Double Candle and Triple Candle pattern. Same as CandlePattern.find_name, double_candle_pattern and triple_candle_pattern
+        returns: DataFrame (symbols x patterns) of the latest values or a Dictonary of {pattern: DataFrame of dates x symbols}
+        '''
+        CP = CandlePattern()
+        prices = (self.open, self.close, self.low, self.high)
+        result = {}
+        for name, codes, categories in (('Candle', CP.name_codes(*prices), single_names), ('Double Candle', CP.double_codes(*prices), double_names),
+                                        ('Triple Candle', CP.triple_codes(*prices), triple_names)):
+            if latest_only:
+                values = np.nan_to_num(latest(codes, self.lengths), nan = -1).astype(int)
+                result[name] = pd.Categorical.from_codes(values, categories)
+            else:
+                values = np.nan_to_num(scatter_back(codes.astype('float64'), self.order, self.lengths), nan = -1).astype(int)
+                result[name] = pd.DataFrame({symbol: pd.Categorical.from_codes(values[:, i], categories) for i, symbol in enumerate(self.symbols)}, index = self.panel.dates)
+
+        return pd.DataFrame(result, index = self.symbols) if latest_only else result
+
+
+    def MA_eligible(self, limit:float, mv:int = 44):
+        '''
+        Same as AnalyseStocks.is_ma_eligible for every symbol
+        args:
+            limit: Limit difference between average and low/high threshold for selecting stocks
+            mv: Moving Average to Consider
+        returns: DataFrame of the eligible symbols only with the columns "Diff" and "Rising"
+        '''
+        average = moving_average(self.close, mv)
+        avg = latest(average, self.lengths)
+        open_, close, low, high = [latest(values, self.lengths) for values in (self.open, self.close, self.low, self.high)]
+
+        limit = low * 0.0015 if not limit else limit
+        diff = np.minimum.reduce([np.abs(low - avg), np.abs(high - avg), np.abs(open_ - avg), np.abs(close - avg)])
+        eligible = ~((close < avg) | (close < open_)) & (diff <= limit)
+
+        cols = np.flatnonzero(eligible)
+        rising = []
+        for col in cols: # Average of the previous (mv//2 - 1) averages, just like the DataFrame slicing of is_ma_eligible
+            values = average[max(self.lengths[col] + (-mv//2), 0): self.lengths[col] - 1, col]
+            rising.append(values.mean() < avg[col] if len(values) else False)
+
+        return pd.DataFrame({'Diff':np.round(diff[cols], 2), 'Rising':rising}, index = [self.symbols[col] for col in cols])
+
+
+    def table(self, mvs:list = [20,50,100,200]):
+        '''
+        Latest value of all the indicators for every symbol along with the signals used by AnalyseStocks
+        args:
+            mvs: Simple Moving Averages to add
+        '''
+        df = pd.DataFrame(index = self.symbols)
+        df['LTP'] = latest(self.close, self.lengths)
+        for mv in mvs:
+            df[f'{mv}-MA'] = latest(moving_average(self.close, mv), self.lengths)
+
+        values = rsi(self.close)
+        df['RSI'] = latest(values, self.lengths)
+
+        df['ATR'] = latest(atr(self.high, self.low, self.close, self.lengths), self.lengths)
+
+        values = cci(self.high, self.low, self.close)
+        df['CCI'] = np.round(latest(values, self.lengths), 2)
+        df['CCI Signal'] = np.select([(self.previous(values) < -100) & (df['CCI'].values > -100), (self.previous(values) > 100) & (df['CCI'].values < 100)], ['Buy','Sell'], 'No Signal')
+
+        df['ADX'] = latest(adx(self.high, self.low, self.close, self.lengths)[-1], self.lengths)
+
+        df['MACD Signal'] = self.MACD_signal().values
+
+        blue, red = stochastic(self.high, self.low, self.close)
+        df['Blue Line'] = latest(blue, self.lengths)
+        df['Red Line'] = latest(red, self.lengths)
+        return df
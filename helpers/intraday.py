@@ -2,9 +2,9 @@ from helpers.investing import *
 from datetime import date, datetime, timedelta
 import calendar
 from .nse_data import NSEData, requests
-from bs4 import BeautifulSoup
+from .lazy import LazyObject
 
-In = Investing()
+In = LazyObject(Investing) # Created on the first use so that importing does not read the data
 NSE = NSEData()
 present = date.today()
 
@@ -0,0 +1,289 @@
+'''
+Columnar store for the minutes data. Every symbol and interval has one Feather file per month so that an update only rewrites the current month
+and reading a date range only opens the months in it:
+    ./intraday_data/minutes_5/INFY/2022-01.feather
+An interval which is not stored is made from the finest stored interval that divides it (15 minutes from 5 or 3 minutes and so on) so only one
+interval has to be downloaded per stock
+'''
+import re
+
+import pandas as pd
+import numpy as np
+from pyarrow import feather
+
+from collections import OrderedDict
+from os import listdir, makedirs, replace, remove, stat
+from os.path import join, exists, isdir
+
+from .price_store import PriceStore, columns
+
+
+class IntradayStore:
+    '''
+    Append only store of the minutes candles partitioned by month. Candles are kept in the same columns as the daily data with naive IST times
+    '''
+    def __init__(self, path:str = './intraday_data', cache_size:int = 256):
+        '''
+        args:
+            path: Directory of the store. Legacy CSV files in the same directory are left as they are
+            cache_size: No of months of the derived intervals kept in memory
+        '''
+        self.path = path
+        self.cache_size = cache_size
+        self._derived = OrderedDict() # {(name, kind, month): (modified time of the base file, DataFrame)} least recently used first
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_derived'] = OrderedDict() # Never send the cached frames to worker processes
+        return state
+
+
+    def folder(self, name:str, kind:str):
+        '''
+        Directory of the monthly files of a symbol
+        args:
+            name: Name / ID given to the stock
+            kind: Any of [minutes_2, minutes_3, minutes_4, minutes_5, minutes_10, minutes_15, minutes_30, minutes_60]
+        '''
+        return join(self.path, kind, name)
+
+
+    def months(self, name:str, kind:str):
+        '''
+        Months present for a symbol, oldest first
+        returns: List of 'YYYY-MM'
+        '''
+        folder = self.folder(name, kind)
+        if not isdir(folder):
+            return []
+        return sorted(file[:-8] for file in listdir(folder) if file.endswith('.feather'))
+
+
+    def has(self, name:str, kind:str):
+        return len(self.months(name, kind)) > 0
+
+
+    def base(self, name:str, kind:str):
+        '''
+        Stored interval from which an interval can be made: the coarsest stored one which divides it as it has the fewest rows to read.
+        Sessions start at 9:15 so every such interval gives exactly the bars Kite would give. An interval stored itself is made too once its last bar ends
+        before the one of the base, as it is no longer downloaded with update_intraday_data(derive = True) and would give old candles
+        returns: kind of the base interval such as 'minutes_5' or None if the stored interval is up to date or it can not be made
+        '''
+        minutes = interval(kind)
+        if minutes is None:
+            return None
+        stored = [interval(folder) for folder in (listdir(self.path) if isdir(self.path) else [])]
+        stored = [each for each in stored if each and each < minutes and minutes % each == 0 and self.has(name, f'minutes_{each}')]
+        if not stored:
+            return None
+
+        ends = {each: self.last_date(name, f'minutes_{each}') + pd.Timedelta(minutes = each) for each in stored}
+        newest = max(ends.values())
+        if self.has(name, kind) and self.last_date(name, kind) + pd.Timedelta(minutes = minutes) >= newest:
+            return None
+        return f'minutes_{max(each for each in stored if ends[each] == newest)}'
+
+
+    def available(self, name:str, kind:str):
+        '''
+        Whether the interval is stored or can be made from a stored one
+        '''
+        return self.has(name, kind) or (self.base(name, kind) is not None)
+
+
+    def symbols(self, kind:str):
+        '''
+        Symbols present for an interval
+        '''
+        path = join(self.path, kind)
+        if not isdir(path):
+            return []
+        return sorted(name for name in listdir(path) if self.has(name, kind))
+
+
+    @staticmethod
+    def to_typed(df):
+        '''
+        Storage schema of PriceStore with the times converted to naive IST (Kite gives them with +05:30)
+        '''
+        df = df.copy()
+        dates = pd.to_datetime(df['DATE'])
+        if dates.dt.tz is not None:
+            dates = dates.dt.tz_convert('Asia/Kolkata').dt.tz_localize(None)
+        df['DATE'] = dates
+        return PriceStore.to_typed(df)
+
+
+    @staticmethod
+    def resample(df, minutes:int, session_start:str = '09:15'):
+        '''
+        Resample minutes candles to a coarser interval within every session. Bars start at the session open like the ones of Kite (9:15, 9:30 ...
+        for 15 minutes) and never span two days so the last bar of a day can be shorter
+        args:
+            df: DataFrame of the candles with the columns of the daily data in any order of time
+            minutes: Minutes of every new bar
+            session_start: Time at which the market opens
+        returns: DataFrame in the same columns, Newest first
+        '''
+        df = df.sort_values('DATE', kind = 'stable')
+        dates = df['DATE'].values.astype('datetime64[ns]')
+        opening = dates.astype('datetime64[D]') + (pd.Timedelta(session_start + ':00').to_timedelta64())
+        step = np.timedelta64(minutes, 'm').astype('timedelta64[ns]')
+        bars = opening + ((dates - opening) // step) * step
+
+        how = {'OPEN':'first', 'HIGH':'max', 'LOW':'min', 'CLOSE':'last'}
+        how.update({col:'last' for col in df.columns if col not in how and col != 'DATE'})
+        data = df.drop(columns = 'DATE').groupby(bars, sort = True).agg(how)
+        data.index.name = 'DATE'
+        return data.reset_index().loc[:, list(df.columns)].iloc[::-1].reset_index(drop = True)
+
+
+    @staticmethod
+    def window(start = None, end = None):
+        '''
+        Both ends of a date range as Timestamps. A missing end is open and an end without time includes that whole day
+        '''
+        start = pd.Timestamp(start) if start is not None else pd.Timestamp.min
+        end = pd.Timestamp(end) if end is not None else pd.Timestamp.max
+        if end == end.normalize():
+            end = end + pd.Timedelta(days = 1) - pd.Timedelta(1)
+        return start, end
+
+
+    def last_date(self, name:str, kind:str):
+        '''
+        Time of the last stored candle of a symbol. Only the DATE column of the newest month is read
+        returns: pandas Timestamp or None if nothing is stored
+        '''
+        months = self.months(name, kind)
+        if not months:
+            return None
+        dates = feather.read_table(join(self.folder(name, kind), f'{months[-1]}.feather'), columns = ['DATE'], memory_map = True).column('DATE')
+        return pd.Timestamp(dates[0].as_py()) if len(dates) else None
+
+
+    def append(self, name:str, kind:str, df):
+        '''
+        Add new candles. Only the months present in the new candles are rewritten and a candle already present is replaced by the new one
+        args:
+            name: Name / ID given to the stock
+            kind: Interval such as 'minutes_5'
+            df: DataFrame of the candles with the columns of the daily data
+        returns: No of new candles which were not present before
+        '''
+        if df is None or not len(df):
+            return 0
+        new = self.to_typed(df)
+        folder = self.folder(name, kind)
+        makedirs(folder, exist_ok = True)
+
+        added = 0
+        for month, part in new.groupby(new['DATE'].dt.strftime('%Y-%m')):
+            file = join(folder, f'{month}.feather')
+            if exists(file):
+                old = feather.read_feather(file, memory_map = True)
+                kept = old[~old['DATE'].isin(part['DATE'])]
+                added += len(part) - (len(old) - len(kept))
+                part = pd.concat([part, kept], ignore_index = True).sort_values('DATE', ascending = False).reset_index(drop = True)
+            else:
+                added += len(part)
+            feather.write_feather(part, file + '.tmp', compression = 'uncompressed')
+            replace(file + '.tmp', file) # Atomic so that a failed or interrupted run never leaves a half written file
+        return added
+
+
+    def read(self, name:str, kind:str, start = None, end = None):
+        '''
+        Candles of a symbol between two times (both included). Only the months in the range are opened
+        args:
+            name: Name / ID given to the stock
+            kind: Interval such as 'minutes_5'
+            start: First date / time. Default is the oldest stored
+            end: Last date / time. A date without time includes that whole day. Default is the newest stored
+        returns: DataFrame sorted with the Newest candle first, just like the CSV files
+        '''
+        start, end = self.window(start, end)
+        base = self.base(name, kind)
+        months = [month for month in self.months(name, base or kind) if start.strftime('%Y-%m') <= month <= end.strftime('%Y-%m')]
+        frames = []
+        for month in reversed(months): # Newest first
+            df = self._derive(name, kind, base, month) if base else self._month(name, kind, month)
+            frames.append(df[df['DATE'].between(start, end)])
+
+        df = pd.concat(frames, ignore_index = True) if frames else pd.DataFrame(columns = columns[:-1])
+        for col in columns[1:-1]:
+            df[col] = df[col].astype('float64').round(2) # Same values as the CSV files
+        df['DATE'] = df['DATE'].astype('datetime64[ns]')
+        df['SYMBOL'] = name
+        return df
+
+
+    def _month(self, name:str, kind:str, month:str):
+        return feather.read_feather(join(self.folder(name, kind), f'{month}.feather'), columns = columns[:-1], memory_map = True)
+
+
+    def _derive(self, name:str, kind:str, base:str, month:str):
+        '''
+        Bars of a month of an interval made from the base interval. Kept in memory till the base file changes
+        '''
+        key = (name, kind, month)
+        modified = stat(join(self.folder(name, base), f'{month}.feather')).st_mtime_ns
+        cached = self._derived.get(key)
+        if cached is not None and cached[0] == modified:
+            self._derived.move_to_end(key)
+            return cached[1]
+
+        df = self.resample(self._month(name, base, month), interval(kind))
+        self._derived[key] = (modified, df)
+        self._derived.move_to_end(key)
+        while len(self._derived) > self.cache_size:
+            self._derived.popitem(last = False)
+        return df
+
+
+    def dates(self, name:str, kind:str):
+        '''
+        Times of all the candles of a symbol without reading the prices
+        returns: Series of the times, newest first
+        '''
+        base = self.base(name, kind)
+        if base:
+            return self.read(name, kind)['DATE']
+        frames = [feather.read_feather(join(self.folder(name, kind), f'{month}.feather'), columns = ['DATE'], memory_map = True)['DATE']
+                  for month in reversed(self.months(name, kind))]
+        return pd.concat(frames, ignore_index = True).astype('datetime64[ns]') if frames else pd.Series([], dtype = 'datetime64[ns]')
+
+
+    def delete(self, name:str, kind:str):
+        '''
+        Remove all the candles of a symbol for an interval
+        '''
+        for month in self.months(name, kind):
+            remove(join(self.folder(name, kind), f'{month}.feather'))
+
+
+    def migrate_from_csv(self, kind:str, files:dict):
+        '''
+        Move the existing minutes CSV files into the store
+        args:
+            kind: Interval such as 'minutes_5'
+            files: Dictonary of {symbol: CSV file name in "path/kind"}
+        returns: List of symbols which were migrated
+        '''
+        migrated = []
+        for name, file in files.items():
+            file = join(self.path, kind, file)
+            if exists(file) and not self.has(name, kind):
+                self.append(name, kind, pd.read_csv(file))
+                migrated.append(name)
+        return migrated
+
+
+def interval(kind:str):
+    '''
+    Minutes of a kind such as 'minutes_15'. None if it is not a minutes kind
+    '''
+    found = re.fullmatch(r'minutes_(\d+)', kind)
+    return int(found.group(1)) if found else None
@@ -1,6 +1,9 @@
 from .candlestick import *
 from .datahandler import *
 from .stock_analyser import *
+from .indicators import BatchIndicators, latest
+from . import price_store
+from time import perf_counter
 
 CP = CandlePattern()
 
@@ -13,11 +16,11 @@ class Investing(AnalyseStocks):
         super().__init__(check_fresh = check_fresh)
         self.rm = rolling_mean
         self._eligible = None
-        self.data = self.read_data()
         self.all_ichi = None
         self.picked = None
         self._old_budget = -1
         self.diff = -1
+        self.timings = {} # Time taken by every stage of the last fused "calculate"
         
         
         
@@ -36,26 +39,30 @@ class Investing(AnalyseStocks):
             print(f"{symbol} does not belong in any of the Nifty, Sectoral and Thematic Indices")
       
 
-    def _get_all_ichi(self,budget:float, index:str='nifty_500', refit = False):
+    def _get_all_ichi(self,budget:float, index:str='nifty_500', refit = False, workers:int = None, cache:bool = True):
         '''
         Get all Stocks who are almost perfect for Ichimoku execution
         args:
             budget: Your Budget
             index: Which Index to Search
+            workers: No of worker processes. Default is 80% of the CPUs. 1 runs serially
+            cache: Whether to use the results cached on disk for the stocks which have no new data
         '''
         if self.all_ichi and  (not refit):
             return self.all_ichi
         
-        all_ichi = {}
-        data = self.data[index] if index else self.all_stocks
-        for name in data:
-            df = self.Ichimoku_Cloud(self.open_downloaded_stock(name))
-            count = self.Ichi_count(df) 
-            if count and df.loc[0,'HIGH'] < budget:
-                all_ichi[name] = count
-                
-        self.all_ichi = all_ichi
+        data = list(self.data[index] if index else self.all_stocks)
+        results = self._screen('_ichi_of', data, workers = workers, cache = cache)
+        self.all_ichi = {name: count for name, (count, high) in zip(data, results) if count and high < budget}
         return self.all_ichi
+
+
+    def _ichi_of(self, name:str):
+        '''
+        Ichimoku count and the latest High of a single stock. Budget is applied later so that the result can be cached for any budget
+        '''
+        df = self.Ichimoku_Cloud(self.open_downloaded_stock(name))
+        return self.Ichi_count(df), df.loc[0,'HIGH']
     
     
     def highlight_falling(self, s, column:str):
@@ -70,7 +77,7 @@ class Investing(AnalyseStocks):
         return ['' if is_max.any() else 'background-color: #f7a8a8' for v in is_max]
     
     
-    def calculate(self, budget, custom_stocks:bool=False,High:str = 'HIGH', Close:str = 'CLOSE', delta:float = 1, nifty:str = 'nifty_200', diff = 13, show_only:bool=True, ):
+    def calculate(self, budget, custom_stocks:bool=False,High:str = 'HIGH', Close:str = 'CLOSE', delta:float = 1, nifty:str = 'nifty_200', diff = 13, show_only:bool=True, fused:bool = True):
         '''
         Pick Stocks based on all available and which are within your budget
         args:
@@ -82,73 +89,73 @@ class Investing(AnalyseStocks):
             nifty: nifty index to consider
             show_only: If you want to see formatted part only
             diff: Max Allowed Distance between Min(close,open,low,high) and High
+            fused: Load every stock only once into the universe panel and compute all the columns together. Time taken by each stage is saved in "self.timings".
+                   False uses the old per stock functions which open the same stock multiple times
         ''' 
         refit = True if (self._old_budget < budget or self.diff != diff) else False
         self._old_budget = budget
         self.diff = diff
-        ichi = self._get_all_ichi(budget ,refit = refit)
-        
-        if (not self._eligible) or refit:
-            self._eligible  = self.update_eligible(limit = diff)
-        
-        if not custom_stocks: 
-            keys = set(self._eligible.keys()).intersection(set(self.data[nifty])) if nifty else list(self._eligible.keys()) 
-            if not len(keys):
-                warnings.warn('No matching Stocks Found. Increase Distance or Nifty Index')
+
+        if fused:
+            result = self._fused_columns(budget, custom_stocks, High, delta, nifty, diff, refit)
+            if result is None:
                 return None
-        else:
-            keys = custom_stocks
+            values, columns, ichi = result
         
-        values = []
-        one_can = []
-        two_can = []
-        three_can = []
-        atr = []
-        rsi = []
-        near_52 = []
-        macd_signal = []
-        cci_value = []
-        adx = []
-        
-        for key in keys:
-            try:
-                df = self.open_downloaded_stock(key)
-            except Exception as e:
-                    print('Exception Opening: ',key)
-                
-            if (df.loc[0,High] + delta > budget) or (df.loc[0,High] < 100):
-                del self._eligible[key]
-                
+        else:
+            ichi = self._get_all_ichi(budget ,refit = refit)
+            
+            if (not self._eligible) or refit:
+                self._eligible  = self.update_eligible(limit = diff)
+            
+            if not custom_stocks: 
+                keys = set(self._eligible.keys()).intersection(set(self.data[nifty])) if nifty else list(self._eligible.keys()) 
+                if not len(keys):
+                    warnings.warn('No matching Stocks Found. Increase Distance or Nifty Index')
+                    return None
             else:
-                values.append(df.iloc[0,:])
-                one_can.append(CP.find_name(df.loc[0,'OPEN'],df.loc[0,'CLOSE'],df.loc[0,'LOW'],df.loc[0,'HIGH']))
-                two_can.append(CP.double_candle_pattern(df))
-                three_can.append(CP.triple_candle_pattern(df))
-                rsi.append(self.get_RSI(df))
-                atr.append(self.get_ATR(df))
-                near_52.append(self.near_52(df))
-                macd_signal.append(self.macd_signal(df))
-                cci_value.append(self.get_CCI(df,signal_only=False, return_df=False))
-                adx.append(self.get_ADX(df))
-                
+                keys = custom_stocks
+            
+            values = []
+            columns = {'CCI Value':[], 'RSI Value':[], 'MACD Signal':[], 'ADX':[], 'Direction':[], 'ATR':[], 'Triple Candle':[], 'Double Candle':[], 'Recent Candle':[]}
+            
+            for key in keys:
+                try:
+                    df = self.open_downloaded_stock(key)
+                except Exception as e:
+                        print('Exception Opening: ',key)
+                    
+                if (df.loc[0,High] + delta > budget) or (df.loc[0,High] < 100):
+                    del self._eligible[key]
+                    
+                else:
+                    values.append(df.iloc[0,:])
+                    columns['Recent Candle'].append(CP.find_name(df.loc[0,'OPEN'],df.loc[0,'CLOSE'],df.loc[0,'LOW'],df.loc[0,'HIGH']))
+                    columns['Double Candle'].append(CP.double_candle_pattern(df))
+                    columns['Triple Candle'].append(CP.triple_candle_pattern(df))
+                    columns['RSI Value'].append(self.get_RSI(df))
+                    columns['ATR'].append(self.get_ATR(df))
+                    columns['Direction'].append(self.near_52(df))
+                    columns['MACD Signal'].append(self.macd_signal(df))
+                    columns['CCI Value'].append(self.get_CCI(df,signal_only=False, return_df=False))
+                    columns['ADX'].append(self.get_ADX(df))
                 
-        columns = df.columns
-        df = pd.DataFrame(values,columns=columns,index = range(len(values)))
+        df = pd.DataFrame(values,columns=price_store.columns,index = range(len(values)))
         df = df.merge(pd.DataFrame({'SYMBOL':self._eligible.keys(), 'Diff':self._eligible.values()}),on='SYMBOL')
         
         # df['Rising'] = df['SYMBOL'].apply(lambda x: self.rising[x]) # Get Rising or Falling
-        df['CCI Value'] = cci_value
-        df['RSI Value'] = rsi
-        df['MACD Signal'] = macd_signal
-        df['ADX'] = adx
-        df['Direction'] = near_52
+        df['CCI Value'] = columns['CCI Value']
+        df['RSI Value'] = columns['RSI Value']
+        df['MACD Signal'] = columns['MACD Signal']
+        df['ADX'] = columns['ADX']
+        df['Direction'] = columns['Direction']
         df['Ichi'] = df['SYMBOL'].apply(lambda x: ichi[x] if ichi.get(x) else 0)
         
-        df['ATR'] = atr
+        df['ATR'] = columns['ATR']
         
-        df['Triple Candle'] = three_can
-        df['Double Candle'] = two_can
-        df['Recent Candle'] = one_can
+        df['Triple Candle'] = columns['Triple Candle']
+        df['Double Candle'] = columns['Double Candle']
+        df['Recent Candle'] = columns['Recent Candle']
         
         df['Index'] = df['SYMBOL'].apply(lambda x: self.get_index(x)) # Get Rising or Falling
 
@@ -157,6 +164,89 @@ class Investing(AnalyseStocks):
             return self.picked.style.apply(self.highlight_falling, column=['Rising'], axis=1) # set style
         else:
             return self.picked
+
+
+    def _fused_columns(self, budget, custom_stocks, High:str, delta:float, nifty:str, diff, refit:bool):
+        '''
+        Single pass version of the screening done by "calculate". Every stock needed by the Ichimoku, Moving Average eligibility and the indicators is loaded only once
+        into the universe panel and all the columns are computed from it. Results are the same as the per stock functions
+        returns: Tuple of (latest rows, dictonary of columns, ichimoku counts) or None if nothing matches
+        '''
+        timings = {}
+        start = perf_counter()
+        names = list(dict.fromkeys(list(self.data['nifty_500']) + list(self.registered_stocks) + list(custom_stocks or [])))
+        panel = self.get_panel(names, refit = refit)
+        missing = [name for name in names if name not in panel.columns]
+        if missing:
+            warnings.warn(f"{len(missing)} stocks are not in the store and are skipped. Run DataHandler.migrate_to_store. Example: {missing[:5]}")
+        timings['Load'] = perf_counter() - start
+
+        start = perf_counter()
+        batch = BatchIndicators(panel)
+        high = pd.Series(latest(batch.high, batch.lengths), index = batch.symbols)
+        timings['Align'] = perf_counter() - start
+
+        start = perf_counter()
+        if (not self.all_ichi) or refit:
+            counts = batch.subset([name for name in self.data['nifty_500'] if name in panel.columns]).Ichi_count()
+            self.all_ichi = {name: count for name, count in counts.items() if count and high[name] < budget}
+        ichi = self.all_ichi
+        timings['Ichimoku'] = perf_counter() - start
+
+        start = perf_counter()
+        if (not self._eligible) or refit:
+            eligible = batch.subset([name for name in self.registered_stocks if name in panel.columns]).MA_eligible(diff)
+            self.rising.update(eligible['Rising'])
+            self.eligible = eligible['Diff'].to_dict()
+            self._eligible = self.eligible
+        timings['Eligibility'] = perf_counter() - start
+
+        if not custom_stocks:
+            keys = [name for name in self._eligible if name in set(self.data[nifty])] if nifty else list(self._eligible.keys())
+            if not len(keys):
+                warnings.warn('No matching Stocks Found. Increase Distance or Nifty Index')
+                self.timings = timings
+                return None
+        else:
+            keys = custom_stocks
+
+        picked = []
+        for key in keys:
+            if key not in panel.columns:
+                continue
+            if (high[key] + delta > budget) or (high[key] < 100):
+                self._eligible.pop(key, None)
+            else:
+                picked.append(key)
+
+        start = perf_counter()
+        columns = {}
+        if picked:
+            sub = batch.subset(picked)
+            columns['CCI Value'] = np.round(sub.CCI().values, 2).tolist()
+            columns['RSI Value'] = sub.RSI().tolist()
+            columns['MACD Signal'] = sub.MACD_signal().tolist()
+            columns['ADX'] = sub.ADX().tolist()
+            columns['ATR'] = sub.ATR().tolist()
+        timings['Indicators'] = perf_counter() - start
+
+        start = perf_counter()
+        values = []
+        for name in ('Direction', 'Triple Candle', 'Double Candle', 'Recent Candle'):
+            columns[name] = []
+        for key in picked:
+            df = panel.frame(key).head(3) # Only the last 3 candles are used
+            values.append(df.iloc[0,:])
+            columns['Direction'].append(self.near_52(df))
+        if picked:
+            patterns = sub.Candle_patterns()
+            for name in ('Recent Candle', 'Double Candle', 'Triple Candle'):
+                columns[name] = patterns['Candle' if name == 'Recent Candle' else name].astype(object).tolist()
+        timings['Patterns'] = perf_counter() - start
+
+        timings['Total'] = sum(timings.values())
+        self.timings = {f'{stage} (s)': round(value, 4) for stage, value in timings.items()}
+        return values, columns, ichi
         
         
     def show_full_stats(self, budget,risk, custom_stocks:bool = False, High = 'HIGH', Close = 'CLOSE', delta:float=1, diff:float = 13, nifty:str = 'nifty_500'):
@@ -198,6 +288,19 @@ class Investing(AnalyseStocks):
         return pic
         
         
+    @staticmethod
+    def position_size(entry, stop_loss, budget:float, risk:float):
+        '''
+        No of shares so that hitting the stop loss loses at most "risk" and the investment is within the "budget". Works on arrays of prices too
+        args:
+            entry: Buying Price
+            stop_loss: Stop Loss Price
+            budget: Money available for this trade
+            risk: Max loss allowed on this trade
+        '''
+        return np.minimum(risk // (entry - stop_loss), budget // entry)
+
+
     def get_particulars(self, name, budget:float, risk:float, risk_to_reward_ratio:float=2, leverage:float = 1, entry:float=None, stop_loss:float=None, Low:str = 'LOW', High:str = 'HIGH', delta:float = 0.001, plot_candle:bool = False):
         '''
         Display the particulars of a trade before buying
@@ -239,7 +342,7 @@ class Investing(AnalyseStocks):
 
         stop_loss_perc = round((max_loss / entry) *100,2)
         diff = entry - stop_loss
-        quantity = min(risk // diff , budget // entry)
+        quantity = self.position_size(entry, stop_loss, budget, risk)
         profit = risk_to_reward_ratio * diff
         profit_perc = round((profit/entry)*100,2)
         target = round(entry + profit,2)
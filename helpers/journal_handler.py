@@ -5,7 +5,6 @@ from .datahandler import *
 from os import remove
 import pandas as pd
 
-all_listed_stocks = DataHandler.read_data()['all_stocks']
 current_date = pd.to_datetime(date.today())
 
 class JournalHandler:
@@ -24,7 +23,7 @@ class JournalHandler:
         if call_reminder:
             self.journal = self.get_journal()
             self.check_21_days_rule(self.journal)
-            self.check_extra_profit_opportunity(self.journal, all_listed_stocks)
+            self.check_extra_profit_opportunity(self.journal, DataHandler.read_data()['all_stocks'])
         
 
     def get_journal(self,excel_file_name:str='Finance Journal',working_sheet_name:str='Real Trades'):
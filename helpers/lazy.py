@@ -0,0 +1,77 @@
+'''
+Deferred imports and singletons so that importing any of the helpers is fast, never touches the network and does not need the data.json in the current directory.
+Heavy libraries (plotting, scraping) and module level objects are created on their first use
+'''
+from importlib import import_module
+
+
+class LazyModule:
+    '''
+    Stand in for a module which is imported on the first attribute access. Example:
+        plt = LazyModule('matplotlib.pyplot')
+    '''
+    def __init__(self, name:str, on_load = None):
+        '''
+        args:
+            name: Full name of the module
+            on_load: Function called with the module once it is imported. Useful for settings such as the default renderer
+        '''
+        self.__dict__['_name'] = name
+        self.__dict__['_on_load'] = on_load
+        self.__dict__['_module'] = None
+
+
+    def _load(self):
+        if self._module is None:
+            module = import_module(self._name)
+            if self._on_load:
+                self._on_load(module)
+            self.__dict__['_module'] = module
+        return self._module
+
+
+    def __getattr__(self, attr:str):
+        return getattr(self._load(), attr)
+
+
+    def __setattr__(self, attr:str, value):
+        setattr(self._load(), attr, value)
+
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'{' (loaded)' if self._module else ''}>"
+
+
+class LazyObject:
+    '''
+    Stand in for a module level object (such as "In = Investing()") which is created on the first use. Example:
+        In = LazyObject(Investing)
+    '''
+    def __init__(self, factory, *args, **kwargs):
+        '''
+        args:
+            factory: Class or function which creates the object
+            args, kwargs: Arguments passed to the factory
+        '''
+        self.__dict__['_factory'] = (factory, args, kwargs)
+        self.__dict__['_object'] = None
+
+
+    def _load(self):
+        if self._object is None:
+            factory, args, kwargs = self._factory
+            self.__dict__['_object'] = factory(*args, **kwargs)
+        return self._object
+
+
+    def __getattr__(self, attr:str):
+        return getattr(self._load(), attr)
+
+
+    def __setattr__(self, attr:str, value):
+        setattr(self._load(), attr, value)
+
+
+    def __repr__(self):
+        factory = self._factory[0]
+        return f"<lazy {getattr(factory, '__name__', factory)}{' (created)' if self._object is not None else ''}>"
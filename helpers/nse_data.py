@@ -1,20 +1,26 @@
 import pandas as pd
-import requests
 from datetime import date, datetime,timedelta
-from bs4 import BeautifulSoup
+from .lazy import LazyModule
+from .response_cache import ResponseCache
 import json
 import zipfile, io
 
 current_date = date.today()
+requests = LazyModule('requests') # Imported on the first request
+bs4 = LazyModule('bs4') # Only needed for scraping
 
 class NSEData:
     '''
     Class to open NSE data
     '''
-    def __init__(self,):
+    def __init__(self, baseurl:str = "https://www.nseindia.com/", cache_path:str = None):
         '''
+        args:
+            baseurl: Root of the NSE website. Change it only to point to a local stand in server
+            cache_path: SQLite file to keep the responses across the sessions. None keeps them in memory only. See ResponseCache
         '''
-        self.baseurl = "https://www.nseindia.com/"
+        self.baseurl = baseurl
+        self.cache = ResponseCache(cache_path)
 
         self.headers = {"user-agent":"Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/93.0.4577.63 Safari/537.36", "accept-encoding": "gzip, deflate, br",
               "accept-language": "en-GB,en-US;q=0.9,en;q=0.8,la;q=0.7",
@@ -24,22 +30,46 @@ class NSEData:
         self.to = current_date.strftime("%d-%m-%Y") # For getting historical data
         self.from_ = current_date.replace(year = current_date.year-2).strftime("%d-%m-%Y") # for getting historical data
 
-        self._force_reset_session()
+        self._session = None # Opened on the first request so that creating the object (or importing a module which does) never touches the network
 
     
+    @property
+    def session(self):
+        if self._session is None:
+            self._force_reset_session()
+        return self._session
+
+
     def _force_reset_session(self):
-        self.session = requests.Session()
-        request = self.session.get(self.baseurl, headers=self.headers)
+        self._session = requests.Session()
+        request = self._session.get(self.baseurl, headers=self.headers)
         self.cookies = dict(request.cookies)
 
         
-    def get_live_nse_data(self, url:str):
+    def get_live_nse_data(self, url:str, max_age:float = None):
         '''
-        Get Live market data available on NSE website as PDF
+        Get Live market data available on NSE website as PDF. Same url within its time to live is served from the cache
         args:
            url: corresponding url
+           max_age: Seconds an earlier response of the url can be used for. Default is as per response_cache.ttls
         '''
-        response = self.session.get(url, headers=self.headers, cookies=self.cookies)
+        cached = self.cache.fresh(url, max_age)
+        if cached:
+            return self._cached_response(url, *cached)
+
+        response = self.session.get(url, headers={**self.headers, **self.cache.validators(url, max_age)}, cookies=self.cookies)
+        if response.status_code == 304:
+            return self._cached_response(url, *self.cache.revalidated(url))
+        if response.ok:
+            self.cache.put(url, response.headers, response.content, max_age)
+        return response
+
+
+    def _cached_response(self, url:str, headers:dict, content:bytes):
+        response = requests.models.Response()
+        response.url, response.status_code, response._content = url, 200, content
+        response.headers.update(headers)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
         return response
     
 
@@ -49,30 +79,39 @@ class NSEData:
         args:
             show_n: Show top N sorted by ABSOLUTE % change Values such that -3.2 will be shown first than 2.3
         '''
-        df = pd.DataFrame(self.get_live_nse_data("https://www.nseindia.com/api/allIndices").json()['data'])
+        return self._indices_frame(self.get_live_nse_data(f"{self.baseurl}api/allIndices").json(), show_n)
+
+
+    def _indices_frame(self, result:dict, show_n:int=5):
+        df = pd.DataFrame(result['data'])
         df['absolute_change'] = df['percentChange'].apply(lambda x: abs(x))
         df.sort_values('absolute_change',ascending=False, inplace=True)
         return df.iloc[:show_n,[1,5,0,4]]
     
     
-    def open_nse_index(self,index_name:str,show_n:int=10, drop_index:bool = True):
+    def open_nse_index(self,index_name:str,show_n:int=10, drop_index:bool = True, max_age:float = None):
         '''
         Open the current index. DataFrame with all the members of the index and theit respective Open, High, Low, Percentange chnge etc etc
         args:
             index_name: Name of the Index such as NIFTY 50, NIFTY Bank, NIFTY-IT etc
             show_n: Show top N sorted by ABSOLUTE % change Values such that -3.2 will be shown first than 2.3
             driop_index: Whether to drop the Index Value row itsels
+            max_age: Seconds an earlier response can be used for. Prices need the default (seconds) but only the members of the index can be a day old
         '''
+        resp = self.get_live_nse_data(self._index_url(index_name), max_age)
+        return self._index_frame(resp.json(), show_n, drop_index)
+
+
+    def _index_url(self, index_name:str):
         index_name = index_name.replace(' ','%20')
         index_name = index_name.replace(':','%3A')
         index_name = index_name.replace('/','%2F')
         index_name = index_name.replace('&','%26')
+        return f"{self.baseurl}api/equity-stockIndices?index={index_name}"
 
-        url = f"https://www.nseindia.com/api/equity-stockIndices?index={index_name}"
 
-        resp = self.get_live_nse_data(url)
-        
-        df = pd.DataFrame(resp.json()['data'])
+    def _index_frame(self, result:dict, show_n:int=10, drop_index:bool = True):
+        df = pd.DataFrame(result['data'])
         df['absolute_change'] = df['pChange'].apply(lambda x: abs(x))
         # df['Index'] = df['symbol'].apply(lambda x: In.get_index(x))
         df.sort_values('absolute_change',ascending=False, inplace=True)
@@ -102,9 +141,16 @@ class NSEData:
         args:
             symbol: Listed name of the stock on NSE
         '''
-        url = f"https://www.nseindia.com/api/historical/cm/equity?symbol={symbol}&series=[%22EQ%22]&from={self.from_}&to={self.to}"
-        result = self.get_live_nse_data(url = url)
-        df = pd.DataFrame(result.json()['data'])
+        result = self.get_live_nse_data(url = self._fifty_days_url(symbol))
+        return self._fifty_days_frame(result.json())
+
+
+    def _fifty_days_url(self, symbol:str):
+        return f"{self.baseurl}api/historical/cm/equity?symbol={symbol}&series=[%22EQ%22]&from={self.from_}&to={self.to}"
+
+
+    def _fifty_days_frame(self, result:dict):
+        df = pd.DataFrame(result['data'])
         df.columns = df.columns.map({'CH_SYMBOL':'SYMBOL',"CH_TRADE_HIGH_PRICE":"HIGH","CH_TRADE_LOW_PRICE":"LOW","CH_OPENING_PRICE":"OPEN","CH_CLOSING_PRICE":"CLOSE",
                 "CH_TIMESTAMP":"DATE","CH_52WEEK_LOW_PRICE":"52W L","CH_52WEEK_HIGH_PRICE":"52W H"})
 
@@ -118,8 +164,12 @@ class NSEData:
         args:
             direction: direction of 52 Week. 'high', 'low'
         '''
-        x = self.get_live_nse_data(f'https://www.nseindia.com/api/live-analysis-52Week?index={direction}')
-        return pd.concat([pd.DataFrame(x.json()['dataLtpGreater20']), pd.DataFrame(x.json()['dataLtpLess20'])],ignore_index = True)
+        x = self.get_live_nse_data(f'{self.baseurl}api/live-analysis-52Week?index={direction}')
+        return self._52W_frame(x.json())
+
+
+    def _52W_frame(self, result:dict):
+        return pd.concat([pd.DataFrame(result['dataLtpGreater20']), pd.DataFrame(result['dataLtpLess20'])],ignore_index = True)
 
     
     
@@ -132,7 +182,7 @@ class MarketSentiment:
         Get fresh updated data scraped from the website https://www.traderscockpit.com/?pageView=live-nse-advance-decline-ratio-chart
         '''
         page = requests.get('https://www.traderscockpit.com/?pageView=live-nse-advance-decline-ratio-chart')
-        soup = BeautifulSoup(page.content, "lxml")
+        soup = bs4.BeautifulSoup(page.content, "lxml")
         latest_updated_on = soup.find("span", {"class": "hm-time"})
         divs = soup.find_all("div", {"class": "col-sm-6"})
         return divs, latest_updated_on
@@ -226,7 +276,7 @@ def get_mmi(raw = False):
     '''
     url = "https://www.tickertape.in/market-mood-index"
     page = requests.get(url)
-    soup = BeautifulSoup(page.content, "lxml")
+    soup = bs4.BeautifulSoup(page.content, "lxml")
 
 
     script = soup.find_all('script' ,{"id":"__NEXT_DATA__"})[0]
@@ -252,19 +302,64 @@ def get_mmi(raw = False):
         print("WARNING!!! You might want to book profits. Do not take fresh positions for Investment purpose now. Market is Extremely Greedy")
         
 
+bhavcopy_columns = {'SYMBOL':'SYMBOL', 'SERIES':'SERIES', 'OPEN':'OPEN', 'HIGH':'HIGH', 'LOW':'LOW', 'CLOSE':'CLOSE', 'TIMESTAMP':'DATE', # Old format: cm01JAN2022bhav.csv
+                    'TckrSymb':'SYMBOL', 'SctySrs':'SERIES', 'OpnPric':'OPEN', 'HghPric':'HIGH', 'LwPric':'LOW', 'ClsPric':'CLOSE', 'TradDt':'DATE'} # New UDiFF format
+
+
+def bhavcopy_name(day:date):
+    '''
+    Name of the Bhavcopy zip file for a given day. Example: cm01JAN2022bhav.csv.zip
+    args:
+        day: Date of the Bhavcopy
+    '''
+    return f"cm{day.strftime('%d%b%Y').upper()}bhav.csv.zip"
+
+
 def get_Bhavcopy(start = None, no_days = 5):
+    '''
+    Download the Bhavcopy (day wide End of Day data of all the equities) for the past "no_days" days
+    args:
+        start: Date from which to go back. Default is today
+        no_days: No of days to go back
+    returns: List of raw Bhavcopy DataFrames. Holidays and unavailable days are skipped
+    '''
     res = []
     if not start:
         start = current_date
-        end = start - timedelta(days = no_days)
         
     for i in range(no_days):
         day = start - timedelta(days = i)
         try:
-            r = requests.get(f'https://www1.nseindia.com/content/historical/EQUITIES/2022/JAN/cm{day}bhav.csv.zip')
+            r = requests.get(f"https://www1.nseindia.com/content/historical/EQUITIES/{day.year}/{day.strftime('%b').upper()}/{bhavcopy_name(day)}")
             z = zipfile.ZipFile(io.BytesIO(r.content))
             z = z.open(z.namelist()[0])
             res.append(pd.read_csv(z))
         except:
             pass
     return res
+
+
+def read_Bhavcopy(bhavcopy, series:str = 'EQ'):
+    '''
+    Read a Bhavcopy and convert it to the columns used in the data. Works with the old (cmDDMMMYYYYbhav) as well as the new (UDiFF) format
+    args:
+        bhavcopy: Path to a .csv / .zip Bhavcopy file or an already opened raw DataFrame
+        series: Series to keep. Default is EQ
+    returns: DataFrame with the columns ['DATE','OPEN','HIGH','LOW','CLOSE','SYMBOL']
+    '''
+    if isinstance(bhavcopy, pd.DataFrame):
+        df = bhavcopy
+    elif str(bhavcopy).endswith('.zip'):
+        with zipfile.ZipFile(bhavcopy) as z:
+            df = pd.read_csv(z.open(z.namelist()[0]))
+    else:
+        df = pd.read_csv(bhavcopy)
+
+    date_format = '%d-%b-%Y' if 'TIMESTAMP' in df.columns.str.strip() else '%Y-%m-%d' # 01-JAN-2022 in old and 2022-01-01 in new format
+
+    df = df.rename(columns = lambda x: bhavcopy_columns.get(x.strip(), x.strip()))
+    df = df[df['SERIES'].str.strip() == series]
+    df = df.loc[:,['DATE','OPEN','HIGH','LOW','CLOSE','SYMBOL']].copy()
+    df['DATE'] = pd.to_datetime(df['DATE'].str.strip(), format = date_format)
+    df['SYMBOL'] = df['SYMBOL'].str.strip()
+    return df
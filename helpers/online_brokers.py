@@ -2,16 +2,23 @@ import warnings
 import requests
 import json
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from time import sleep
 import numpy as np
 import pandas as pd
 
+from .rate_limit import TokenBucket
+from .intraday_store import IntradayStore
+
 
 class KiteZerodha():
     '''
     Class to connect with Kite platform using your credentials
     All thanks to: https://marketsetup.in/posts/zerodha-login/
     '''
-    def __init__(self, secret_file_path:None = None, user_id:str = None, password:str = None, two_factor_pin:str = None, data_path = './data.json'):
+    def __init__(self, secret_file_path:None = None, user_id:str = None, password:str = None, two_factor_pin:str = None, data_path = './data.json',
+                 base_url:str = "https://kite.zerodha.com/"):
         '''
         args:
             secret_file_path: PAth to the file which has your user_id, password and 2 factor Authentication code
@@ -19,6 +26,7 @@ class KiteZerodha():
             password: Password
             two_factor_pin: Two factor pin you have
             data_path: Path of Json file where all the data is stored
+            base_url: Root of the Kite website. Change it only to point to a local stand in server such as fake_kite.FakeKite
         '''
         assert not (not user_id) or (secret_file_path), "Either enter user_id and other fields OR enter the file path where those credentials are stored"
 
@@ -39,19 +47,21 @@ class KiteZerodha():
             self.data = json.load(f)
 
         
-        self.data_day_limit = {60:400, 30:200, 15:200, 5:100, 3:100, 4:100, 2:60,}
+        self.data_day_limit = {60:400, 30:200, 15:200, 10:100, 5:100, 3:100, 4:100, 2:60,}
 
         self.name_code_mapping = {"NIFTY":256265,"BANKNIFTY":260105,'HAVELLS':2513665,"MCDOWELL-N":2674433,"HINDPETRO":359937,"BHARTIARTL":2714625,"RBLBANK":4708097,"JINDALSTEL":1723649,"GRASIM":315393,"RAMCOCEM":523009,
         "TATAPOWER":877057,"BSOFT":1790465,"CIPLA":177665,"ADANIENT":6401, "IDEA":3677697, "CHAMBLFERT":163073, "DELTACORP":3851265,"IDFC":3060993, "GMRINFRA":3463169,"PVR":3365633,"GNFC":300545,"METROPOLIS":2452737,
         "BANKBARODA":1195009,"ABCAPITAL":5533185,"HINDCOPPER":4592385,"AUBANK":5436929,"CHOLAFIN":175361,"IEX":56321,"BATAINDIA":94977,"CANBK":2763265,"BALRAMCHIN":87297,"INTELLECT":1517057}
 
 
-        self.kite_basic_urls = {"base_url":"https://kite.zerodha.com/",'login_url' : "https://kite.zerodha.com/api/login","two_factor_url":"https://kite.zerodha.com/api/twofa",
-            "positions":"https://kite.zerodha.com/oms/portfolio/positions","holdings":'https://kite.zerodha.com/oms/portfolio/holdings',"margins":"https://kite.zerodha.com/oms/user/margins",
-            "marketwatch":"https://kite.zerodha.com/api/marketwatch","orders":"https://kite.zerodha.com/oms/orders","marketoverview":"https://kite.zerodha.com/api/market-overview",
-            "profile":"https://kite.zerodha.com/oms/user/profile/full"}
+        self.kite_basic_urls = {"base_url":base_url,'login_url' : f"{base_url}api/login","two_factor_url":f"{base_url}api/twofa",
+            "positions":f"{base_url}oms/portfolio/positions","holdings":f'{base_url}oms/portfolio/holdings',"margins":f"{base_url}oms/user/margins",
+            "marketwatch":f"{base_url}api/marketwatch","orders":f"{base_url}oms/orders","marketoverview":f"{base_url}api/market-overview",
+            "profile":f"{base_url}oms/user/profile/full"}
 
         self.session = requests.Session()
+        self.logins = 0 # No of times logged in. Tells the threads of a batch whether someone else has already logged in again
+        self._login_lock = Lock()
         self._login()
 
         
@@ -76,6 +86,7 @@ class KiteZerodha():
         headers = {}
         headers['authorization'] = "enctoken {}".format(enc_token)
         self.session.headers.update(headers)
+        self.logins += 1
 
 
     def check_basic_info(self, kind:str):
@@ -94,9 +105,11 @@ class KiteZerodha():
         return response.json()
 
     
-    def get_historical_data(self, name:str, data_type:str, code:int = None, interval:int = 5, starting_from_date:str = None, no_days_back:int = 7, include_live:bool = False):
+    def get_historical_data(self, name:str, data_type:str, code:int = None, interval:int = 5, starting_from_date:str = None, no_days_back:int = 7, include_live:bool = False,
+                            workers:int = 4, rate:float = 3):
         '''
-        Get minute by minute historical data
+        Get minute by minute historical data. Ranges longer than what Kite gives in one request (see "data_day_limit") are split into windows
+        which are downloaded concurrently and stitched together
         args:
             name: Name of the stock. According to NSE Website and the data we have
             data_type: One of [day, min]
@@ -105,15 +118,42 @@ class KiteZerodha():
             starting_from_date: Enter the date from which you want to have the data to be gether in the format "01/01/2022". If None, current day will be taken as starting day
             no_days_back: Data to gather for Number of days in past starting from the "from_date"
             include_live: Whether to include current Day's live data
+            workers, rate: Same as get_historical_batch. Used only when the range needs more than one request
+        '''
+        urls = self._historical_urls(name, data_type, code, interval, starting_from_date, no_days_back, include_live)
+        if len(urls) > 1:
+            return next(self._download({(name, interval): urls}, data_type, workers, rate))[1]
+        url = urls[0]
+        
+        try:
+            js = self.session.get(url).json()
+
+            try:
+                data = js['data']['candles']
+            except:
+                print("You have been Logged Out. Retrying Login...")
+                self._login()
+                js = self.session.get(url).json()
+                data = js['data']['candles']
+
+            return self._candles_frame(data, name, data_type)
+
+        except Exception as e:
+            print('Error in fetching Data. Probable Casuses: Not connected to internet or some parameters not passed properly')
+
+
+    def _historical_urls(self, name:str, data_type:str, code:int = None, interval:int = 5, starting_from_date:str = None, no_days_back:int = 7, include_live:bool = False):
+        '''
+        URLs of the historical data after checking the arguments. Same arguments as get_historical_data
+        returns: List of URLs from the newest to the oldest window. Each one is within the day limit of the interval
         '''
         if data_type in ('minute', 'intra', 'min'):
             assert interval in [2,3,4,5,10,15,30,60], "Please input interval data within minutes from one of the: [2,3,4,5,10,15,30, 60]"
             limit = self.data_day_limit[interval]
-            assert no_days_back <= limit, f"Can not get past {no_days_back} days data when interval is {interval}. Max allowed days are {limit} from 'starting_from_date'. Either increase interval or decrease no_days_back"
 
         elif data_type in  ("day", "daily"):
             interval = None
-            assert no_days_back < 401, f"Can not get past {no_days_back} days data. Max allowed days are {400} from 'starting_from_date'. Either increase interval or decrease no_days_back"
+            limit = 400
 
         else:
             assert False, "Enter proper value for the parameter 'data_type'. One of: day / min"
@@ -137,58 +177,185 @@ class KiteZerodha():
         else:
             from_date = datetime.strptime(starting_from_date, '%d/%m/%Y')
         
-    
-        to_date = from_date - timedelta(days = no_days_back)
-        to_date = to_date.strftime("%Y-%m-%d")
-        from_date = from_date.strftime("%Y-%m-%d")
+        oldest = from_date - timedelta(days = no_days_back)
+        base_url = self.kite_basic_urls['base_url']
+        kind = f"{interval}minute" if data_type == 'min' else "day"
 
-        if data_type == 'min':        
-            url = f"https://kite.zerodha.com/oms/instruments/historical/{code}/{interval}minute?user_id={self.user_id}&oi=1&from={to_date}&to={from_date}"
-        else:
-            url = url = f"https://kite.zerodha.com/oms/instruments/historical/{code}/day?user_id={self.user_id}&oi=1&from={to_date}&to={from_date}"
-        
-        try:
-            js = self.session.get(url).json()
+        urls = []
+        while from_date >= oldest: # Windows of "limit" days going back. Next one ends the day before this one starts
+            to_date = max(from_date - timedelta(days = limit), oldest)
+            urls.append(f"{base_url}oms/instruments/historical/{code}/{kind}?user_id={self.user_id}&oi=1&from={to_date.strftime('%Y-%m-%d')}&to={from_date.strftime('%Y-%m-%d')}")
+            from_date = to_date - timedelta(days = 1)
+        return urls
 
-            try:
-                data = js['data']['candles']
-            except:
-                print("You have been Logged Out. Retrying Login...")
-                self._login()
-                js = self.session.get(url).json()
-                data = js['data']['candles']
 
-            df = pd.DataFrame(data)
-            df.rename(columns = {0:"DATE",1:"OPEN",2:"HIGH",3:"LOW",4:"CLOSE",5:"VOLUME",6:'UNKNOWN'},inplace = True)
+    def _candles_frame(self, data:list, name:str, data_type:str):
+        '''
+        DataFrame of the candles returned by Kite in the same columns as the daily data, newest first
+        '''
+        if not len(data): # Holidays
+            return pd.DataFrame(columns = ["DATE","OPEN","HIGH","LOW","CLOSE","52W H","52W L","SYMBOL"])
+        df = pd.DataFrame(data)
+        df.rename(columns = {0:"DATE",1:"OPEN",2:"HIGH",3:"LOW",4:"CLOSE",5:"VOLUME",6:'UNKNOWN'},inplace = True)
+
+        if data_type == 'day': # need to strip the extra timestamp
+            df["DATE"] = df["DATE"].apply(lambda x: x[:10])
 
-            if data_type == 'day': # need to strip the extra timestamp
-                df["DATE"] = df["DATE"].apply(lambda x: x[:10])
+        df["DATE"] = pd.to_datetime(df["DATE"])
+        df['52W H'] = np.nan
+        df['52W L'] = np.nan
+        df['SYMBOL'] = name
+        return df.loc[:,["DATE","OPEN","HIGH","LOW","CLOSE","52W H","52W L","SYMBOL"]].sort_index(ascending = False).reset_index(drop = True)
 
-            df["DATE"] = pd.to_datetime(df["DATE"])
-            df['52W H'] = np.nan
-            df['52W L'] = np.nan
-            df['SYMBOL'] = name
-            return df.loc[:,["DATE","OPEN","HIGH","LOW","CLOSE","52W H","52W L","SYMBOL"]].sort_index(ascending = False).reset_index(drop = True)
 
-        except Exception as e:
-            print('Error in fetching Data. Probable Casuses: Not connected to internet or some parameters not passed properly')
+    def get_historical_batch(self, names:list, intervals:list = (5,), data_type:str = 'min', starting_from_date:str = None, no_days_back:int = 7, include_live:bool = False,
+                             workers:int = 4, rate:float = 3, burst:int = 1, retries:int = 3):
+        '''
+        Historical data of many stocks and intervals at once. Requests run in a pool of threads and never go faster than the rate limit of Kite.
+        If the session expires, only one of the threads logs in again (once for the whole batch) and the rest wait for it and use the new session.
+        Long ranges are split into windows as per "data_day_limit" and stitched back. Results come as soon as each one is downloaded so use it in a loop:
+            for (name, interval), df in kite.get_historical_batch(['HAVELLS', 'CIPLA'], [5, 15]):
+        args:
+            names: List of stock names. See get_historical_data
+            intervals: List of intervals in minutes. Ignored when data_type is 'day'
+            data_type, starting_from_date, no_days_back, include_live: Same as get_historical_data
+            workers: Maximum no of requests in flight at a time
+            rate: Maximum no of requests per second. Kite allows 3 per second for the historical data
+            burst: No of requests which can be sent at once before the rate applies
+            retries: No of times a request which was answered "429 Too Many Requests" is tried again
+        yields: ((name, interval), DataFrame). DataFrame is None if that one could not be downloaded
+        '''
+        intervals = intervals if data_type == 'min' else [None]
+        jobs = {(name, interval): self._historical_urls(name, data_type, None, interval if interval else 5, starting_from_date, no_days_back, include_live)
+                for name in names for interval in intervals}
+        return self._download(jobs, data_type, workers, rate, burst, retries)
+
+
+    def _download(self, jobs:dict, data_type:str, workers:int = 4, rate:float = 3, burst:int = 1, retries:int = 3):
+        '''
+        Download all the windows of all the jobs in a pool of threads
+        args:
+            jobs: Dictonary of {(name, interval): list of URLs from the newest to the oldest window}
+            data_type, workers, rate, burst, retries: Same as get_historical_batch
+        yields: ((name, interval), DataFrame) as soon as all the windows of a job are downloaded
+        '''
+        bucket = TokenBucket(rate, burst)
+        self.session.mount(self.kite_basic_urls['base_url'], requests.adapters.HTTPAdapter(pool_maxsize = max(workers, 10)))
+
+        with ThreadPoolExecutor(workers) as pool:
+            futures = {pool.submit(self._fetch_candles, url, bucket, retries): (job, i) for job, urls in jobs.items() for i, url in enumerate(urls)}
+            windows = {job: [None] * len(urls) for job, urls in jobs.items()}
+            remaining = {job: len(urls) for job, urls in jobs.items()}
+            failed = set()
+            for future in as_completed(futures):
+                job, i = futures[future]
+                remaining[job] -= 1
+                try:
+                    windows[job][i] = future.result()
+                except Exception as e:
+                    print(*job, '----', e)
+                    failed.add(job)
+
+                if not remaining[job]:
+                    yield job, (None if job in failed else self._stitch(windows.pop(job), job[0], data_type))
+
+
+    def _stitch(self, windows:list, name:str, data_type:str):
+        '''
+        Single DataFrame from the candles of all the windows. Candles present in two windows are kept once. Candles are sorted by their time so
+        the result does not depend on the order in which the windows came (such as from a Recorder which ignores the dates of the requests)
+        args:
+            windows: List of candles of every window
+        '''
+        candles = {}
+        for window in windows:
+            for candle in window:
+                candles.setdefault(candle[0], candle)
+        # Kite gives the times as ISO strings with the same +0530 offset so they sort by time as text. Oldest first just like a single request
+        return self._candles_frame([candles[time] for time in sorted(candles)], name, data_type)
+
+
+    def _fetch_candles(self, url:str, bucket, retries:int = 3):
+        '''
+        Candles of a single url for get_historical_batch
+        args:
+            bucket: TokenBucket shared by the batch
+            retries: No of times it is tried again after 429 or after logging in again
+        '''
+        for attempt in range(retries + 1):
+            logins = self.logins
+            bucket.wait()
+            response = self.session.get(url)
+            if response.status_code == 429 and attempt < retries:
+                sleep(1 / bucket.rate)
+                continue
+
+            js = response.json()
+            if js.get('data') and ('candles' in js['data']):
+                return js['data']['candles']
+
+            if response.status_code not in (401, 403):
+                raise ValueError(js.get('message', f'{response.status_code} from Kite'))
+
+            with self._login_lock:
+                if self.logins == logins: # Nobody has logged in after this request was sent. Others will use this login
+                    print("You have been Logged Out. Retrying Login...")
+                    self._login()
+
+        raise ConnectionError(f'Could not get {url} from Kite after {retries + 1} attempts')
 
 
     def download_intraday_data(self, name:str, interval:int, path:str = './intraday_data', overwrite:bool = False):
         '''
-        Download Minutes Data starting from NOW to the last available date to which the specific candle can be downloaded.
-        No functionality is given for MultiProcessing due to the fact that Zerodha might block access when huge no of requests are fired
+        Download Minutes Data starting from NOW to the last available date to which the specific candle can be downloaded and save it in the IntradayStore.
+        If the stock is already stored, only the candles after the last stored one are downloaded and appended
         args:
             name: Name of the stock
             path: Path of the directory where you want to download the data
             interval: Which interval data in minutes you want to get
             overwrite: Whether to download from scratch or append to the existing data
+        returns: No of new candles stored
+        '''
+        return self.update_intraday_data([name], [interval], path, overwrite, workers = 1)[(name, interval)]
+
+
+    def update_intraday_data(self, names:list, intervals:list = (5,), path:str = './intraday_data', overwrite:bool = False, workers:int = 4, rate:float = 3,
+                             derive:bool = False):
+        '''
+        Bring the minutes data of many stocks and intervals up to date in the IntradayStore. Every stock is downloaded only from its last stored candle
+        (new ones from as far back as Kite allows) through the rate limited pool of get_historical_batch
+        args:
+            names: List of stock names
+            intervals: List of intervals in minutes
+            path: Directory of the IntradayStore
+            overwrite: Whether to delete the stored candles and download from scratch
+            workers, rate: Same as get_historical_batch
+            derive: Download only the intervals which are not a multiple of another one in "intervals". The rest are made from them by the IntradayStore
+                while reading. For [2, 4, 10, 30, 60] only 2 minutes is downloaded. History of the made intervals is only as long as the one of the base.
+                An interval stored before is made from the base as well once the base has newer candles
+        returns: Dictonary of {(name, interval): no of new candles stored} for the downloaded intervals
         '''
-        full_path = f'{path}/minutes_{str(interval)}/{name}.csv'
+        store = IntradayStore(path)
+        today = datetime.today()
+        if derive:
+            intervals = [each for each in intervals if not any(each != other and each % other == 0 for other in intervals)]
+
+        jobs = {}
+        for name in names:
+            for interval in intervals:
+                kind = f'minutes_{interval}'
+                if overwrite:
+                    store.delete(name, kind)
+                last = store.last_date(name, kind)
+                no_days_back = self.data_day_limit[interval] - 1 if last is None else max((today - last).days, 0) # Day of the last candle is downloaded again as it may be incomplete
+                jobs[(name, interval)] = self._historical_urls(name, 'min', None, interval, None, no_days_back)
+
+        result = {}
+        for (name, interval), df in self._download(jobs, 'min', workers, rate):
+            result[(name, interval)] = store.append(name, f'minutes_{interval}', df)
+        return result
+
 
-        no_days_back = self.data_day_limit[interval] -1 
-        df = self.get_historical_minutes_data(name, interval, None, no_days_back)
-        df.to_csv(full_path, index = None)
 
 
     
@@ -0,0 +1,245 @@
+import numpy as np
+import pandas as pd
+from os import stat
+from time import perf_counter, time_ns
+
+fields = ['OPEN','HIGH','LOW','CLOSE','52W H','52W L']
+
+_worker_panel = None # Panel attached inside a Pool worker. See init_worker
+
+
+class PricePanel:
+    '''
+    Universe wide in memory panel. Aligned 2D arrays (dates x symbols) for OPEN, HIGH, LOW, CLOSE, 52W H, 52W L along with a validity mask.
+    Rows are sorted from the Oldest to the Newest date. Load it once per session and share it with Pool workers using shared memory
+    so that they attach to the same memory instead of re-reading the files
+    '''
+    def __init__(self, dates, symbols:list, arrays:dict, mask):
+        '''
+        args:
+            dates: numpy datetime64 array of all the dates (rows) in ascending order
+            symbols: List of symbols (columns)
+            arrays: Dictonary of {field: 2D array of shape (dates, symbols)}
+            mask: 2D boolean array which is True where the symbol has data on that date
+        '''
+        self.dates = dates
+        self.symbols = list(symbols)
+        self.columns = {name: i for i, name in enumerate(self.symbols)}
+        self.arrays = arrays
+        self.mask = mask
+
+        self.load_time = None
+        self.attach_time = None
+        self.loaded_at = None # Time (ns since epoch) at which the files were read. See PricePanel.fresh
+        self.path = None # Directory of the PriceStore it was loaded from
+        self._shared = [] # SharedMemory blocks created or attached by this panel
+
+
+    @classmethod
+    def from_store(cls, store, symbols:list = None, dtype:str = 'float64'):
+        '''
+        Build the panel from a PriceStore
+        args:
+            store: PriceStore object
+            symbols: List of symbols to load. Default is all the symbols in the store. Missing ones are skipped
+            dtype: dtype of the price arrays. 'float32' halves the memory
+        '''
+        start, loaded_at = perf_counter(), time_ns()
+        symbols = symbols if symbols is not None else sorted(store.symbols())
+
+        data = {name: store.read_arrays(name, dtype) for name in symbols if store.has(name)}
+        symbols = list(data.keys())
+
+        if len(data):
+            dates = np.unique(np.concatenate([values['DATE'] for values in data.values()]))
+        else:
+            dates = np.array([], dtype = 'datetime64[ns]')
+
+        arrays = {field: np.full((len(dates), len(symbols)), np.nan, dtype = dtype) for field in fields}
+        mask = np.zeros((len(dates), len(symbols)), dtype = bool)
+
+        for col, name in enumerate(symbols):
+            rows = np.searchsorted(dates, data[name]['DATE'])
+            mask[rows, col] = True
+            for field in fields:
+                arrays[field][rows, col] = data[name][field]
+
+        panel = cls(dates, symbols, arrays, mask)
+        panel.load_time = perf_counter() - start
+        panel.loaded_at, panel.path = loaded_at, store.path
+        return panel
+
+
+    def __getitem__(self, field:str):
+        return self.arrays[field]
+
+
+    @property
+    def shape(self):
+        return self.mask.shape
+
+
+    def frame(self, name:str):
+        '''
+        Get the DataFrame of a single symbol exactly like DataHandler.open_downloaded_stock returns it. Newest date first
+        args:
+            name: Symbol of the stock
+        '''
+        col = self.columns[name]
+        rows = np.flatnonzero(self.mask[:, col])[::-1]
+
+        data = {'DATE': self.dates[rows]}
+        for field in fields: # Rounded like PriceStore.read so that a float32 panel gives the same values too
+            data[field] = np.round(self.arrays[field][rows, col].astype('float64'), 2)
+        data['SYMBOL'] = name
+        return pd.DataFrame(data)
+
+
+    def fresh(self, name:str, store):
+        '''
+        Whether the panel has a symbol and its file in the store has not changed since the panel was loaded
+        args:
+            name: Symbol of the stock
+            store: PriceStore from which the panel was loaded
+        '''
+        if (name not in self.columns) or (self.loaded_at is None) or (store.path != self.path):
+            return False
+        try:
+            return stat(store.file(name)).st_mtime_ns <= self.loaded_at
+        except OSError:
+            return False
+
+
+    def last_rows(self):
+        '''
+        Row number of the latest valid date for every symbol
+        '''
+        return self.mask.shape[0] - 1 - np.argmax(self.mask[::-1], axis = 0)
+
+
+    def latest(self, field:str = 'CLOSE'):
+        '''
+        Latest valid value of a field for every symbol
+        args:
+            field: One of OPEN, HIGH, LOW, CLOSE, 52W H, 52W L
+        returns: pandas Series indexed by symbol
+        '''
+        values = self.arrays[field][self.last_rows(), np.arange(len(self.symbols))]
+        return pd.Series(values, index = self.symbols, name = field)
+
+
+    def memory_usage(self):
+        '''
+        Memory used by the arrays in Bytes
+        '''
+        return sum(array.nbytes for array in self.arrays.values()) + self.mask.nbytes + self.dates.nbytes
+
+
+    def report(self):
+        '''
+        Report the shape, memory footprint, load and attach time of the panel
+        '''
+        return {'Dates':self.shape[0], 'Symbols':self.shape[1], 'Memory (MB)':round(self.memory_usage() / 1024**2, 2),
+                'Load Time (s)':self.load_time, 'Attach Time (s)':self.attach_time, 'Shared':bool(len(self._shared))}
+
+
+    def to_shared(self):
+        '''
+        Move the arrays to shared memory (Python 3.8+) so that worker processes can attach them zero copy. Call "unlink" when done
+        returns: A small picklable handle to pass to the workers. See PricePanel.attach and init_worker
+        '''
+        from multiprocessing import shared_memory
+
+        handle = {'dates':self.dates, 'symbols':self.symbols, 'loaded_at':self.loaded_at, 'path':self.path, 'blocks':{}}
+        if self._shared: # already shared
+            handle['blocks'] = self._blocks
+            return handle
+
+        arrays = dict(self.arrays, mask = self.mask)
+        for key, array in arrays.items():
+            shm = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype = array.dtype, buffer = shm.buf)
+            shared[:] = array
+            arrays[key] = shared # Use the shared copy from now on and let the private one go
+            handle['blocks'][key] = (shm.name, array.shape, array.dtype.str)
+            self._shared.append(shm)
+
+        self.mask = arrays.pop('mask')
+        self.arrays = arrays
+        self._blocks = handle['blocks']
+        return handle
+
+
+    @classmethod
+    def attach(cls, handle:dict):
+        '''
+        Attach to a panel shared by another process without copying the data
+        args:
+            handle: Handle returned by PricePanel.to_shared
+        '''
+        from multiprocessing import shared_memory
+
+        start = perf_counter()
+        arrays = {}
+        shared = []
+        for key, (name, shape, dtype) in handle['blocks'].items():
+            shm = shared_memory.SharedMemory(name = name)
+            arrays[key] = np.ndarray(shape, dtype = dtype, buffer = shm.buf)
+            shared.append(shm)
+
+        mask = arrays.pop('mask')
+        panel = cls(handle['dates'], handle['symbols'], arrays, mask)
+        panel._shared = shared
+        panel._blocks = handle['blocks']
+        panel.loaded_at, panel.path = handle.get('loaded_at'), handle.get('path')
+        panel.attach_time = perf_counter() - start
+        return panel
+
+
+    def close(self):
+        '''
+        Detach from the shared memory. Arrays of this panel can not be used after this
+        '''
+        self.arrays = {}
+        self.mask = None
+        for shm in self._shared:
+            shm.close()
+
+
+    def unlink(self):
+        '''
+        Close and free the shared memory. Call it only from the process which created it using "to_shared", once all the workers are done
+        '''
+        shared = self._shared
+        self.close()
+        for shm in shared:
+            shm.unlink()
+        self._shared = []
+
+
+    def unshare(self):
+        '''
+        Copy the arrays back to the private memory of this process and free the shared memory. Undo of "to_shared" once all the workers are done
+        '''
+        arrays = {key: np.array(array) for key, array in self.arrays.items()}
+        mask = np.array(self.mask)
+        self.unlink()
+        self.arrays, self.mask = arrays, mask
+
+
+def init_worker(handle:dict):
+    '''
+    Initializer for multiprocessing.Pool so that every worker attaches to the shared panel once. Example:
+        Pool(workers, initializer = init_worker, initargs = (panel.to_shared(),))
+    args:
+        handle: Handle returned by PricePanel.to_shared
+    '''
+    global _worker_panel
+    _worker_panel = PricePanel.attach(handle)
+
+
+def worker_panel():
+    '''
+    Get the panel attached in the current worker process by "init_worker"
+    '''
+    return _worker_panel
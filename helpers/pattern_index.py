@@ -0,0 +1,213 @@
+'''
+Inverted index of the candlestick patterns of every stock: (pattern, date) -> symbols. Built once from the store and then updated with only the new
+sessions after every data refresh so that questions like "which stocks printed a Bullish Engulfing in the last 5 sessions above their 200-MA"
+are a lookup instead of a scan. Every occurrence also keeps the forward returns that followed it for the historical stats of the pattern
+'''
+import sqlite3
+from os import makedirs
+from os.path import dirname
+
+import numpy as np
+import pandas as pd
+
+from .candlestick import CandlePattern, single_names, double_names, triple_names
+from .indicators import BatchIndicators, rolling_mean
+from .panel import PricePanel
+
+
+horizons = (1, 5, 10, 20) # Forward returns (in sessions) kept for every occurrence
+kinds = {'Candle': single_names, 'Double Candle': double_names, 'Triple Candle': triple_names}
+version = 1 # Index built by an older version is built again. 1: "above_ma" is NULL till the Moving Average has all its bars
+
+
+class PatternIndex:
+    '''
+    SQLite backed index of the pattern occurrences. "Unknown" patterns are not stored
+    '''
+    def __init__(self, path:str = './cache/patterns.sqlite'):
+        '''
+        args:
+            path: Path of the SQLite file. It is created on the first use
+        '''
+        self.path = path
+        self._db = None
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_db'] = None # Connection can not be sent to the worker processes
+        return state
+
+
+    @property
+    def db(self):
+        if self._db is None:
+            makedirs(dirname(self.path) or '.', exist_ok = True)
+            self._db = sqlite3.connect(self.path, timeout = 30)
+            returns = ', '.join(f'ret_{days} REAL' for days in horizons)
+            self._db.execute(f'''CREATE TABLE IF NOT EXISTS occurrences (pattern TEXT, kind TEXT, date TEXT, symbol TEXT, close REAL, above_ma INTEGER, {returns},
+                                 PRIMARY KEY (symbol, date, kind))''')
+            self._db.execute('CREATE INDEX IF NOT EXISTS lookup ON occurrences (pattern, date)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS dates ON occurrences (date)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS indexed (symbol TEXT PRIMARY KEY, last_date TEXT)')
+            if self._db.execute('PRAGMA user_version').fetchone()[0] < version:
+                self.clear()
+                self._db.execute(f'PRAGMA user_version = {version}')
+        return self._db
+
+
+    def last_dates(self):
+        '''
+        Last indexed date of every symbol
+        returns: Dictonary of {symbol: date as "YYYY-MM-DD"}
+        '''
+        return dict(self.db.execute('SELECT symbol, last_date FROM indexed').fetchall())
+
+
+    def missing(self, store):
+        '''
+        Symbols of the store which are not in the index at all
+        args:
+            store: PriceStore object
+        '''
+        indexed = self.last_dates()
+        return sorted(name for name in store.symbols() if name not in indexed)
+
+
+    def update(self, store, stocks:list = None, ma:int = 200):
+        '''
+        Add the new sessions of the stocks to the index. Only the symbols whose last stored date changed are read, and only the occurrences
+        from a few sessions before the last indexed date are written again (their forward returns were not known then)
+        args:
+            store: PriceStore object
+            stocks: List of stocks. Default is all the stocks in the store
+            ma: Period of the Moving Average for the "above_ma" flag
+        returns: Dictonary of {symbol: no of occurrences written}
+        '''
+        stocks = sorted(stocks if stocks is not None else store.symbols())
+        indexed = self.last_dates()
+        latest = {name: store.last_date(name) for name in stocks}
+        todo = [name for name in stocks if latest[name] is not None and latest[name].strftime('%Y-%m-%d') != indexed.get(name)]
+        if not todo:
+            return {}
+
+        panel = PricePanel.from_store(store, todo)
+        batch = BatchIndicators(panel)
+        CP = CandlePattern()
+        prices = (batch.open, batch.close, batch.low, batch.high)
+        codes = {'Candle': CP.name_codes(*prices), 'Double Candle': CP.double_codes(*prices), 'Triple Candle': CP.triple_codes(*prices)}
+
+        close = batch.close
+        average = rolling_mean(close, ma) # NaN till the first "ma" bars, the flag is not known there
+        with np.errstate(invalid = 'ignore'):
+            above_ma = np.where(np.isnan(average), np.nan, close > average)
+        rows = np.arange(close.shape[0])[:, None]
+        returns = {}
+        for days in horizons:
+            future = np.full(close.shape, np.nan)
+            future[:-days] = close[days:]
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                returns[days] = np.where(rows + days < batch.lengths[None, :], np.round((future / close - 1) * 100, 2), np.nan)
+
+        dates = panel.dates[batch.order] # Date of every left aligned bar
+        start = np.zeros(len(panel.symbols), dtype = int) # First bar of every symbol to write again
+        for col, name in enumerate(panel.symbols):
+            if name in indexed:
+                last = np.searchsorted(dates[:batch.lengths[col], col], np.datetime64(indexed[name]))
+                start[col] = max(last - max(horizons), 0)
+
+        written = {}
+        with self.db:
+            for col, name in enumerate(panel.symbols):
+                length, first = batch.lengths[col], start[col]
+                if first > 0:
+                    self.db.execute('DELETE FROM occurrences WHERE symbol = ? AND date >= ?', (name, str(pd.Timestamp(dates[first, col]).date())))
+                else:
+                    self.db.execute('DELETE FROM occurrences WHERE symbol = ?', (name,))
+
+                entries = []
+                for kind, names in kinds.items():
+                    code = codes[kind][first:length, col]
+                    for row in np.flatnonzero((code >= 0) & ~np.isin(code, [names.index(i) for i in names if i.startswith('Unknown')])) + first:
+                        entries.append((names[codes[kind][row, col]], kind, str(pd.Timestamp(dates[row, col]).date()), name, float(close[row, col]),
+                                        None if np.isnan(above_ma[row, col]) else int(above_ma[row, col]),
+                                        *[None if np.isnan(returns[days][row, col]) else float(returns[days][row, col]) for days in horizons]))
+
+                self.db.executemany(f"INSERT OR REPLACE INTO occurrences VALUES ({','.join('?' * (6 + len(horizons)))})", entries)
+                self.db.execute('INSERT OR REPLACE INTO indexed VALUES (?, ?)', (name, latest[name].strftime('%Y-%m-%d')))
+                written[name] = len(entries)
+
+        return written
+
+
+    def query(self, pattern:str, sessions:int = 5, above_ma:bool = None, stocks:list = None):
+        '''
+        Stocks which printed a pattern in the last few sessions
+        args:
+            pattern: Name of the pattern such as 'Bullish Engulfing', 'Hammer', 'V Pattern'. See candlestick.single_names, double_names, triple_names
+            sessions: No of latest sessions (dates present in the index) to look at
+            above_ma: True for only the stocks closing above their Moving Average on that day, False for only below. None for all
+                Days before the Moving Average has all its bars are neither above nor below
+            stocks: Only these stocks. Default is all
+        returns: DataFrame of SYMBOL, DATE, PATTERN, CLOSE, ABOVE MA sorted from the newest date. ABOVE MA is <NA> when it is not known
+        '''
+        dates = [row[0] for row in self.db.execute('SELECT DISTINCT date FROM occurrences ORDER BY date DESC LIMIT ?', (sessions,))]
+        columns = ['SYMBOL', 'DATE', 'PATTERN', 'CLOSE', 'ABOVE MA']
+        if not dates:
+            return pd.DataFrame(columns = columns)
+
+        sql = 'SELECT symbol, date, pattern, close, above_ma FROM occurrences WHERE pattern = ? AND date >= ?'
+        params = [pattern, dates[-1]]
+        if above_ma is not None:
+            sql += ' AND above_ma = ?'
+            params.append(int(above_ma))
+
+        df = pd.DataFrame(self.db.execute(sql + ' ORDER BY date DESC, symbol', params).fetchall(), columns = columns)
+        if stocks is not None:
+            df = df[df['SYMBOL'].isin(list(stocks))].reset_index(drop = True)
+        df['DATE'] = pd.to_datetime(df['DATE'])
+        df['ABOVE MA'] = df['ABOVE MA'].astype('boolean')
+        return df
+
+
+    def stats(self, patterns:list = None, above_ma:bool = None, start = None, end = None, stocks:list = None):
+        '''
+        Historical forward returns after every pattern
+        args:
+            patterns: List of pattern names. Default is all
+            above_ma: Only the occurrences above (True) or below (False) the Moving Average. None for all
+            start, end: Date range of the occurrences
+            stocks: Only these stocks. Default is all
+        returns: DataFrame indexed by pattern with the Count and, for every horizon, the Average return % and the % of times it was positive
+        '''
+        where, params = [], []
+        if patterns is not None:
+            where.append(f"pattern IN ({','.join('?' * len(patterns))})")
+            params.extend(patterns)
+        if above_ma is not None:
+            where.append('above_ma = ?')
+            params.append(int(above_ma))
+        if start is not None:
+            where.append('date >= ?')
+            params.append(str(pd.Timestamp(start).date()))
+        if end is not None:
+            where.append('date <= ?')
+            params.append(str(pd.Timestamp(end).date()))
+        if stocks is not None:
+            stocks = list(stocks)
+            where.append(f"symbol IN ({','.join('?' * len(stocks))})")
+            params.extend(stocks)
+
+        aggregates = ', '.join(f'ROUND(AVG(ret_{days}), 3), ROUND(AVG(ret_{days} > 0) * 100, 2)' for days in horizons)
+        sql = f"SELECT pattern, kind, COUNT(*), {aggregates} FROM occurrences {'WHERE ' + ' AND '.join(where) if where else ''} GROUP BY pattern, kind ORDER BY kind, COUNT(*) DESC"
+        columns = ['PATTERN', 'KIND', 'Count'] + [name for days in horizons for name in (f'Avg {days}D %', f'Win {days}D %')]
+        return pd.DataFrame(self.db.execute(sql, params).fetchall(), columns = columns).set_index('PATTERN')
+
+
+    def clear(self):
+        '''
+        Remove everything so that the next "update" builds the index from scratch
+        '''
+        with self.db:
+            self.db.execute('DELETE FROM occurrences')
+            self.db.execute('DELETE FROM indexed')
@@ -1,13 +1,19 @@
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
-import plotly.io as pio
-import matplotlib.pyplot as plt
-import seaborn as sns
 import json
 from datetime import timedelta
+from .lazy import LazyModule
 
-pio.renderers.default = 'colab' 
+
+def _colab_renderer(module):
+    import plotly.io
+    plotly.io.renderers.default = 'colab'
+
+# Plotting libraries take longer to import than everything else put together so they are imported when the first plot is made
+go = LazyModule('plotly.graph_objects', on_load = _colab_renderer)
+pio = LazyModule('plotly.io', on_load = _colab_renderer)
+plt = LazyModule('matplotlib.pyplot')
+sns = LazyModule('seaborn')
 
 
 class Plots():
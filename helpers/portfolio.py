@@ -0,0 +1,234 @@
+'''
+Portfolio level backtest. Unlike Backtest.backtest where every stock has unlimited money of it's own, here all the stocks share one account.
+Positions are sized with the same risk / budget rules as Investing.get_particulars and there is a limit on the no of open positions.
+Steps through the dates of the PricePanel once and does the work for all the symbols of that date with arrays
+'''
+import numpy as np
+import pandas as pd
+from time import perf_counter
+
+from .backtest import In, crossed_above, crossed_below, latched
+from .investing import Investing
+from .indicators import BatchIndicators, scatter_back, shift
+from . import indicators as ind
+
+
+class Portfolio:
+    '''
+    Simulate an account trading the signals of a Backtest strategy over a universe of stocks. Example:
+        pf = Portfolio(capital = 500000, risk = 2500, max_positions = 10)
+        pf.run('cci', stocks = 'nifty_500', start = '2021-01-01')
+        pf.summary()
+    '''
+    def __init__(self, capital:float, risk:float, max_positions:int = 10, risk_to_reward_ratio:float = 2, delta:float = 0.001, max_hold:int = None):
+        '''
+        args:
+            capital: Money in the account at the start
+            risk: Max loss per trade. Same as in Investing.get_particulars
+            max_positions: Max no of stocks held at the same time
+            risk_to_reward_ratio: Target is this many times the risk per share. Same as in Investing.get_particulars
+            delta: Entry is this much above the High and Stop Loss this much below the Low. Same as in Investing.get_particulars
+            max_hold: Sell at the Open after these many bars. None means no limit
+        '''
+        self.capital = capital
+        self.risk = risk
+        self.max_positions = max_positions
+        self.risk_to_reward_ratio = risk_to_reward_ratio
+        self.delta = delta
+        self.max_hold = max_hold
+
+        self.equity = None
+        self.trades = None
+        self.timings = {}
+
+
+    def signals(self, batch, strategy:str, **kwargs):
+        '''
+        Buy and Sell signals of the strategies of Backtest for all the symbols at once. Conditions are the same as in the Backtest strategies
+        args:
+            batch: BatchIndicators object
+            strategy: One of 'cci', 'rsi', 'macd', 'ma', 'stochastic_osc'
+            kwargs: Parameters of the strategy such as buying_thresh, selling_thresh, window
+        returns: Tuple of left aligned 2D boolean arrays (buy, sell). "ma" has no sell signal as it exits only at the Stop Loss or Target
+        '''
+        open_, high, low, close = batch.open, batch.high, batch.low, batch.close
+        sell = np.zeros(close.shape, dtype = bool)
+
+        if strategy == 'cci':
+            buying_thresh, selling_thresh = kwargs.get('buying_thresh', -100), kwargs.get('selling_thresh', 100)
+            cci = ind.cci(high, low, close, kwargs.get('window', 20))
+            ma_50, ma_200 = ind.moving_average(close, 50), ind.moving_average(close, 200)
+            buy = crossed_above(cci, buying_thresh) & (close > ma_50) & (ma_50 > ma_200)
+            sell = crossed_below(cci, selling_thresh) | (cci > 200)
+
+        elif strategy == 'rsi':
+            buying_thresh, selling_thresh = kwargs.get('buying_thresh', 30), kwargs.get('selling_thresh', 70)
+            rsi = ind.rsi(close, kwargs.get('window', 14))
+            buy = crossed_above(rsi, buying_thresh) & (close > ind.moving_average(close, 200))
+            sell = crossed_below(rsi, selling_thresh) | (rsi > 80)
+
+        elif strategy == 'macd':
+            diff = ind.macd_diff(close, kwargs.get('window_slow', 26), kwargs.get('window_fast', 12), kwargs.get('window_sign', 9))
+            buy, sell = crossed_above(diff, 0), crossed_below(diff, 0)
+
+        elif strategy == 'stochastic_osc':
+            buying_thresh, selling_thresh = kwargs.get('buying_thresh', 20), kwargs.get('selling_thresh', 80)
+            blue, red = ind.stochastic(high, low, close, kwargs.get('k_period', 14), kwargs.get('d_period', 3), kwargs.get('smooth_k', 3))
+            up, down = crossed_above(red - blue, 0), crossed_below(red - blue, 0)
+            buy_lock = latched(up & (blue < buying_thresh) & (red < buying_thresh), down)
+            sell_lock = latched(down & (blue > selling_thresh) & (red > selling_thresh), up)
+            buy = buy_lock & (red > buying_thresh) & (close > ind.moving_average(close, 200))
+            sell = sell_lock & (red < selling_thresh)
+
+        elif strategy == 'ma':
+            simple = kwargs.get('ma_type', 'simple') == 'simple'
+            window, diff = kwargs.get('window', 44), kwargs.get('diff', 0.015)
+            ma, ma_200 = ind.moving_average(close, window, simple), ind.moving_average(close, 200, simple)
+            with np.errstate(invalid = 'ignore'):
+                buy = (close > open_) & (close > ma) & (close > ma_200) & (ind.rsi(close) < 70) & \
+                      (np.minimum(np.abs(open_ - ma), np.abs(low - ma)) < (close * diff))
+
+        else:
+            raise ValueError(f"Unknown strategy '{strategy}'. Select from 'cci', 'rsi', 'macd', 'ma', 'stochastic_osc'")
+
+        return buy, sell
+
+
+    def levels(self, batch):
+        '''
+        Entry and Stop Loss for the next bar if bought now, using the rules of Investing.get_particulars
+        returns: Tuple of left aligned 2D arrays (entry, stop_loss)
+        '''
+        entry = batch.high + (batch.high * self.delta) # Last Day MAX + Delta
+        low = np.fmin(batch.low, shift(batch.low)) # min of the last 2 Lows
+        return entry, low - (low * self.delta)
+
+
+    def run(self, strategy:str, stocks = 'nifty_500', start = None, end = None, rank:str = 'risk', **kwargs):
+        '''
+        Simulate the account. A signal at the close of a bar places a buy order at the "entry" for the next bar of that stock.
+        It is bought if the High goes above the entry (at the Open if it opens above). Positions are sold at the Open after a sell signal
+        or when the Stop Loss or Target is hit (Stop Loss first if both are hit on the same bar)
+        args:
+            strategy: One of 'cci', 'rsi', 'macd', 'ma', 'stochastic_osc'
+            stocks: Select from [nifty_50, nifty_200, nifty_500, all] or a list of stocks
+            start: First date to trade. Indicators still use all the earlier data. Default is the first date of the panel
+            end: Last date to trade. Default is the last date of the panel
+            rank: Which orders get the money and position slots first when there are more orders than slots. 'risk' prefers a smaller Stop Loss %, None keeps the symbol order
+            kwargs: Parameters of the strategy
+        returns: DataFrame of the daily Equity, Cash, Positions and Drawdown %. Trades are in "self.trades"
+        '''
+        timer = perf_counter()
+        if isinstance(stocks,str):
+            stocks = In.data['all_stocks'] if stocks == 'all' else In.data[stocks]
+
+        panel = In.get_panel(list(stocks))
+        batch = BatchIndicators(panel)
+        buy, sell = self.signals(batch, strategy, **kwargs)
+        entry, stop = self.levels(batch)
+
+        back = lambda x: scatter_back(x.astype('float64'), batch.order, batch.lengths)
+        buy, sell = back(buy) == 1, back(sell) == 1
+        entry, stop = back(entry), back(stop)
+        self.timings['Signals'] = perf_counter() - timer
+        timer = perf_counter()
+
+        dates, mask = panel.dates, panel.mask
+        prev = np.maximum.accumulate(np.where(mask, np.arange(len(dates))[:, None], 0), axis = 0) # Last row on or before every date where each stock traded
+        buy, sell, entry, stop = (np.take_along_axis(x, prev, axis = 0) for x in (buy, sell, entry, stop)) # So a signal just before a gap (suspension, holiday) acts on its next bar
+        open_, high, low = panel['OPEN'], panel['HIGH'], panel['LOW']
+        close = pd.DataFrame(panel['CLOSE']).ffill().values # Value of a position on a day it did not trade
+        first = np.searchsorted(dates, np.datetime64(pd.Timestamp(start))) if start is not None else 1
+        last = np.searchsorted(dates, np.datetime64(pd.Timestamp(end)), side = 'right') if end is not None else len(dates)
+        first = max(first, 1)
+
+        n = len(panel.symbols)
+        quantity = np.zeros(n)
+        buy_price, stop_loss, target = np.zeros(n), np.zeros(n), np.zeros(n)
+        bought_on, bars = np.zeros(n, dtype = int), np.zeros(n, dtype = int)
+        cash = float(self.capital)
+        records, curve = [], []
+        traded = 0.0
+
+        for t in range(first, last):
+            valid = mask[t]
+            held = quantity > 0
+
+            # Exits
+            bars += held & valid
+            expired = held & valid & (bars > self.max_hold) if self.max_hold else np.zeros(n, dtype = bool)
+            at_open = held & valid & (sell[t-1] | expired | (open_[t] <= stop_loss) | (open_[t] >= target))
+            hit_stop = held & valid & ~at_open & (low[t] <= stop_loss)
+            hit_target = held & valid & ~at_open & ~hit_stop & (high[t] >= target)
+            exits = np.flatnonzero(at_open | hit_stop | hit_target)
+
+            if len(exits):
+                price = np.where(at_open, open_[t], np.where(hit_stop, stop_loss, target))[exits]
+                reason = np.select([sell[t-1, exits] & at_open[exits], expired[exits], (open_[t, exits] <= stop_loss[exits]) | hit_stop[exits]],
+                                   ['Signal', 'Max Hold', 'Stop Loss'], 'Target')
+                value = quantity[exits] * price
+                cash += value.sum()
+                traded += value.sum()
+                records.extend(zip(exits, bought_on[exits], np.full(len(exits), t), buy_price[exits], price, quantity[exits], reason))
+                quantity[exits] = 0
+                bars[exits] = 0
+
+            # Entries
+            slots = self.max_positions - np.count_nonzero(quantity)
+            orders = np.flatnonzero(buy[t-1] & valid & (quantity == 0) & (high[t] >= entry[t-1]) & (entry[t-1] > stop[t-1]))
+            if slots > 0 and len(orders):
+                fill = np.maximum(open_[t, orders], entry[t-1, orders])
+                orders, fill = orders[fill > stop[t-1, orders]], fill[fill > stop[t-1, orders]] # Opened below the Stop Loss
+                if rank == 'risk':
+                    order = np.argsort((fill - stop[t-1, orders]) / fill, kind = 'stable')
+                    orders, fill = orders[order], fill[order]
+
+                for col, price in zip(orders, fill):
+                    if slots == 0:
+                        break
+                    qty = Investing.position_size(price, stop[t-1, col], cash, self.risk)
+                    if qty < 1:
+                        continue
+                    quantity[col], buy_price[col], stop_loss[col] = qty, price, stop[t-1, col]
+                    target[col] = price + self.risk_to_reward_ratio * (price - stop_loss[col])
+                    bought_on[col] = t
+                    cash -= qty * price
+                    traded += qty * price
+                    slots -= 1
+
+            held = quantity > 0
+            curve.append((cash + np.nansum(quantity[held] * close[t, held]), cash, np.count_nonzero(held), traded))
+
+        for col in np.flatnonzero(quantity): # Still open at the end
+            records.append((col, bought_on[col], -1, buy_price[col], np.nan, quantity[col], 'Open'))
+
+        self.equity = pd.DataFrame(curve, index = pd.DatetimeIndex(dates[first:last], name = 'DATE'), columns = ['Equity', 'Cash', 'Positions', 'Traded'])
+        self.equity['Drawdown %'] = round((self.equity['Equity'] / self.equity['Equity'].cummax() - 1) * 100, 2)
+
+        trades = pd.DataFrame(records, columns = ['col', 'buy', 'sell', 'buy_price', 'sell_price', 'quantity', 'reason'])
+        self.trades = pd.DataFrame({'SYMBOL': [panel.symbols[col] for col in trades['col']],
+                                    'buy_date': dates[trades['buy'].values] if len(trades) else [],
+                                    'sell_date': np.where(trades['sell'] >= 0, dates[trades['sell'].values], np.datetime64('NaT')) if len(trades) else [],
+                                    'buy_price': trades['buy_price'], 'sell_price': trades['sell_price'], 'quantity': trades['quantity'],
+                                    'p&l': (trades['sell_price'] - trades['buy_price']) * trades['quantity'], 'exit': trades['reason']})
+        self.trades['hold_period'] = (pd.to_datetime(self.trades['sell_date']) - pd.to_datetime(self.trades['buy_date'])).dt.days
+        self.timings['Simulation'] = perf_counter() - timer
+        return self.equity
+
+
+    def summary(self):
+        '''
+        Performance of the last "run": Returns, Max Drawdown, Turnover and win% of the closed trades
+        '''
+        equity = self.equity['Equity']
+        years = max((equity.index[-1] - equity.index[0]).days / 365.25, 1 / 365.25)
+        closed = self.trades.loc[self.trades['exit'] != 'Open']
+        return {'Start': self.capital, 'End': round(equity.iloc[-1], 2),
+                'Return %': round((equity.iloc[-1] / self.capital - 1) * 100, 2),
+                'CAGR %': round(((equity.iloc[-1] / self.capital) ** (1 / years) - 1) * 100, 2),
+                'Max Drawdown %': self.equity['Drawdown %'].min(),
+                'Turnover': round(self.equity['Traded'].iloc[-1] / equity.mean() / years, 2), # Traded value per year as a multiple of the average Equity
+                'Trades': len(closed), 'Open': len(self.trades) - len(closed),
+                'win%': round((closed['p&l'] > 0).mean(), 2) if len(closed) else np.nan,
+                'Avg Hold': round(closed['hold_period'].mean(), 1) if len(closed) else np.nan,
+                'Avg Positions': round(self.equity['Positions'].mean(), 2)}
@@ -0,0 +1,268 @@
+import pandas as pd
+import numpy as np
+from pyarrow import feather
+
+from os import listdir, makedirs, replace
+from os.path import join, exists
+
+import warnings
+
+
+price_columns = ['OPEN','HIGH','LOW','CLOSE','52W H','52W L']
+columns = ['DATE'] + price_columns + ['SYMBOL'] # Same order as the downloaded CSV files. Many functions depend on df.iloc[:,0] being the DATE
+
+# Timeframes kept alongside the Daily data: {timeframe: (sub directory, pandas offset)}. Offsets instead of 'W' / 'M' as the aliases differ across pandas versions
+views = {'W': ('weekly', pd.offsets.Week(weekday = 6)), 'M': ('monthly', pd.offsets.MonthEnd())}
+
+
+class PriceStore:
+    '''
+    Columnar on-disk store for the Daily data. One uncompressed Feather (Arrow) file per symbol with typed float32 prices and pre-parsed dates
+    so that opening a stock is a memory map instead of text parsing. Replaces the per symbol 'SYMBOL_Company_DATE.csv' files in ./data
+    '''
+    def __init__(self, path:str = './data_store', views:tuple = ('W', 'M')):
+        '''
+        args:
+            path: Directory where the Feather files are (or will be) stored
+            views: Timeframes of "price_store.views" which are kept up to date along with the Daily data. Weekly bars are in "path/weekly" and so on
+        '''
+        self.path = path
+        self.views = views
+
+
+    def file(self, name:str):
+        '''
+        Path of the Feather file of a symbol
+        args:
+            name: Name / ID given to the stock. Example, Infosys is "INFY"
+        '''
+        return join(self.path, f'{name}.feather')
+
+
+    def has(self, name:str):
+        '''
+        Whether the symbol is present in the store
+        args:
+            name: Name / ID given to the stock
+        '''
+        return exists(self.file(name))
+
+
+    def symbols(self):
+        '''
+        Get all the symbols present in the store
+        '''
+        if not exists(self.path):
+            return []
+        return [file[:-8] for file in listdir(self.path) if file.endswith('.feather')]
+
+
+    @staticmethod
+    def to_typed(df):
+        '''
+        Convert a DataFrame to the storage schema: Parsed dates, float32 prices, Newest date first
+        args:
+            df: DataFrame with the columns DATE, OPEN, HIGH, LOW, CLOSE, 52W H, 52W L, SYMBOL
+        '''
+        df = df.loc[:,columns].copy()
+        df['DATE'] = pd.to_datetime(df['DATE'])
+        df[price_columns] = df[price_columns].astype('float32')
+        df['SYMBOL'] = df['SYMBOL'].astype(str)
+        return df.sort_values('DATE', ascending = False).reset_index(drop = True)
+
+
+    def write(self, name:str, df):
+        '''
+        Write (overwrite) the whole history of a symbol
+        args:
+            name: Name / ID given to the stock
+            df: DataFrame of the stock
+        '''
+        df = self.to_typed(df)
+        self._write(name, df)
+        self._update_views(name, df)
+
+
+    def _write(self, name:str, df):
+        makedirs(self.path, exist_ok = True)
+        temp = self.file(name) + '.tmp'
+        feather.write_feather(df, temp, compression = 'uncompressed')
+        replace(temp, self.file(name)) # Atomic so that a failed or interrupted run never leaves a half written file
+
+
+    def last_date(self, name:str):
+        '''
+        Get the last (most recent) stored date of a symbol without reading the prices
+        args:
+            name: Name / ID given to the stock
+        returns: pandas Timestamp or None if the symbol is not in the store
+        '''
+        if not self.has(name):
+            return None
+        dates = feather.read_table(self.file(name), columns = ['DATE'], memory_map = True).column('DATE')
+        return pd.Timestamp(dates[0].as_py()) if len(dates) else None
+
+
+    def first_date(self, name:str):
+        '''
+        Get the first (oldest) stored date of a symbol without reading the prices
+        args:
+            name: Name / ID given to the stock
+        returns: pandas Timestamp or None if the symbol is not in the store
+        '''
+        if not self.has(name):
+            return None
+        dates = feather.read_table(self.file(name), columns = ['DATE'], memory_map = True).column('DATE')
+        return pd.Timestamp(dates[len(dates) - 1].as_py()) if len(dates) else None
+
+
+    def last_dates(self):
+        '''
+        Get the last stored date of all the symbols present in the store
+        returns: Dictonary of {symbol: Timestamp}
+        '''
+        return {name: self.last_date(name) for name in self.symbols()}
+
+
+    def append(self, name:str, df):
+        '''
+        Append new rows to the history of a symbol. If a date is already present, the new row replaces the old one
+        args:
+            name: Name / ID given to the stock
+            df: DataFrame of the new rows
+        returns: No of rows in the updated history
+        '''
+        if not self.has(name):
+            self.write(name, df)
+            return len(df)
+
+        old = feather.read_feather(self.file(name), memory_map = True)
+        new = self.to_typed(df)
+        df = pd.concat([new, old[~old['DATE'].isin(new['DATE'])]], ignore_index = True).sort_values('DATE', ascending = False).reset_index(drop = True)
+        self._write(name, df)
+        self._update_views(name, df, new['DATE'].min() if len(new) else None)
+        return len(df)
+
+
+    @staticmethod
+    def resample(df, to:str = 'W'):
+        '''
+        Weekly or Monthly bars of the Daily data in the storage columns. Same OPEN, HIGH, LOW, CLOSE as DataHandler.resample_data but the periods
+        without any trading (holidays, suspensions) are left out instead of being rows of NaN. 52W H / L are the ones of the last day of the period
+        args:
+            df: DataFrame of the Daily data in any order
+            to: One of the keys of "price_store.views"
+        returns: DataFrame with the Newest bar first. DATE is the end of the period like pandas (Sunday of the week, last day of the month)
+        '''
+        how = {'OPEN':'first', 'HIGH':'max', 'LOW':'min', 'CLOSE':'last', '52W H':'last', '52W L':'last', 'SYMBOL':'last'}
+        data = df.loc[:, columns].sort_values('DATE', kind = 'stable').resample(views[to][1], on = 'DATE').agg(how)
+        data = data[data['CLOSE'].notna()].reset_index()
+        return data.sort_values('DATE', ascending = False).reset_index(drop = True)
+
+
+    def view(self, to:str):
+        '''
+        Store of the Weekly or Monthly bars. It has the same methods (read, read_arrays, symbols ...) and can be used for a PricePanel
+        args:
+            to: One of the keys of "price_store.views"
+        '''
+        return PriceStore(join(self.path, views[to][0]), views = ())
+
+
+    def fresh_view(self, name:str, to:str):
+        '''
+        Whether the bars of a timeframe are present and cover the last Daily date of the symbol
+        '''
+        last, bar = self.last_date(name), self.view(to).last_date(name)
+        return (last is not None) and (bar is not None) and (bar >= last)
+
+
+    def _update_views(self, name:str, df, since = None):
+        '''
+        Bring the Weekly / Monthly bars of a symbol up to date with its Daily data
+        args:
+            df: Whole Daily history of the symbol in the storage schema
+            since: Earliest Daily date which changed. Only the periods from the one having it are made again. None makes all of them
+        '''
+        for to in self.views:
+            store = self.view(to)
+            if since is None or not store.has(name):
+                store._write(name, store.to_typed(self.resample(df, to)))
+                continue
+            offset = views[to][1]
+            start = offset.rollforward(pd.Timestamp(since).normalize()) - offset + pd.Timedelta(days = 1) # First day of the period having "since"
+            bars = self.resample(df[df['DATE'] >= start], to)
+            if len(bars):
+                store.append(name, bars)
+
+
+    def update_views(self, symbols:list = None, refit:bool = False):
+        '''
+        Make the Weekly / Monthly bars of the symbols which do not have them or whose bars are older than the Daily data.
+        Needed once for a store made before the views existed. After that every write and append keeps them up to date
+        args:
+            symbols: List of symbols. Default is all the symbols in the store
+            refit: Whether to make them again even if they are up to date
+        returns: List of symbols whose bars were made
+        '''
+        symbols = symbols if symbols is not None else self.symbols()
+        made = []
+        for name in symbols:
+            if self.has(name) and (refit or not all(self.fresh_view(name, to) for to in self.views)):
+                self._update_views(name, feather.read_feather(self.file(name), memory_map = True))
+                made.append(name)
+        return made
+
+
+    def read(self, name:str):
+        '''
+        Read the history of a symbol. Prices are returned as float64 rounded to 2 decimals so that the values are exactly the same as the ones in the CSV files
+        args:
+            name: Name / ID given to the stock
+        returns: DataFrame sorted with the Newest date first, just like the CSV files
+        '''
+        table = feather.read_table(self.file(name), columns = columns[:-1], memory_map = True)
+        
+        data = {'DATE': table.column('DATE').to_numpy().astype('datetime64[ns]')}
+        for col in price_columns: # Building from numpy arrays is much faster than casting the columns of a DataFrame
+            data[col] = np.round(table.column(col).to_numpy().astype('float64'), 2)
+        data['SYMBOL'] = name
+        return pd.DataFrame(data)
+
+
+    def read_arrays(self, name:str, dtype:str = 'float64'):
+        '''
+        Read the history of a symbol as plain numpy arrays without building a DataFrame. Useful when loading the whole universe at once
+        args:
+            name: Name / ID given to the stock
+            dtype: dtype of the price arrays
+        returns: Dictonary of {column: numpy array} with the Newest date first
+        '''
+        table = feather.read_table(self.file(name), columns = columns[:-1], memory_map = True)
+        data = {'DATE': table.column('DATE').to_numpy().astype('datetime64[ns]')}
+        for col in price_columns:
+            data[col] = np.round(table.column(col).to_numpy().astype('float64'), 2).astype(dtype)
+        return data
+
+
+    def migrate_from_csv(self, all_stocks:dict, data_path:str = './data', overwrite:bool = False):
+        '''
+        One shot migration of the existing 'SYMBOL_Company_DATE.csv' files into the store
+        args:
+            all_stocks: Dictonary of {symbol: csv file name}. It is the 'all_stocks' in the data.json
+            data_path: Directory where CSV files are present
+            overwrite: Whether to overwrite the symbols which are already present in the store
+        returns: List of symbols which were migrated
+        '''
+        present = set(listdir(data_path)) if exists(data_path) else set()
+        migrated = []
+        for name, file in all_stocks.items():
+            if (file not in present) or (self.has(name) and not overwrite):
+                continue
+            try:
+                self.write(name, pd.read_csv(join(data_path, file)))
+                migrated.append(name)
+            except Exception as e:
+                warnings.warn(f"Unable to migrate {file}: {e}")
+
+        return migrated
@@ -0,0 +1,65 @@
+'''
+Token bucket to keep the requests to a website under its rate limit, shared by the threaded and the asyncio clients
+'''
+import asyncio
+from threading import Lock
+from time import monotonic, sleep
+
+
+class TokenBucket:
+    '''
+    Token bucket rate limiter. Allows short bursts of "capacity" requests and "rate" requests per second on average.
+    Works with threads ("wait") as well as with asyncio ("acquire")
+    '''
+    def __init__(self, rate:float = 5, capacity:int = 10):
+        '''
+        args:
+            rate: Tokens added per second
+            capacity: Maximum no of tokens that can be saved (burst size)
+        '''
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self._lock = None
+        self._thread_lock = Lock()
+
+
+    def _take(self, tokens:float):
+        '''
+        Take the tokens if available
+        returns: 0 if taken else the seconds to wait for them
+        '''
+        now = monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0
+        return (tokens - self.tokens) / self.rate
+
+
+    def wait(self, tokens:float = 1):
+        '''
+        Block the thread till the tokens are available and take them
+        '''
+        with self._thread_lock: # One waiter at a time so that the requests leave in order
+            while True:
+                delay = self._take(tokens)
+                if not delay:
+                    return
+                sleep(delay)
+
+
+    async def acquire(self, tokens:float = 1):
+        '''
+        Wait till the tokens are available and take them
+        '''
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                delay = self._take(tokens)
+                if not delay:
+                    return
+                await asyncio.sleep(delay)
@@ -0,0 +1,170 @@
+'''
+Record the raw responses of every HTTP request made with "requests" (NSEData, MarketSentiment, get_mmi, KiteZerodha, jugaad_data) to a local archive
+and serve them back later without the network. Live pipelines can then be benchmarked and checked for regressions outside the market hours. Example:
+    with Recorder('./cache/recording.sqlite', mode = 'record'):
+        NSE.current_indices_status(999)
+
+    with Recorder('./cache/recording.sqlite', mode = 'replay', speed = 10): # 10 times faster than the recorded latency. None for no waiting
+        NSE.current_indices_status(999)
+'''
+import sqlite3
+import json
+import zlib
+from hashlib import sha1
+from threading import Lock
+from time import time, sleep
+from os import makedirs
+from os.path import dirname
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+from .lazy import LazyModule
+
+requests = LazyModule('requests')
+
+
+class Recorder:
+    '''
+    Patches requests.Session.request while it is active. Use it as a context manager or call "start" and "stop"
+    '''
+    def __init__(self, path:str = './cache/recording.sqlite', mode:str = 'replay', speed:float = None, ignore:tuple = ('from', 'to')):
+        '''
+        args:
+            path: Path of the SQLite archive. It is created while recording
+            mode: 'record' to send the requests and save the responses, 'replay' to serve the saved responses without any network
+            speed: Replay only. 1 waits for the recorded time of every response, 10 for a tenth of it. None does not wait at all
+            ignore: Query parameters which are not matched while replaying. Dates such as 'from' and 'to' change every day
+        '''
+        assert mode in ('record', 'replay'), "mode has to be one of 'record' or 'replay'"
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.ignore = set(ignore)
+        self.served = {} # {key: no of responses served} so that repeated requests get the responses in the recorded order
+        self.missing = [] # Requests not found in the archive while replaying
+        self._original = None
+        self._lock = Lock()
+        self._db = None
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_db'], state['_lock'], state['_original'] = None, None, None # Connection and lock can not be sent to the worker processes
+        return state
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+    @property
+    def db(self):
+        if self._db is None:
+            makedirs(dirname(self.path) or '.', exist_ok = True)
+            self._db = sqlite3.connect(self.path, timeout = 30, check_same_thread = False)
+            self._db.execute('''CREATE TABLE IF NOT EXISTS responses (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, method TEXT, url TEXT, recorded REAL,
+                                elapsed REAL, status INTEGER, headers TEXT, cookies TEXT, content BLOB)''')
+            self._db.execute('CREATE INDEX IF NOT EXISTS lookup ON responses (key, id)')
+        return self._db
+
+
+    def key(self, method:str, url:str, params = None, data = None, json_data = None):
+        '''
+        Key of a request: method, url with the sorted query (without the ignored parameters) and a hash of the body (never the body itself as it may have passwords)
+        '''
+        url = requests.Request(method, url, params = params).prepare().url
+        parts = urlsplit(url)
+        query = urlencode(sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values = True) if name not in self.ignore))
+        body = data if data is not None else json_data
+        if isinstance(body, dict):
+            body = sorted(body.items())
+        body = sha1(repr(body).encode()).hexdigest() if body is not None else ''
+        return f"{method.upper()} {parts.scheme}://{parts.netloc}{parts.path}?{query} {body}"
+
+
+    def start(self):
+        '''
+        Patch requests.Session.request
+        '''
+        Session = requests.Session
+        if self._original is not None:
+            return self
+        self._original = Session.request
+        recorder = self
+
+        def request(session, method, url, params = None, data = None, json = None, **kwargs):
+            key = recorder.key(method, url, params, data, json)
+            if recorder.mode == 'replay':
+                return recorder.replay(session, key)
+            start = time()
+            response = recorder._original(session, method, url, params = params, data = data, json = json, **kwargs)
+            recorder.record(key, method, response, start, time() - start)
+            return response
+
+        Session.request = request
+        return self
+
+
+    def stop(self):
+        '''
+        Put back the original requests.Session.request
+        '''
+        if self._original is not None:
+            requests.Session.request = self._original
+            self._original = None
+
+
+    def record(self, key:str, method:str, response, start:float, elapsed:float):
+        '''
+        Save a response
+        '''
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in ('content-encoding', 'content-length', 'transfer-encoding')}
+        with self._lock, self.db:
+            self.db.execute('INSERT INTO responses (key, method, url, recorded, elapsed, status, headers, cookies, content) VALUES (?,?,?,?,?,?,?,?,?)',
+                            (key, method.upper(), response.url, start, elapsed, response.status_code, json.dumps(headers),
+                             json.dumps(requests.utils.dict_from_cookiejar(response.cookies)), zlib.compress(response.content)))
+
+
+    def replay(self, session, key:str):
+        '''
+        Saved response of a request as a requests.Response. Repeated requests get the saved responses in order and then the last one again
+        '''
+        with self._lock:
+            rows = self.db.execute('SELECT url, elapsed, status, headers, cookies, content FROM responses WHERE key = ? ORDER BY id', (key,)).fetchall()
+            if not rows:
+                self.missing.append(key)
+                raise requests.exceptions.ConnectionError(f"Not in the recording: {key}")
+            served = self.served.get(key, 0)
+            self.served[key] = served + 1
+
+        url, elapsed, status, headers, cookies, content = rows[min(served, len(rows) - 1)]
+        if self.speed:
+            sleep(elapsed / self.speed)
+
+        response = requests.models.Response()
+        response.url, response.status_code, response._content = url, status, zlib.decompress(content)
+        response.headers.update(json.loads(headers))
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.cookies = requests.cookies.cookiejar_from_dict(json.loads(cookies))
+        session.cookies.update(response.cookies) # Same as what the Session does with the Set-Cookie of a real response
+        return response
+
+
+    def summary(self):
+        '''
+        No of responses and the recorded time of every url in the archive
+        '''
+        rows = self.db.execute('''SELECT key, COUNT(*), ROUND(SUM(elapsed), 3), ROUND(SUM(LENGTH(content)) / 1024.0, 1) FROM responses GROUP BY key ORDER BY MIN(id)''').fetchall()
+        return {key: {'Responses':count, 'Recorded Time (s)':elapsed, 'Size (KB)':size} for key, count, elapsed, size in rows}
+
+
+    def clear(self):
+        '''
+        Remove all the saved responses
+        '''
+        with self._lock, self.db:
+            self.db.execute('DELETE FROM responses')
+        self.served = {}
@@ -0,0 +1,165 @@
+'''
+Cache of the raw responses of the live NSE endpoints so that calling the same endpoint again within a few seconds (such as for every symbol in a loop)
+does not send another request. Every endpoint has its own time to live: seconds for the live quotes and a day for the slow changing lists. Once expired,
+the response is validated again with ETag / If-Modified-Since when the server gave them so an unchanged response is not downloaded again
+'''
+import sqlite3
+import json
+from time import time
+from os import makedirs
+from os.path import dirname
+
+
+# Seconds a response stays fresh. First rule whose text is found in the url is used. Endpoints which match none are never cached
+ttls = {'api/allIndices': 15,
+        'api/equity-stockIndices': 15,
+        'VixDetails': 15,
+        'api/option-chain': 15,
+        'api/live-analysis-52Week': 60,
+        'api/historical/cm/equity': 3600,
+        'fo_underlyinglist': 86400}
+
+
+class ResponseCache:
+    '''
+    In memory cache of the responses with optional persistence to a SQLite file
+    '''
+    def __init__(self, path:str = None, ttls:dict = ttls):
+        '''
+        args:
+            path: Path of the SQLite file to keep the responses across the sessions. None keeps them in memory only
+            ttls: Dictonary of {text in the url: seconds to live}. See response_cache.ttls
+        '''
+        self.path = path
+        self.ttls = dict(ttls)
+        self.entries = {} # {url: (fetched time, etag, last modified, headers, content)}
+        self.counts = {} # {endpoint: {'Hits', 'Misses', 'Revalidated'}}
+        self._db = None
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_db'] = None # Connection can not be sent to the worker processes
+        return state
+
+
+    @property
+    def db(self):
+        if self._db is None:
+            makedirs(dirname(self.path) or '.', exist_ok = True)
+            self._db = sqlite3.connect(self.path, timeout = 30, check_same_thread = False) # Async client may run in another thread inside Jupyter
+            self._db.execute('CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, fetched REAL, etag TEXT, modified TEXT, headers TEXT, content BLOB)')
+        return self._db
+
+
+    def endpoint(self, url:str):
+        '''
+        Rule of the url in "ttls". None if the url is not cached
+        '''
+        for rule in self.ttls:
+            if rule in url:
+                return rule
+
+
+    def ttl(self, url:str, max_age:float = None):
+        '''
+        Seconds a response of the url stays fresh
+        args:
+            max_age: Use it instead of the one in "ttls"
+        '''
+        if max_age is not None:
+            return max_age
+        return self.ttls.get(self.endpoint(url), 0)
+
+
+    def get(self, url:str):
+        '''
+        Stored response of the url whether it is fresh or not
+        returns: Tuple of (fetched time, etag, last modified, headers, content) or None
+        '''
+        entry = self.entries.get(url)
+        if entry is None and self.path:
+            row = self.db.execute('SELECT fetched, etag, modified, headers, content FROM responses WHERE url = ?', (url,)).fetchone()
+            if row:
+                entry = self.entries[url] = (row[0], row[1], row[2], json.loads(row[3]), row[4])
+        return entry
+
+
+    def fresh(self, url:str, max_age:float = None):
+        '''
+        Stored response of the url if it is younger than its time to live
+        returns: Tuple of (headers, content) or None
+        '''
+        entry = self.get(url) if self.ttl(url, max_age) > 0 else None
+        if entry is not None and time() - entry[0] < self.ttl(url, max_age):
+            self.count(url, 'Hits')
+            return entry[3], entry[4]
+
+
+    def validators(self, url:str, max_age:float = None):
+        '''
+        Headers for a conditional request from the stored (expired) response of the url
+        '''
+        entry = self.get(url) if self.ttl(url, max_age) > 0 else None
+        headers = {}
+        if entry is not None:
+            if entry[1]:
+                headers['If-None-Match'] = entry[1]
+            if entry[2]:
+                headers['If-Modified-Since'] = entry[2]
+        return headers
+
+
+    def put(self, url:str, headers:dict, content:bytes, max_age:float = None):
+        '''
+        Store a response. It is not stored when the url has no time to live
+        args:
+            headers: Response headers
+            content: Raw body of the response
+        '''
+        if self.ttl(url, max_age) <= 0:
+            return
+        headers = {key: value for key, value in headers.items() if key.lower() in ('content-type', 'etag', 'last-modified')}
+        etag = next((value for key, value in headers.items() if key.lower() == 'etag'), None)
+        modified = next((value for key, value in headers.items() if key.lower() == 'last-modified'), None)
+        self.entries[url] = (time(), etag, modified, headers, content)
+        self.count(url, 'Misses')
+        if self.path:
+            with self.db:
+                self.db.execute('INSERT OR REPLACE INTO responses VALUES (?,?,?,?,?,?)', (url, self.entries[url][0], etag, modified, json.dumps(headers), content))
+
+
+    def revalidated(self, url:str):
+        '''
+        Server answered 304 Not Modified. Stored response is fresh again
+        returns: Tuple of (headers, content)
+        '''
+        fetched, etag, modified, headers, content = self.get(url)
+        self.entries[url] = (time(), etag, modified, headers, content)
+        self.count(url, 'Revalidated')
+        if self.path:
+            with self.db:
+                self.db.execute('UPDATE responses SET fetched = ? WHERE url = ?', (self.entries[url][0], url))
+        return headers, content
+
+
+    def count(self, url:str, kind:str):
+        counts = self.counts.setdefault(self.endpoint(url) or url, {'Hits':0, 'Misses':0, 'Revalidated':0})
+        counts[kind] += 1
+
+
+    def clear(self):
+        '''
+        Remove all the stored responses and reset the counters
+        '''
+        self.entries, self.counts = {}, {}
+        if self.path:
+            with self.db:
+                self.db.execute('DELETE FROM responses')
+
+
+    def stats(self):
+        '''
+        Hits, Misses (downloaded) and Revalidated (304 Not Modified) of every endpoint in this session
+        '''
+        return {endpoint: dict(counts) for endpoint, counts in self.counts.items()}
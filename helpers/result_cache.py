@@ -0,0 +1,170 @@
+'''
+On disk cache of the per stock screening results so that they survive a restart of the kernel. Results are keyed by
+(symbol, last stored DATE, function, parameters) so that they become invalid by themselves as soon as new data is added for that symbol
+'''
+import sqlite3
+import pickle
+from hashlib import sha1
+from time import time
+from os import makedirs
+from os.path import dirname
+
+
+version = 1 # Bump it when the result of any cached function changes so that the old results are not used
+
+
+class ResultCache:
+    '''
+    SQLite backed cache with Least Recently Used eviction once the total size goes above the limit
+    '''
+    def __init__(self, path:str = './cache/results.sqlite', max_size_mb:float = 256):
+        '''
+        args:
+            path: Path of the SQLite file. It is created on the first use
+            max_size_mb: Max size of the stored results in MB. Least recently used results are removed after that
+        '''
+        self.path = path
+        self.max_size = max_size_mb * 1024**2
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_db'] = None # Connection can not be sent to the worker processes
+        return state
+
+
+    @property
+    def db(self):
+        if self._db is None:
+            makedirs(dirname(self.path) or '.', exist_ok = True)
+            self._db = sqlite3.connect(self.path, timeout = 30)
+            self._db.execute('''CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, symbol TEXT, last_date TEXT, function TEXT, params TEXT,
+                                value BLOB, size INTEGER, accessed REAL)''')
+            self._db.execute('CREATE INDEX IF NOT EXISTS entry ON results (symbol, function, params)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS lru ON results (accessed)')
+        return self._db
+
+
+    @staticmethod
+    def params(args:tuple = (), kwargs:dict = {}):
+        '''
+        Text form of the parameters of a function call
+        '''
+        return repr((version, args, sorted(kwargs.items())))
+
+
+    @staticmethod
+    def key(symbol:str, last_date, function:str, params:str):
+        return sha1(f'{symbol}|{last_date}|{function}|{params}'.encode()).hexdigest()
+
+
+    def get_many(self, keys:list):
+        '''
+        Get the stored results
+        args:
+            keys: List of keys. See ResultCache.key
+        returns: Dictonary of {key: result} for the keys which were found
+        '''
+        found = {}
+        for i in range(0, len(keys), 500): # SQLite limits the no of variables in a query
+            chunk = keys[i:i + 500]
+            rows = self.db.execute(f"SELECT key, value FROM results WHERE key IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+            found.update({key: pickle.loads(value) for key, value in rows})
+
+        if found:
+            with self.db:
+                self.db.executemany('UPDATE results SET accessed = ? WHERE key = ?', [(time(), key) for key in found])
+        return found
+
+
+    def put_many(self, entries:list):
+        '''
+        Store results. Results of the same symbol, function and parameters for any other (older) date are removed
+        args:
+            entries: List of tuples (symbol, last_date, function, params, result)
+        '''
+        now = time()
+        with self.db:
+            for symbol, last_date, function, params, result in entries:
+                value = pickle.dumps(result, protocol = pickle.HIGHEST_PROTOCOL)
+                self.db.execute('DELETE FROM results WHERE symbol = ? AND function = ? AND params = ? AND last_date != ?', (symbol, function, params, str(last_date)))
+                self.db.execute('INSERT OR REPLACE INTO results VALUES (?,?,?,?,?,?,?,?)',
+                                (self.key(symbol, last_date, function, params), symbol, str(last_date), function, params, value, len(value), now))
+        self.evict()
+
+
+    def size(self):
+        '''
+        Total size of the stored results in Bytes
+        '''
+        return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+
+    def evict(self):
+        '''
+        Remove the Least Recently Used results till the size is under the limit
+        '''
+        excess = self.size() - self.max_size
+        if excess <= 0:
+            return
+        removed = 0
+        keys = []
+        for key, size in self.db.execute('SELECT key, size FROM results ORDER BY accessed'):
+            keys.append((key,))
+            removed += size
+            if removed >= excess:
+                break
+        with self.db:
+            self.db.executemany('DELETE FROM results WHERE key = ?', keys)
+
+
+    def clear(self, symbol:str = None):
+        '''
+        Remove all the results or the results of a single symbol
+        '''
+        with self.db:
+            if symbol:
+                self.db.execute('DELETE FROM results WHERE symbol = ?', (symbol,))
+            else:
+                self.db.execute('DELETE FROM results')
+
+
+    def stats(self):
+        '''
+        No of results stored, their size and the hits / misses of this session
+        '''
+        count = self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        return {'Entries':count, 'Size (MB)':round(self.size() / 1024**2, 3), 'Hits':self.hits, 'Misses':self.misses}
+
+
+    def map(self, executor, context, method:str, items:list, *args, **kwargs):
+        '''
+        Same as ParallelExecutor.map but the results are read from the cache where possible and only the rest are computed (and stored)
+        args:
+            executor: ParallelExecutor object
+            context: DataHandler or any child object. It's "store" gives the last date of every symbol
+            method: Name of the method to run for every symbol
+            items: List of symbols
+            args, kwargs: Extra arguments passed to the method
+        returns: List of results in the same order as the items
+        '''
+        items = list(items)
+        params = self.params(args, kwargs)
+        dates = [context.store.last_date(name) for name in items] # None if not in the store. Those are never cached
+        keys = [self.key(name, last_date, method, params) if last_date is not None else None for name, last_date in zip(items, dates)]
+
+        found = self.get_many([key for key in keys if key])
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        self.hits += len(items) - len(missing)
+        self.misses += len(missing)
+
+        computed = executor.map(context, method, [items[i] for i in missing], *args, **kwargs)
+        self.put_many([(items[i], dates[i], method, params, result) for i, result in zip(missing, computed) if keys[i]])
+
+        results = [found.get(key) for key in keys]
+        for i, result in zip(missing, computed):
+            results[i] = result
+        return results
@@ -1,18 +1,17 @@
 from .datahandler import *
-import plotly.graph_objects as go
-import plotly.io as pio
 from .candlestick import *
 from ta.trend import ADXIndicator, macd_diff, cci
 from ta.volatility import average_true_range
 from .nse_data import NSEData
 from .plotting import Plots
+from .indicators import BatchIndicators, moving_average, latest
+from .executor import ParallelExecutor
+from .lazy import LazyObject
 import numpy as np
 
 CP = CandlePattern()
 NSE = NSEData()
-PLT = Plots()
-
-pio.renderers.default = 'colab' 
+PLT = LazyObject(Plots) # Reads the data.json so it is created on the first plot
 
 
 class AnalyseStocks(DataHandler):
@@ -22,8 +21,8 @@ class AnalyseStocks(DataHandler):
             path: Path where all the stock files are saved
         '''
         super().__init__(check_fresh = check_fresh)
-        self.registered_stocks = self.read_data()['registered_stocks']
-        self.colors = self.read_data()['colors']
+        self.registered_stocks = self.data['registered_stocks']
+        self.colors = self.data['colors']
         self.rising = {}
         self.recent_info = {}
         self.indices = {'nifty_50': 'Nifty 50','nifty_100':'Nifty 100','nifty_200':'Nifty 200','nifty_500':'Nifty 500'}
@@ -129,7 +128,7 @@ class AnalyseStocks(DataHandler):
         Open, Close, Low, High = names
         d = df.copy()
         if d.iloc[0,0] > d.iloc[1,0]: # if the first Date entry [0,0] is > previous data entry [1,0] then it is in descending order, then reverse it for calculation
-            df.sort_index(ascending=False, inplace = True)
+            d.sort_index(ascending=False, inplace = True)
 
 
         # Tenkan-sen (Conversion Line): (9-period high + 9-period low)/2))
@@ -197,18 +196,45 @@ class AnalyseStocks(DataHandler):
         return count
     
     
-    def update_eligible(self, limit:float):
+    def _screen(self, method:str, stocks:list, *args, workers:int = None, cache:bool = True, **kwargs):
+        '''
+        Run a per stock method for all the stocks in parallel, reading the results of the unchanged stocks from the disk cache
+        args:
+            method: Name of the method. It's first argument must be the name of the stock
+            stocks: List of stocks
+            args, kwargs: Extra arguments passed to the method
+            workers: No of worker processes. Default is 80% of the CPUs. 1 runs serially. Workers read the stocks of the panel loaded with get_panel from it
+            cache: Whether to use the cache
+        returns: List of results in the same order as the stocks
+        '''
+        executor = ParallelExecutor(workers, panel = self._panel)
+        if cache:
+            return self.cache.map(executor, self, method, stocks, *args, **kwargs)
+        return executor.map(self, method, stocks, *args, **kwargs)
+
+
+    def update_eligible(self, limit:float, workers:int = None, cache:bool = True):
         '''
         Save all Eligible stocks for the current week
         args:
             limit: Distance between MA line and the Min(open,close,low,high)
+            workers: No of worker processes. Default is 80% of the CPUs. 1 runs serially
+            cache: Whether to use the results cached on disk for the stocks which have no new data
         '''
         self.eligible = {}
-        for key in self.registered_stocks:
-            result = self.is_ma_eligible(self.open_downloaded_stock(key), limit = limit)
+        for result, rising in self._screen('_ma_eligible_of', self.registered_stocks, limit, workers = workers, cache = cache):
             if result:
                 self.eligible.update(result)
+                self.rising.update(rising)
         return self.eligible
+
+
+    def _ma_eligible_of(self, name:str, limit:float):
+        '''
+        is_ma_eligible for a single stock along with the "rising" value it sets, so that it can run in a worker process
+        '''
+        result = self.is_ma_eligible(self.open_downloaded_stock(name), limit = limit)
+        return result, ({name: self.rising[name]} if result else {})
     
     
     def get_RSI(self, data, periods:int = 14, Close:str = 'CLOSE', ema:bool = True, return_df:bool = False, signal_only:bool = False):
@@ -588,12 +614,27 @@ class AnalyseStocks(DataHandler):
         return pivots
 
 
-    def get_recent_info(self, nifty:int=200, custom_list:tuple = None, col_names:tuple = ('DATE','OPEN','CLOSE','LOW','HIGH'), **kwargs):
+    def get_indicator_table(self, nifty:int = 500, custom_list:list = None, mvs:list = [20,50,100,200]):
+        '''
+        Latest RSI, ATR, CCI, ADX, MACD Signal, Stochastic and Moving Averages of all the stocks in a single vectorized call on the universe panel.
+        Values are the same as the ones given by the individual functions
+        args:
+            nifty: Nifty Index to check
+            custom_list: Names of Stocks which you want to analyse instead of the Index
+            mvs: Simple Moving Averages to include
+        '''
+        stocks = custom_list if custom_list else self.data[f"nifty_{nifty}"]
+        return BatchIndicators(self.get_panel(stocks)).table(mvs)
+
+
+    def get_recent_info(self, nifty:int=200, custom_list:tuple = None, col_names:tuple = ('DATE','OPEN','CLOSE','LOW','HIGH'), workers:int = None, cache:bool = True, **kwargs):
         '''
         Get Recent Info for all of the stocks and sort them accordingaly
         args:
             nifty: Nifty Index to check
             custom_list: Names of Stocks which you want to analyse
+            workers: No of worker processes. Default is 80% of the CPUs. 1 runs serially
+            cache: Whether to use the results cached on disk for the stocks which have no new data
         '''
         nif = self.data[f"nifty_{nifty}"]
         if not custom_list:
@@ -605,53 +646,9 @@ class AnalyseStocks(DataHandler):
         else:
             nif = custom_list
 
-        DATE, Open, Close, Low, High = col_names
-        names = []
-        over_20 = []
-        over_50 = []
-        over_100 = []
-        over_200 = []
-        momentum = []
-        ichi = []
-        c1 = []
-        c2 = []
-        c3 = []
-        T = []
-        index = []
-        ltp = []
-        macd_signal = []
-        cci_signal = []
-        rsi_signal = []
-
-        for name in nif:
-            df  = self.open_downloaded_stock(name)
-
-            LTP = df.loc[0,Close] # last Trading PRice
-            ltp.append(LTP)
-
-            T.append(df.loc[0,DATE])
-            names.append(name)
-
-            result = self._recent_info(name, **kwargs)
-
-            over_20.append(LTP > result[0])
-            over_50.append(LTP > result[1])
-            over_100.append(LTP > result[2])
-            over_200.append(LTP > result[3])
-
-            ichi.append(result[5])
-
-            c1.append(result[6])
-            c2.append(result[7])
-            c3.append(result[8])
-
-            momentum.append(result[9])
-
-            index.append(self.get_index(name))
-
-            rsi_signal.append(result[4])
-            macd_signal.append(self.macd_signal(df))
-            cci_signal.append(self.get_CCI(df, signal_only=True))
+        rows = self._screen('_recent_row', list(nif), col_names, workers = workers, cache = cache, **kwargs)
+        index = [self.get_index(name) for name in nif] # Not cached as it changes with the indices and not with the data
+        T, names, ltp, cci_signal, rsi_signal, macd_signal, over_20, over_50, over_100, over_200, momentum, ichi, c1, c2, c3 = [list(column) for column in zip(*rows)] if rows else [[]] * 15
 
         df = pd.DataFrame({'Date':T,'Name':names,'LTP':ltp,'Index':index,"CCI Signal":cci_signal,'RSI Signal':rsi_signal, "MACD Signal":macd_signal,
         'Over 20-SMA':over_20, 'Over 50-SMA':over_50,'Over 100-SMA':over_100,'Over 200-SMA':over_200,
@@ -661,7 +658,21 @@ class AnalyseStocks(DataHandler):
         return df
 
 
-    def tight_consolidation_stocks(self, stocks:str = 'nifty_200', diff:float = 0.01, min_count:int = 5, lookback_period:int = 7, names:tuple = ('OPEN','CLOSE','LOW','HIGH'), force_live:bool = False):
+    def _recent_row(self, name:str, col_names:tuple = ('DATE','OPEN','CLOSE','LOW','HIGH'), **kwargs):
+        '''
+        Row of get_recent_info for a single stock except the Index: (Date, Name, LTP, CCI Signal, RSI Signal, MACD Signal, Over 20-SMA, Over 50-SMA, Over 100-SMA, Over 200-SMA, Momentum ADX, Ichi Count, 1 Candle, 2 Candles, 3 Candles)
+        '''
+        DATE, Open, Close, Low, High = col_names
+        df  = self.open_downloaded_stock(name)
+
+        LTP = df.loc[0,Close] # last Trading PRice
+        result = self._recent_info(name, **kwargs)
+
+        return (df.loc[0,DATE], name, LTP, self.get_CCI(df, signal_only=True), result[4], self.macd_signal(df),
+                LTP > result[0], LTP > result[1], LTP > result[2], LTP > result[3], result[9], result[5], result[6], result[7], result[8])
+
+
+    def tight_consolidation_stocks(self, stocks:str = 'nifty_200', diff:float = 0.01, min_count:int = 5, lookback_period:int = 7, names:tuple = ('OPEN','CLOSE','LOW','HIGH'), force_live:bool = False, workers:int = None, cache:bool = True):
         '''
         Get all the stocks in tight consolidation. There are certain conditions for consolidation:
         1. Stock has to be above 50 days Moving Average
@@ -674,33 +685,114 @@ class AnalyseStocks(DataHandler):
             min_touches: Minimum number of candle touches within that zone. High number means that more reliable breakout
             lookback_period: No of days to lookback. Too huge will give many false names and small value will give too less names
             names: Names of columns which contains the values for that stock
-            force_live: Whether to force download the live market. Market is updated after 11:30 PM, force_live gets the date of past 50 days after 3:30
+            force_live: Whether to force download the live market. Market is updated after 11:30 PM, force_live gets the date of past 50 days after 3:30. It always runs serially as it uses the NSE session
+            workers: No of worker processes. Default is 80% of the CPUs. 1 runs serially
+            cache: Whether to use the results cached on disk for the stocks which have no new data. Live data is never cached
         returns:
                 Dictonary containing {stock_name:no of candles}
         '''
+        counts = self._screen('_consolidation_count', self.data[stocks], diff, min_count, lookback_period, names, force_live, workers = 1 if force_live else workers, cache = cache and not force_live)
+        result = {name: count for name, count in zip(self.data[stocks], counts) if count}
+        return dict(sorted(result.items(), key = lambda x: x[1], reverse= True))
+
+
+    def _consolidation_count(self, name:str, diff:float = 0.01, min_count:int = 5, lookback_period:int = 7, names:tuple = ('OPEN','CLOSE','LOW','HIGH'), force_live:bool = False):
+        '''
+        No of candles in the consolidation zone of a single stock as per tight_consolidation_stocks. 0 if it is not consolidating
+        '''
         OPEN, CLOSE, LOW, HIGH = names
-        result = {}
-        
-        for name in self.data[stocks]:
-            if not force_live:
-                df = self.open_downloaded_stock(name)
-            else:
-                df = NSE.fifty_days_data(name)
+        if not force_live:
+            df = self.open_downloaded_stock(name)
+        else:
+            df = NSE.fifty_days_data(name)
+
+        df = self.get_MA(df,window = 50,names = names)
+        df = self.get_MA(df,window = 200,names = names)
+
+        closing = df.loc[0,CLOSE]
+        compare = max(df.loc[0,OPEN], closing)
+
+        if (closing > df.loc[0,'50-MA']) and (df.loc[0,'50-MA'] > df.loc[0,'200-MA']):
+            
+            count = 1
+            for index in df.index[1:lookback_period]:
+                if compare - (compare * diff) < max(df.loc[index,OPEN],df.loc[index,CLOSE]) < compare + (compare * diff):
+                    count += 1
+
+            if count >= min_count:
+                return count
+        return 0
 
-            df = self.get_MA(df,window = 50,names = names)
-            df = self.get_MA(df,window = 200,names = names)
 
-            closing = df.loc[0,CLOSE]
-            compare = max(df.loc[0,OPEN], closing)
+    def find_pattern(self, pattern:str, sessions:int = 5, above_ma:bool = None, stocks = None, update:bool = False):
+        '''
+        Stocks which printed a candlestick pattern in the last few sessions. It is a lookup in the pattern index built by the data refresh so nothing is opened or computed
+        args:
+            pattern: Name of the pattern such as 'Bullish Engulfing', 'Hammer', 'V Pattern', 'Three White Soldiers'
+            sessions: No of latest sessions to look at
+            above_ma: True for only the stocks above their 200-MA on that day, False for only below. None for all. Days before the first 200 sessions of a stock are neither
+            stocks: Nifty index such as 'nifty_200' or a list of stocks. Default is all
+            update: Whether to add the sessions missing in the index first (the first call builds the whole index)
+        returns: DataFrame of SYMBOL, DATE, PATTERN, CLOSE, ABOVE MA sorted from the newest date
+        '''
+        stocks = self.data[stocks] if isinstance(stocks, str) else stocks
+        if update:
+            self.update_patterns()
+        else:
+            missing = self.pattern_index.missing(self.store)
+            if missing:
+                warnings.warn(f"{len(missing)} stocks of the store are not in the pattern index and are not searched. Pass update = True to add them. Example: {missing[:5]}")
+        return self.pattern_index.query(pattern, sessions, above_ma, stocks)
+
 
-            if (closing > df.loc[0,'50-MA']) and (df.loc[0,'50-MA'] > df.loc[0,'200-MA']):
-                
-                count = 1
-                for index in df.index[1:lookback_period]:
-                    if compare - (compare * diff) < max(df.loc[index,OPEN],df.loc[index,CLOSE]) < compare + (compare * diff):
-                        count += 1
+    def pattern_stats(self, patterns:list = None, above_ma:bool = None, start = None, end = None, stocks = None):
+        '''
+        How the stocks moved after every candlestick pattern historically. Returns are from the close of the pattern day to the close after 1, 5, 10 and 20 sessions
+        args:
+            patterns: List of pattern names. Default is all
+            above_ma: Only the occurrences above (True) or below (False) the 200-MA. None for all
+            start, end: Date range of the occurrences
+            stocks: Nifty index such as 'nifty_200' or a list of stocks. Default is all
+        returns: DataFrame indexed by pattern with the no of occurrences, Average return % and % of times the return was positive for every horizon
+        '''
+        stocks = self.data[stocks] if isinstance(stocks, str) else stocks
+        return self.pattern_index.stats(patterns, above_ma, start, end, stocks)
+
+
+    def screen_timeframes(self, conditions:dict, stocks = None):
+        '''
+        Screen the stocks on many timeframes in one pass. Every timeframe is loaded once as a panel (Weekly / Monthly bars are kept in the store)
+        and its condition is a single vectorized call on all the stocks still in the screen
+        args:
+            conditions: Dictonary of {timeframe: function}. Timeframe is 'D', 'W' or 'M'. Function takes a BatchIndicators and returns a boolean Series indexed by symbol
+                or a DataFrame of only the passing symbols such as BatchIndicators.MA_eligible. Put the strictest timeframe first
+            stocks: Nifty index such as 'nifty_200' or a list of stocks. Default is all the registered stocks
+        returns: DataFrame of the stocks passing on every timeframe. Columns of the DataFrames returned by the functions are prefixed by the timeframe such as "D Diff"
+        '''
+        stocks = self.data[stocks] if isinstance(stocks, str) else (stocks if stocks is not None else self.registered_stocks)
+        passed = pd.DataFrame(index = list(stocks))
+        for timeframe, condition in conditions.items():
+            if not len(passed):
+                break
+            result = condition(BatchIndicators(self.get_panel(list(passed.index), timeframe = timeframe)))
+            if isinstance(result, pd.Series):
+                result = pd.DataFrame(index = result.index[result.fillna(False).astype(bool).values])
+            passed = passed.join(result.add_prefix(f'{timeframe} '), how = 'inner')
+        return passed
+
+
+    def ma_eligible_timeframes(self, limit:float = None, mv:int = 44, stocks = None):
+        '''
+        44-MA rule on two timeframes: Weekly close above a rising Weekly moving average and the Daily candle at the Daily moving average (see is_ma_eligible)
+        args:
+            limit: Limit difference between average and low/high threshold on the Daily candle. Default is 0.15% of the low
+            mv: Moving Average to Consider on both the timeframes
+            stocks: Nifty index such as 'nifty_200' or a list of stocks. Default is all the registered stocks
+        returns: DataFrame of the eligible stocks with the Daily "D Diff" and "D Rising"
+        '''
+        def weekly(batch):
+            average = moving_average(batch.close, mv)
+            current = latest(average, batch.lengths)
+            return pd.Series((latest(batch.close, batch.lengths) > current) & (current > batch.previous(average)), index = batch.symbols)
 
-                if count >= min_count:
-                    result[name] = count
-                    
-        return dict(sorted(result.items(), key = lambda x: x[1], reverse= True))
\ No newline at end of file
+        return self.screen_timeframes({'W': weekly, 'D': lambda batch: batch.MA_eligible(limit, mv)}, stocks)
@@ -0,0 +1,354 @@
+'''
+Stateful indicators which are updated one bar at a time with constant work instead of recomputing the whole history on every new candle.
+Seed them once from the stored history and then keep calling "update" from the live loop. Values are the same as the ones of AnalyseStocks
+'''
+from collections import deque
+from math import sqrt, nan, isnan
+
+
+class StreamingIndicator:
+    '''
+    Base class. Every indicator takes a bar having 'OPEN', 'HIGH', 'LOW', 'CLOSE' (a row of the DataFrame, pandas Series or a dictonary)
+    '''
+    names = ('OPEN','HIGH','LOW','CLOSE')
+
+    def seed(self, df, date:str = 'DATE'):
+        '''
+        Feed the whole history. Order of the DataFrame does not matter, it is fed from Oldest to Newest
+        args:
+            df: DataFrame of the stock such as the one returned by DataHandler.open_downloaded_stock
+            date: Name of the column having dates
+        returns: self so that it can be chained
+        '''
+        df = df.sort_values(date)
+        Open, High, Low, Close = self.names
+        for values in zip(df[Open].values, df[High].values, df[Low].values, df[Close].values):
+            self._update(*values)
+        return self
+
+
+    def update(self, bar):
+        '''
+        Add a new bar and get the new value
+        args:
+            bar: Anything with the keys 'OPEN', 'HIGH', 'LOW', 'CLOSE'
+        '''
+        Open, High, Low, Close = self.names
+        return self._update(bar[Open], bar[High], bar[Low], bar[Close])
+
+
+    def _update(self, open_, high, low, close):
+        raise NotImplementedError
+
+
+class RollingExtreme:
+    '''
+    Rolling Max or Min using a monotonic queue. O(1) amortized per value
+    '''
+    def __init__(self, window:int, kind:str = 'max'):
+        self.window = window
+        self.better = (lambda new, old: new >= old) if kind == 'max' else (lambda new, old: new <= old)
+        self.queue = deque() # (index, value)
+        self.count = 0
+
+    def update(self, value:float):
+        while self.queue and self.better(value, self.queue[-1][1]):
+            self.queue.pop()
+        self.queue.append((self.count, value))
+        if self.queue[0][0] <= self.count - self.window:
+            self.queue.popleft()
+        self.count += 1
+        return self.queue[0][1] if self.count >= self.window else nan
+
+
+class SMA(StreamingIndicator):
+    '''
+    Simple Moving Average of Close. Same as AnalyseStocks.get_MA(simple = True)
+    '''
+    def __init__(self, window:int = 44, min_periods:int = 1):
+        self.window = window
+        self.min_periods = min_periods
+        self.values = deque(maxlen = window)
+        self.total = 0.0
+        self.value = nan
+
+    def _update(self, open_, high, low, close):
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(close)
+        self.total += close
+        self.value = self.total / len(self.values) if len(self.values) >= self.min_periods else nan
+        return self.value
+
+
+class EMA(StreamingIndicator):
+    '''
+    Exponential Moving Average of Close. Same as AnalyseStocks.get_MA(simple = False)
+    '''
+    def __init__(self, window:int = 44, min_periods:int = 1):
+        self.alpha = 2 / (window + 1)
+        self.min_periods = min_periods
+        self.count = 0
+        self.ema = nan
+        self.value = nan
+
+    def _update(self, open_, high, low, close):
+        return self.add(close)
+
+    def add(self, value:float):
+        '''
+        Add a raw value instead of a bar. NaN values are skipped like pandas does for the leading ones
+        '''
+        if isnan(value):
+            return self.value
+        self.ema = value if self.count == 0 else self.alpha * value + (1 - self.alpha) * self.ema
+        self.count += 1
+        self.value = self.ema if self.count >= self.min_periods else nan
+        return self.value
+
+
+class RSI(StreamingIndicator):
+    '''
+    Relative Strength Index. Same as AnalyseStocks.get_RSI (ema = True)
+    '''
+    def __init__(self, periods:int = 14):
+        self.periods = periods
+        self.decay = 1 - (1 / periods)
+        self.prev_close = None
+        self.count = 0
+        self.up = self.down = self.weight = 0.0 # adjusted ewm = weighted sum / sum of weights
+        self.value = nan
+
+    def _update(self, open_, high, low, close):
+        if self.prev_close is not None:
+            delta = close - self.prev_close
+            self.up = max(delta, 0) + self.decay * self.up
+            self.down = max(-delta, 0) + self.decay * self.down
+            self.weight = 1 + self.decay * self.weight
+            self.count += 1
+
+            if self.count >= self.periods:
+                ma_up, ma_down = self.up / self.weight, self.down / self.weight
+                self.value = 100 - (100 / (1 + ma_up / ma_down)) if ma_down else (100.0 if ma_up else nan)
+
+        self.prev_close = close
+        return self.value
+
+
+class ATR(StreamingIndicator):
+    '''
+    Average True Range with Wilder's smoothing. Same as AnalyseStocks.get_ATR
+    '''
+    def __init__(self, window:int = 14):
+        self.window = window
+        self.prev_close = None
+        self.first = [] # True Ranges of the first window
+        self.value = 0.0
+
+    def _update(self, open_, high, low, close):
+        tr = high - low if self.prev_close is None else max(high - low, abs(high - self.prev_close), abs(low - self.prev_close))
+        self.prev_close = close
+
+        if len(self.first) < self.window:
+            self.first.append(tr)
+            if len(self.first) == self.window:
+                self.value = sum(self.first) / self.window
+        else:
+            self.value = (self.value * (self.window - 1) + tr) / self.window
+        return self.value
+
+
+class ADX(StreamingIndicator):
+    '''
+    Average Directional Index. Same values and alignment as the ADXIndicator of "ta" used by AnalyseStocks.get_ADX
+    "value" is the ADX; "pos" and "neg" are the +DI and -DI
+    '''
+    def __init__(self, window:int = 14):
+        self.window = window
+        self.bar = -1
+        self.prev = None # previous (high, low, close)
+        self.trs = self.dip = self.din = 0.0
+        self.directional = [] # first "window" directional indices
+        self.value = self.pos = self.neg = 0.0
+
+    def _update(self, open_, high, low, close):
+        self.bar += 1
+        w = self.window
+        if self.prev is None:
+            self.prev = (high, low, close)
+            return self.value
+
+        prev_high, prev_low, prev_close = self.prev
+        self.prev = (high, low, close)
+
+        tr = max(high, prev_close) - min(low, prev_close)
+        up, down = high - prev_high, prev_low - low
+        pos = up if (up > down and up > 0) else 0.0
+        neg = down if (down > up and down > 0) else 0.0
+
+        if self.bar <= w: # sums of the first window (bars 1 to window)
+            self.trs += tr
+            self.dip += pos
+            self.din += neg
+            if self.bar < w:
+                return self.value
+        else:
+            self.trs = self.trs - (self.trs / w) + tr
+            self.dip = self.dip - (self.dip / w) + pos
+            self.din = self.din - (self.din / w) + neg
+
+        dip = 100 * (self.dip / self.trs) if self.trs != 0 else 0
+        din = 100 * (self.din / self.trs) if self.trs != 0 else 0
+        directional = 100 * abs((dip - din) / (dip + din)) if (dip + din) != 0 else 0
+
+        if self.bar > w: # "ta" starts +DI and -DI one bar later
+            self.pos, self.neg = dip, din
+
+        if len(self.directional) < w:
+            self.directional.append(directional)
+            if len(self.directional) == w:
+                self.value = sum(self.directional) / w
+        else:
+            self.value = (self.value * (w - 1) + directional) / w
+        return self.value
+
+
+class CCI(StreamingIndicator):
+    '''
+    Commodity Channel Index. Same as AnalyseStocks.get_CCI. Mean deviation needs the values of the window, so the work is O(window) per bar (still independent of the history)
+    '''
+    def __init__(self, window:int = 20, constant:float = 0.015):
+        self.window = window
+        self.constant = constant
+        self.values = deque(maxlen = window)
+        self.total = 0.0
+        self.value = nan
+
+    def _update(self, open_, high, low, close):
+        typical = (high + low + close) / 3.0
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(typical)
+        self.total += typical
+
+        if len(self.values) == self.window:
+            mean = self.total / self.window
+            deviation = sum(abs(value - mean) for value in self.values) / self.window
+            self.value = (typical - mean) / (self.constant * deviation) if deviation else nan
+        return self.value
+
+
+class Stochastic(StreamingIndicator):
+    '''
+    Stochastic Oscillator. Same as AnalyseStocks.Stochastic. "value" is the tuple (Blue Line, Red Line)
+    '''
+    def __init__(self, k_period:int = 14, d_period:int = 3, smooth_k:int = 3):
+        self.high = RollingExtreme(k_period, 'max')
+        self.low = RollingExtreme(k_period, 'min')
+        self.smooth = SMA(smooth_k, smooth_k) if smooth_k > 1 else None
+        self.signal = SMA(d_period, d_period)
+        self.value = (nan, nan)
+
+    def _feed(self, sma, value):
+        if isnan(value): # NaN inside the window makes the rolling mean NaN
+            sma.values.clear()
+            sma.total = 0.0
+            sma.value = nan
+            return nan
+        return sma._update(None, None, None, value)
+
+    def _update(self, open_, high, low, close):
+        n_high, n_low = self.high.update(high), self.low.update(low)
+        blue = (close - n_low) * 100 / (n_high - n_low) if (n_high - n_low) else nan
+        if self.smooth:
+            blue = self._feed(self.smooth, blue)
+        red = self._feed(self.signal, blue)
+        self.value = (blue, red)
+        return self.value
+
+
+class Bollinger(StreamingIndicator):
+    '''
+    Bollinger Bands with 2 standard deviations. Same as AnalyseStocks.get_BollingerBands. "value" is the tuple (Upper, Lower)
+    '''
+    def __init__(self, window:int = 20):
+        self.window = window
+        self.values = deque(maxlen = window)
+        self.shift = None # Sums are kept relative to the first value so that the variance does not lose precision
+        self.total = self.squares = 0.0
+        self.value = (nan, nan)
+
+    def _update(self, open_, high, low, close):
+        if self.shift is None:
+            self.shift = close
+        if len(self.values) == self.window:
+            old = self.values[0] - self.shift
+            self.total -= old
+            self.squares -= old * old
+        self.values.append(close)
+        new = close - self.shift
+        self.total += new
+        self.squares += new * new
+
+        if len(self.values) == self.window:
+            mean = self.total / self.window
+            std = sqrt(max(self.squares / self.window - mean * mean, 0))
+            mean += self.shift
+            self.value = (mean + 2 * std, mean - 2 * std)
+        return self.value
+
+
+class Ichimoku(StreamingIndicator):
+    '''
+    Ichimoku lines. Same as AnalyseStocks.Ichimoku_Cloud. "value" is a dictonary of blue_line (Tenkan), red_line (Kijun), cloud_green_line_a, cloud_red_line_b.
+    Lagging line is the Close plotted 26 bars back so it is known only for the bar 26 bars before the current one: "lagging_line" is that value
+    '''
+    def __init__(self, conversion:int = 9, base:int = 26, span_b:int = 52, displacement:int = 26):
+        self.extremes = {window: (RollingExtreme(window, 'max'), RollingExtreme(window, 'min')) for window in (conversion, base, span_b)}
+        self.conversion, self.base, self.span_b = conversion, base, span_b
+        self.span_a_history = deque([nan] * (displacement + 1), maxlen = displacement + 1)
+        self.span_b_history = deque([nan] * (displacement + 1), maxlen = displacement + 1)
+        self.value = {}
+
+    def _update(self, open_, high, low, close):
+        mids = {}
+        for window, (highest, lowest) in self.extremes.items():
+            mids[window] = (highest.update(high) + lowest.update(low)) / 2
+
+        blue, red = mids[self.conversion], mids[self.base]
+        self.span_a_history.append((blue + red) / 2)
+        self.span_b_history.append(mids[self.span_b])
+
+        self.value = {'blue_line':blue, 'red_line':red, 'cloud_green_line_a':self.span_a_history[0], 'cloud_red_line_b':self.span_b_history[0], 'lagging_line':close}
+        return self.value
+
+
+class MACD(StreamingIndicator):
+    '''
+    MACD. "value" is the MACD Diff (Histogram) same as ta.trend.macd_diff used by AnalyseStocks.macd_signal. "macd" and "signal" hold the lines
+    '''
+    def __init__(self, window_slow:int = 26, window_fast:int = 12, window_sign:int = 9):
+        self.fast = EMA(window_fast, window_fast)
+        self.slow = EMA(window_slow, window_slow)
+        self.signal_ema = EMA(window_sign, window_sign)
+        self.macd = self.signal = self.value = nan
+
+    def _update(self, open_, high, low, close):
+        self.macd = self.fast.add(close) - self.slow.add(close)
+        self.signal = self.signal_ema.add(self.macd)
+        self.value = self.macd - self.signal
+        return self.value
+
+
+def from_history(handler, name:str, indicators:list, kind:str = 'daily'):
+    '''
+    Open the stored history of a stock once and seed all the indicators from it
+    args:
+        handler: DataHandler (or any child such as AnalyseStocks) object
+        name: Symbol of the stock
+        indicators: List of indicator objects. Example: [RSI(), ATR(), MACD()]
+        kind: "daily" or any of the minutes_N data. See DataHandler.open_downloaded_stock
+    returns: Same list of indicators, seeded
+    '''
+    df = handler.open_downloaded_stock(name, kind = kind)
+    return [indicator.seed(df) for indicator in indicators]
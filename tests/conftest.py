@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+
+@pytest.fixture(scope = 'session')
+def analyser(tmp_path_factory):
+    '''
+    AnalyseStocks on the shipped CSV files of the Nifty 50 stocks migrated to a temporary PriceStore
+    '''
+    os.chdir(root) # data.json is read from the current directory
+    from helpers.stock_analyser import AnalyseStocks
+    from helpers.price_store import PriceStore
+
+    analyser = AnalyseStocks(check_fresh = False)
+    analyser.store = PriceStore(str(tmp_path_factory.mktemp('data_store')))
+    analyser.store.migrate_from_csv({name: analyser.all_stocks[name] for name in analyser.data['nifty_50']}, analyser.data_path)
+    return analyser
@@ -0,0 +1,93 @@
+'''
+AsyncNSEData against the local FakeNSE server
+'''
+import asyncio
+from time import perf_counter
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from helpers.nse_data import NSEData
+from helpers.async_nse import AsyncNSEData, open_nse_indices, run
+from helpers.fake_nse import FakeNSE
+
+
+@pytest.fixture
+def server():
+    with FakeNSE(latency = 0.05) as server:
+        yield server
+
+
+def fetch(server, urls:list, **kwargs):
+    '''
+    Fetch the urls concurrently with a fresh client and return the results
+    '''
+    async def main():
+        async with AsyncNSEData(server.url, **kwargs) as nse:
+            return await asyncio.gather(*[nse.fetch_json(url) for url in urls])
+    return run(main())
+
+
+def test_matches_sync_client(server):
+    sync = NSEData(server.url)
+    frames = open_nse_indices(server.indices, show_n = 9999, baseurl = server.url, rate = 100, burst = 100)
+    for name in server.indices:
+        assert frames[name].equals(sync.open_nse_index(name, show_n = 9999))
+
+    async def main():
+        async with AsyncNSEData(server.url) as nse:
+            return (await nse.current_indices_status(999), await nse.fifty_days_data('INFY'), await nse.stocks_at_52W('low'))
+    status, fifty, low = run(main())
+    assert status.equals(sync.current_indices_status(999))
+    assert fifty.equals(sync.fifty_days_data('INFY'))
+    assert low.equals(sync.stocks_at_52W('low'))
+
+
+def test_sync_methods_still_work(server):
+    nse = AsyncNSEData(server.url)
+    assert nse.get_live_nse_data(nse._index_url('INDEX 0')).json()['name'] == 'INDEX 0'
+
+
+def test_expired_cookies_are_refreshed_once(server):
+    async def main():
+        async with AsyncNSEData(server.url, rate = 100, burst = 100) as nse:
+            await nse.fetch_json(nse._index_url('INDEX 0'))
+            server.expire()
+            return await asyncio.gather(*[nse.fetch_json(nse._index_url(name)) for name in server.indices])
+
+    results = run(main())
+    assert [result['name'] for result in results] == server.indices
+    assert server.counts['unauthorized'] > 1 # Many requests found the cookies expired
+    assert server.counts['home'] == 2 # but they were refreshed only once after the first visit
+
+
+@pytest.mark.parametrize('statuses', [[503, 500, 502], [429, 429], [429, 503]])
+def test_retries_with_backoff(server, statuses):
+    server.fail(statuses)
+    start = perf_counter()
+    result = fetch(server, [f'{server.url}api/allIndices'], retries = 4, backoff = 0.05)[0]
+    assert len(result['data']) == len(server.indices)
+    assert server.counts['api'] == len(statuses) + 1
+    assert perf_counter() - start >= 0.05 * 0.5 * (2 ** len(statuses) - 1) # Waits at least half of the doubling backoff
+
+
+def test_gives_up_after_retries(server):
+    server.fail([503] * 3)
+    with pytest.raises(ConnectionError):
+        fetch(server, [f'{server.url}api/allIndices'], retries = 2, backoff = 0.01)
+    assert server.counts['failed'] == 3
+
+
+def test_client_errors_are_not_retried(server):
+    with pytest.raises(ValueError):
+        fetch(server, [f'{server.url}api/equity-stockIndices?index=MISSING'], retries = 3, backoff = 0.01)
+    assert server.counts['api'] == 1
+
+
+@pytest.mark.parametrize('max_connections', [1, 3])
+def test_max_connections(server, max_connections):
+    server.latency = 0.1
+    urls = [f'{server.url}api/equity-stockIndices?index={name.replace(" ", "%20")}' for name in server.indices]
+    fetch(server, urls, max_connections = max_connections, rate = 1000, burst = 1000)
+    assert server.counts['peak'] == max_connections
@@ -0,0 +1,36 @@
+'''
+Vectorized engine of Backtest against the row by row loop on the shipped Nifty 50 data
+'''
+import pytest
+
+from helpers.backtest import Backtest, In
+
+
+@pytest.fixture(scope = 'module')
+def backtest(analyser):
+    In.store = analyser.store # Investing reads the same temporary PriceStore
+    return Backtest()
+
+
+@pytest.mark.parametrize('strategy, kwargs', [
+    ('cci', {}),
+    ('cci', {'buying_thresh': -50, 'selling_thresh': 50, 'window': 14}),
+    ('rsi', {}),
+    ('rsi', {'buying_thresh': 40, 'selling_thresh': 60}),
+    ('macd', {}),
+    ('macd', {'window_slow': 20, 'window_fast': 8, 'window_sign': 5}),
+    ('ma', {}),
+    ('ma', {'ma_type': 'ema', 'window': 20, 'diff': 0.03}),
+    ('stochastic_osc', {}),
+    ('stochastic_osc', {'buying_thresh': 25, 'selling_thresh': 75, 'smooth_k': 1}),
+])
+def test_same_trades_as_loop(backtest, strategy, kwargs):
+    history = {}
+    for vectorized in (True, False):
+        backtest.backtest(strategy, min_days = 365, top_n = 'all', stocks = 'nifty_50', vectorized = vectorized, **kwargs)
+        history[vectorized] = backtest.history
+
+    assert sum(each['buys'] for each in history[False].values()) > 0 # Some trades were made at all
+    assert list(history[True]) == list(history[False])
+    for name in history[False]:
+        assert history[True][name] == history[False][name], name
@@ -0,0 +1,65 @@
+'''
+BatchIndicators must give the same values as the per stock functions of AnalyseStocks
+'''
+import numpy as np
+import pytest
+
+from helpers.indicators import BatchIndicators
+from helpers import benchmarks
+
+
+@pytest.fixture(scope = 'module')
+def batch(analyser):
+    return BatchIndicators(analyser.get_panel(sorted(analyser.store.symbols()), refit = True))
+
+
+@pytest.fixture(scope = 'module')
+def frames(analyser, batch):
+    return {name: analyser.open_downloaded_stock(name) for name in batch.symbols}
+
+
+def assert_close(batch_values, single:dict):
+    expected = np.array([single[name] for name in batch_values.index], dtype = float)
+    np.testing.assert_allclose(batch_values.values.astype(float), expected, rtol = 1e-7, equal_nan = True)
+
+
+@pytest.mark.parametrize('window', [20, 44, 200])
+def test_MA(analyser, batch, frames, window):
+    assert_close(batch.MA(window), {name: analyser.get_MA(df, window, return_df = False) for name, df in frames.items()})
+
+
+def test_EMA(analyser, batch, frames):
+    assert_close(batch.MA(20, simple = False), {name: analyser.get_MA(df, 20, simple = False, return_df = False) for name, df in frames.items()})
+
+
+def test_RSI(analyser, batch, frames):
+    assert_close(batch.RSI(), {name: analyser.get_RSI(df) for name, df in frames.items()})
+
+
+def test_ATR(analyser, batch, frames):
+    assert_close(batch.ATR(), {name: analyser.get_ATR(df) for name, df in frames.items()})
+
+
+def test_CCI(analyser, batch, frames):
+    assert_close(batch.CCI().round(2), {name: analyser.get_CCI(df, signal_only = False) for name, df in frames.items()})
+
+
+def test_ADX(analyser, batch, frames):
+    assert_close(batch.ADX(), {name: analyser.get_ADX(df) for name, df in frames.items()})
+
+
+def test_MACD_signal(analyser, batch, frames):
+    assert batch.MACD_signal().to_dict() == {name: analyser.macd_signal(df) for name, df in frames.items()}
+
+
+def test_Stochastic(analyser, batch, frames):
+    blue, red = batch.Stochastic()
+    single = {name: analyser.Stochastic(df) for name, df in frames.items()}
+    assert_close(blue, {name: values[0] for name, values in single.items()})
+    assert_close(red, {name: values[1] for name, values in single.items()})
+
+
+def test_indicator_table(analyser):
+    result = benchmarks.indicator_time(analyser, nifty = 50)
+    assert result['Symbols'] > 0
+    assert result['Mismatch'] == []
@@ -0,0 +1,55 @@
+'''
+IntradayStore with the candles downloaded from the local FakeKite server
+'''
+import pytest
+
+from helpers.fake_kite import FakeKite
+from helpers.online_brokers import KiteZerodha
+from helpers.intraday_store import IntradayStore
+
+
+@pytest.fixture
+def kite():
+    with FakeKite(latency = 0, rate = None) as server:
+        yield KiteZerodha(user_id = 'ab1', password = 'x', two_factor_pin = '1', base_url = server.url)
+
+
+def drop_last_day(store, name:str, kind:str):
+    '''
+    Remove the candles of the last stored day as if the interval was downloaded a day ago
+    '''
+    df = store.read(name, kind)
+    store.delete(name, kind)
+    store.append(name, kind, df[df['DATE'] < df['DATE'].iloc[0].normalize()])
+
+
+def test_derives_interval_from_its_base(kite, tmp_path):
+    kite.update_intraday_data(['HAVELLS'], [5, 15, 60], str(tmp_path), rate = 100, derive = True)
+    store = IntradayStore(str(tmp_path))
+    assert not store.has('HAVELLS', 'minutes_15') and not store.has('HAVELLS', 'minutes_60')
+    assert store.base('HAVELLS', 'minutes_60') == 'minutes_5'
+    assert store.read('HAVELLS', 'minutes_60').equals(IntradayStore.resample(store.read('HAVELLS', 'minutes_5'), 60))
+
+
+def test_up_to_date_stored_interval_is_read_itself(kite, tmp_path):
+    kite.update_intraday_data(['HAVELLS'], [5, 15], str(tmp_path), rate = 100)
+    store = IntradayStore(str(tmp_path))
+    assert store.base('HAVELLS', 'minutes_15') is None
+    fifteen, five = store.read('HAVELLS', 'minutes_15'), store.read('HAVELLS', 'minutes_5')
+    assert fifteen['DATE'].iloc[-1] < five['DATE'].iloc[-1] # Kite gives a longer history for 15 minutes which is kept
+    assert fifteen['DATE'].iloc[0].date() == five['DATE'].iloc[0].date()
+
+
+def test_old_stored_interval_is_derived_after_derive_update(kite, tmp_path):
+    kite.update_intraday_data(['HAVELLS'], [5, 15], str(tmp_path), rate = 100)
+    store = IntradayStore(str(tmp_path))
+    for kind in ['minutes_5', 'minutes_15']:
+        drop_last_day(store, 'HAVELLS', kind)
+    stale = store.read('HAVELLS', 'minutes_15')
+
+    kite.update_intraday_data(['HAVELLS'], [5, 15], str(tmp_path), rate = 100, derive = True) # Only 5 minutes is downloaded
+    assert store.last_date('HAVELLS', 'minutes_15') == stale['DATE'].iloc[0]
+    assert store.base('HAVELLS', 'minutes_15') == 'minutes_5'
+    fifteen = store.read('HAVELLS', 'minutes_15')
+    assert fifteen['DATE'].iloc[0] > stale['DATE'].iloc[0]
+    assert fifteen.equals(IntradayStore.resample(store.read('HAVELLS', 'minutes_5'), 15))
@@ -0,0 +1,39 @@
+'''
+PricePanel shared with the workers of ParallelExecutor
+'''
+import os
+
+import pytest
+
+from helpers.executor import ParallelExecutor
+
+
+@pytest.fixture
+def panel(analyser):
+    names = analyser.data['nifty_50'][:6]
+    yield analyser.get_panel(names, refit = True)
+    analyser._panel = None # Others load their own
+
+
+def test_frame_same_as_store(analyser, panel):
+    for name in panel.symbols:
+        assert panel.frame(name).equals(analyser.open_downloaded_stock(name))
+
+
+def test_workers_read_from_panel(analyser, panel):
+    name = panel.symbols[0]
+    panel['CLOSE'][:, panel.columns[name]] += 1 # Only visible if the workers read the panel instead of the store
+    frames = ParallelExecutor(2, min_items = 1, panel = panel).map(analyser, 'open_downloaded_stock', panel.symbols)
+
+    assert frames[0]['CLOSE'].equals(analyser.open_downloaded_stock(name)['CLOSE'] + 1)
+    for frame, other in zip(frames[1:], panel.symbols[1:]):
+        assert frame.equals(analyser.open_downloaded_stock(other))
+    assert not panel._shared and panel.frame(name).equals(frames[0]) # Back in the private memory and still usable
+
+
+def test_changed_files_are_read_from_store(analyser, panel):
+    name = panel.symbols[0]
+    panel['CLOSE'][:, panel.columns[name]] += 1
+    os.utime(analyser.store.file(name), ns = (panel.loaded_at + 1, panel.loaded_at + 1)) # Written after the panel was loaded
+    frames = ParallelExecutor(2, min_items = 1, panel = panel).map(analyser, 'open_downloaded_stock', panel.symbols[:2])
+    assert frames[0].equals(analyser.open_downloaded_stock(name))
@@ -0,0 +1,42 @@
+'''
+Portfolio simulation on the shipped Nifty 50 data
+'''
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from helpers.portfolio import Portfolio, In
+from helpers.price_store import PriceStore
+
+
+@pytest.fixture
+def store(analyser, tmp_path):
+    '''
+    Copy of the store which the test can change. Investing of the portfolio reads it
+    '''
+    shutil.copytree(analyser.store.path, tmp_path / 'data_store')
+    old = In.store
+    In.store, In._panel = PriceStore(str(tmp_path / 'data_store')), None
+    yield In.store
+    In.store, In._panel = old, None
+
+
+def test_signal_before_a_gap_is_not_lost(store):
+    pf = Portfolio(capital = 10**9, risk = 2500, max_positions = 50) # Enough money and slots for every order
+    pf.run('cci', stocks = 'nifty_50')
+    trade = pf.trades.loc[pf.trades['exit'] == 'Signal'].iloc[0]
+    name, sold = trade['SYMBOL'], trade['sell_date']
+
+    df = store.read(name)
+    after = df.loc[df['DATE'] > sold, 'DATE'].min() # Next bar of the stock
+    store.write(name, df.loc[df['DATE'] != sold]) # Not traded on the day it was sold at the Open
+    In._panel = None
+    pf.run('cci', stocks = 'nifty_50')
+
+    trades = pf.trades.loc[(pf.trades['SYMBOL'] == name) & (pf.trades['buy_date'] == trade['buy_date'])]
+    assert len(trades) == 1
+    assert trades['exit'].iloc[0] == 'Signal' # Signal of the bar before the gap still sells
+    assert trades['sell_date'].iloc[0] == after
+    assert trades['sell_price'].iloc[0] == df.loc[df['DATE'] == after, 'OPEN'].iloc[0]